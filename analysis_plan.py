@@ -0,0 +1,143 @@
+"""
+预计算的分析计划
+采样率、FFT帧长和窗函数确定后，窗函数、频率轴、频段切片和谐波搜索表都是固定的：
+每组参数只计算一次，所有AudioProcessor（采集线程、批量分析、多通道的每个通道）共享同一份只读数据。
+换场地调整帧长/帧移（延迟与频率分辨率的取舍）见deployment.py，各组参数的开销见benchmark.py --sweep
+"""
+import math
+import threading
+
+import numpy as np
+
+# 可选窗函数
+WINDOWS = {
+    'hamming': np.hamming,
+    'hann': np.hanning,
+    'blackman': np.blackman,
+    'rectangular': np.ones,
+}
+
+# 谐波搜索窗口半宽（相对期望bin位置的比例，至少2个bin）
+HARMONIC_SEARCH_RATIO = 0.03
+
+
+class AnalysisPlan:
+    """一组(采样率, 帧长, 窗函数)的预计算数据，构建后只读"""
+
+    def __init__(self, sample_rate=12000, chunk_size=4096, window='hamming'):
+        """
+        Args:
+            sample_rate: 采样率
+            chunk_size: FFT帧长
+            window: 窗函数名称（见WINDOWS）
+        """
+        if window not in WINDOWS:
+            raise ValueError(f"未知窗函数：{window}（可选{', '.join(WINDOWS)}）")
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.window_name = window
+        self.half_size = chunk_size // 2
+        self.bin_hz = sample_rate / chunk_size
+
+        self.window = WINDOWS[window](chunk_size)
+        self.window.flags.writeable = False
+        # 频率轴（只保留前半部分，与原fft结果一致）
+        self.freqs = np.fft.rfftfreq(chunk_size, 1 / sample_rate)[:self.half_size]
+        self.freqs.flags.writeable = False
+        # 等效噪声带宽（bin），窗函数越平滑主瓣越宽
+        self.enbw_bins = float(chunk_size * np.sum(self.window ** 2) / np.sum(self.window) ** 2)
+
+        # 谐波搜索表：期望位置四舍五入到bin c后，在[lo[c], hi[c])内找峰值
+        centers = np.arange(self.half_size)
+        self.harmonic_half = np.maximum(
+            2, np.ceil(centers * HARMONIC_SEARCH_RATIO)).astype(np.int64)
+        self.harmonic_half.flags.writeable = False
+        # 逐帧路径每帧只查两三次，用列表避免NumPy标量运算的开销
+        self.harmonic_lo = np.maximum(0, centers - self.harmonic_half).tolist()
+        self.harmonic_hi = np.minimum(self.half_size,
+                                      centers + self.harmonic_half + 1).tolist()
+
+        # 频段切片缓存：{(min_freq, max_freq): (signal_slice, noise_slice)}
+        self._band_slices = {}
+
+    def band_slices(self, signal_freq_range):
+        """
+        信号/噪声频段对应的bin切片（按频段缓存）
+        频率轴单调递增，切片与布尔掩码等价但无需每帧重建
+
+        Args:
+            signal_freq_range: 信号频率范围 (min_freq, max_freq)
+
+        Returns:
+            tuple: (signal_slice, noise_slice)，噪声频段为低于min_freq的部分
+        """
+        key = (signal_freq_range[0], signal_freq_range[1])
+        slices = self._band_slices.get(key)
+        if slices is None:
+            # freqs >= min_freq 且 freqs <= max_freq
+            lo = int(np.searchsorted(self.freqs, key[0], side='left'))
+            hi = int(np.searchsorted(self.freqs, key[1], side='right'))
+            slices = (slice(lo, max(lo, hi)), slice(0, lo))
+            self._band_slices[key] = slices
+        return slices
+
+    def describe(self, hop_size=None):
+        """
+        时间/频率分辨率
+
+        Args:
+            hop_size: 帧移（采样点），默认为帧长的一半
+
+        Returns:
+            dict: 'bin_hz'为bin间隔，'resolution_hz'为按等效噪声带宽计的频率分辨率，
+                  'frame_ms'为帧长，'hop_ms'为帧移，'overlap'为重叠比例，'window'为窗函数
+        """
+        hop_size = hop_size or self.chunk_size // 2
+        return {
+            'sample_rate': self.sample_rate,
+            'chunk_size': self.chunk_size,
+            'hop_size': hop_size,
+            'window': self.window_name,
+            'bin_hz': self.bin_hz,
+            'resolution_hz': self.enbw_bins * self.bin_hz,
+            'frame_ms': 1000.0 * self.chunk_size / self.sample_rate,
+            'hop_ms': 1000.0 * hop_size / self.sample_rate,
+            'overlap': 1.0 - hop_size / self.chunk_size
+        }
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def get_plan(sample_rate=12000, chunk_size=4096, window='hamming'):
+    """
+    获取（必要时构建）一组参数的分析计划，同一进程内相同参数共享一份
+
+    Returns:
+        AnalysisPlan: 分析计划
+    """
+    key = (sample_rate, chunk_size, window)
+    plan = _plans.get(key)
+    if plan is None:
+        with _plans_lock:
+            plan = _plans.get(key)
+            if plan is None:
+                plan = AnalysisPlan(sample_rate, chunk_size, window)
+                _plans[key] = plan
+    return plan
+
+
+def hop_from_overlap(chunk_size, overlap):
+    """按重叠比例计算帧移（采样点，至少为1）"""
+    if not 0 <= overlap < 1:
+        raise ValueError(f"重叠比例须在[0, 1)内：{overlap}")
+    return max(1, int(math.floor(chunk_size * (1 - overlap) + 0.5)))
+
+
+def format_description(description):
+    """AnalysisPlan.describe()结果的单行文本"""
+    return (f"{description['sample_rate']} Hz，帧长{description['chunk_size']}"
+            f"（{description['frame_ms']:.0f} ms，分辨率{description['resolution_hz']:.2f} Hz），"
+            f"帧移{description['hop_size']}（{description['hop_ms']:.0f} ms），"
+            f"{description['window']}窗")
@@ -3,113 +3,399 @@
 包含改进的频率提取、聚类和信号质量评估算法
 """
 import numpy as np
-from scipy import signal
-from sklearn.cluster import DBSCAN
+from analysis_plan import HARMONIC_SEARCH_RATIO, get_plan
+from fingerprint import FINGERPRINT_SIZE
+from stream_cluster import StreamingFrequencyClusterer
+
+
+def select_distinct_peaks(frequencies, max_peaks, min_separation=30.0):
+    """
+    按优先顺序选取互不冲突的峰：与已选峰相距不足min_separation（同一个峰的旁瓣，
+    或定向检测中容差范围重叠的相邻杯子看到的同一个峰），或频率比接近整数倍
+    （偏差在HARMONIC_SEARCH_RATIO以内，即已选峰的谐波）的峰被舍弃
+
+    Args:
+        frequencies: 候选峰频率（Hz），按优先顺序（通常为幅度从大到小）排列
+        max_peaks: 最多选取的峰数
+        min_separation: 两个峰的最小频率间隔（Hz）
+
+    Returns:
+        list: 选中的候选峰位置
+    """
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    # 两两冲突矩阵一次算出，再贪心选取
+    high = np.maximum(frequencies[:, None], frequencies[None, :])
+    low = np.minimum(frequencies[:, None], frequencies[None, :])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = high / low
+    multiple = np.rint(ratio)
+    conflict = (((high - low) < min_separation)
+                | ((multiple >= 2) & (np.abs(ratio - multiple) <= HARMONIC_SEARCH_RATIO * multiple)))
+    selected = []
+    for i, row in enumerate(conflict.tolist()):
+        if not any(row[j] for j in selected):
+            selected.append(i)
+            if len(selected) == max_peaks:
+                break
+    return selected
+
+
+class SpectralFrame:
+    """
+    单帧频谱
+    一次实数FFT的结果，峰值、插值、谐波和SNR都从这里读取，避免重复变换
+    """
+
+    __slots__ = ('magnitude', '_power')
+
+    def __init__(self, magnitude):
+        self.magnitude = magnitude
+        self._power = None
+
+    @property
+    def power(self):
+        """功率谱（幅度平方），首次访问时计算并缓存"""
+        if self._power is None:
+            self._power = self.magnitude * self.magnitude
+        return self._power
 
 
 class AudioProcessor:
     """音频信号处理器，提供高精度频率提取和分析功能"""
 
-    def __init__(self, sample_rate=12000, chunk_size=4096):
+    # 指纹衰减率计算时的时域分段数
+    DECAY_SEGMENTS = 8
+
+    def __init__(self, sample_rate=12000, chunk_size=4096, window='hamming'):
+        """
+        Args:
+            sample_rate: 采样率
+            chunk_size: FFT帧长
+            window: 窗函数（见analysis_plan.WINDOWS），默认汉明窗减少频谱泄漏
+        """
         self.sample_rate = sample_rate
         self.chunk_size = chunk_size
-        # 创建汉明窗，减少频谱泄漏
-        self.window = np.hamming(chunk_size)
+        self.half_size = chunk_size // 2
+        # 窗函数、频率轴、频段切片和谐波搜索表按参数预计算，同参数的实例共享
+        self.plan = get_plan(sample_rate, chunk_size, window)
+        self.window = self.plan.window
+        self.freqs = self.plan.freqs
+        # 加窗结果的预分配缓冲区，避免每帧产生临时数组
+        self._windowed = np.empty(chunk_size)
+
+    def compute_spectrum(self, audio_data):
+        """
+        对一帧数据加窗并执行一次实数FFT
 
-    def extract_frequency_with_harmonics(self, audio_data):
+        Args:
+            audio_data: 音频数据数组（长度为chunk_size）
+
+        Returns:
+            SpectralFrame: 单帧频谱
+        """
+        np.multiply(audio_data, self.window, out=self._windowed)
+        fft_result = np.fft.rfft(self._windowed)
+        return SpectralFrame(np.abs(fft_result[:self.half_size]))
+
+    def analyze_frame(self, audio_data, signal_freq_range=(2500, 6000), with_fingerprint=False):
+        """
+        单次FFT完成频率提取和信噪比计算
+
+        Args:
+            audio_data: 音频数据数组
+            signal_freq_range: 信号频率范围 (min_freq, max_freq)
+            with_fingerprint: 是否同时计算频谱指纹
+
+        Returns:
+            dict: extract_frequency_with_harmonics的结果，另含'snr'字段，
+                  with_fingerprint时另含'fingerprint'
+        """
+        frame = self.compute_spectrum(audio_data)
+        result = self.extract_frequency_with_harmonics(audio_data, frame=frame)
+        result['snr'] = self.calculate_snr(audio_data, signal_freq_range, frame=frame)
+        if with_fingerprint:
+            result['fingerprint'] = self.extract_fingerprint(
+                audio_data, frame=frame, freq_info=result, signal_freq_range=signal_freq_range)
+        return result
+
+    def extract_fingerprint(self, audio_data, frame=None, freq_info=None,
+                            signal_freq_range=(2500, 6000)):
+        """
+        提取单次敲击的频谱指纹（字段见fingerprint.FINGERPRINT_FIELDS）
+
+        Args:
+            audio_data: 音频数据数组
+            frame: 已计算好的SpectralFrame
+            freq_info: 已计算好的extract_frequency_with_harmonics结果
+
+        Returns:
+            np.ndarray: 长度为FINGERPRINT_SIZE的float32向量
+        """
+        if frame is None:
+            frame = self.compute_spectrum(audio_data)
+        if freq_info is None:
+            freq_info = self.extract_frequency_with_harmonics(audio_data, frame=frame)
+        harmonic_frequencies = np.zeros((1, 2))
+        harmonic_amplitudes = np.zeros((1, 2))
+        count = min(2, len(freq_info['harmonics']))
+        harmonic_frequencies[0, :count] = freq_info['harmonic_frequencies'][:count]
+        harmonic_amplitudes[0, :count] = freq_info['harmonics'][:count]
+        signal_slice, _ = self._get_band_slices(signal_freq_range)
+        return self._fingerprint_block(
+            np.asarray(audio_data)[None, :], frame.magnitude[None, :],
+            np.array([freq_info['frequency']]), np.array([freq_info['amplitude']]),
+            harmonic_frequencies, harmonic_amplitudes, signal_slice)[0]
+
+    def _fingerprint_block(self, frames, fft_magnitude, frequency, amplitude,
+                           harmonic_frequencies, harmonic_amplitudes, signal_slice):
+        """
+        批量计算指纹（单帧和批量路径共用，保证结果一致）
+
+        Args:
+            frames: 形状为(N, chunk_size)的时域数据（未加窗）
+            fft_magnitude: 形状为(N, bins)的幅度谱
+            frequency: 基频（Hz），形状为(N,)
+            amplitude: 基频幅度，形状为(N,)
+            harmonic_frequencies: 谐波频率，形状为(N, >=0)
+            harmonic_amplitudes: 谐波幅度，形状同上
+            signal_slice: 信号频段切片
+
+        Returns:
+            np.ndarray: 形状为(N, FINGERPRINT_SIZE)的float32数组
+        """
+        n = len(frequency)
+        fingerprints = np.zeros((n, FINGERPRINT_SIZE), dtype=np.float32)
+        fingerprints[:, 0] = frequency
+
+        # 谐波频率比与相对幅度（只取2、3次谐波）
+        count = min(2, harmonic_frequencies.shape[1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = harmonic_frequencies[:, :count] / frequency[:, None]
+            levels = harmonic_amplitudes[:, :count] / amplitude[:, None]
+        fingerprints[:, 1:1 + count] = np.nan_to_num(ratios, nan=0.0, posinf=0.0, neginf=0.0)
+        fingerprints[:, 3:3 + count] = np.nan_to_num(levels, nan=0.0, posinf=0.0, neginf=0.0)
+
+        # 衰减率：分段RMS取对数，从能量最大的段开始做线性拟合
+        segment = self.chunk_size // self.DECAY_SEGMENTS
+        blocks = np.asarray(frames, dtype=np.float64)[:, :segment * self.DECAY_SEGMENTS]
+        blocks = blocks.reshape(n, self.DECAY_SEGMENTS, segment)
+        log_rms = np.log(np.sqrt(np.mean(blocks * blocks, axis=2)) + 1e-9)
+        t = (np.arange(self.DECAY_SEGMENTS) + 0.5) * segment / self.sample_rate
+        weights = np.arange(self.DECAY_SEGMENTS)[None, :] >= np.argmax(log_rms, axis=1)[:, None]
+        counts = weights.sum(axis=1)
+        t_mean = (weights * t).sum(axis=1) / counts
+        l_mean = (weights * log_rms).sum(axis=1) / counts
+        t_dev = np.where(weights, t[None, :] - t_mean[:, None], 0.0)
+        denominator = (t_dev * t_dev).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (t_dev * (log_rms - l_mean[:, None])).sum(axis=1) / denominator
+        fingerprints[:, 5] = np.where(counts >= 2, -slope, 0.0)
+
+        # 信号频段内的频谱质心
+        band = fft_magnitude[:, signal_slice]
+        total = band.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            centroid = (band * self.freqs[signal_slice]).sum(axis=1) / total
+        fingerprints[:, 6] = np.where(total > 0, centroid, 0.0)
+        return fingerprints
+
+    def extract_frequency_with_harmonics(self, audio_data, frame=None, peak_index=None):
         """
         改进的频率提取算法
         使用加窗FFT和抛物线插值提高精度
 
         Args:
             audio_data: 音频数据数组
+            frame: 已计算好的SpectralFrame，传入时不再重复FFT
+            peak_index: 指定峰值所在bin（如按噪声谱白化后选出的峰），None时取幅度最大的bin
 
         Returns:
             dict: 包含主频率、幅度、谐波信息
         """
-        # 应用汉明窗
-        windowed_data = audio_data * self.window
-
-        # 执行FFT
-        fft_result = np.fft.fft(windowed_data)
-        fft_magnitude = np.abs(fft_result[:self.chunk_size // 2])
+        if frame is None:
+            frame = self.compute_spectrum(audio_data)
+        fft_magnitude = frame.magnitude
 
         # 找到峰值索引
-        peak_idx = np.argmax(fft_magnitude)
+        peak_idx = int(np.argmax(fft_magnitude)) if peak_index is None else int(peak_index)
 
         # 抛物线插值提高频率分辨率
-        if 0 < peak_idx < len(fft_magnitude) - 1:
-            # 使用三点抛物线插值
-            alpha = fft_magnitude[peak_idx - 1]
-            beta = fft_magnitude[peak_idx]
-            gamma = fft_magnitude[peak_idx + 1]
-
-            # 计算插值偏移
-            p = 0.5 * (alpha - gamma) / (alpha - 2 * beta + gamma)
-            interpolated_idx = peak_idx + p
-        else:
-            interpolated_idx = peak_idx
+        interpolated_idx = self._interpolate_peak(fft_magnitude, peak_idx)
 
         # 计算精确频率
         fundamental_freq = interpolated_idx * self.sample_rate / self.chunk_size
         amplitude = fft_magnitude[peak_idx]
 
-        # 提取谐波信息（2倍频、3倍频）
-        harmonics = self._extract_harmonics(fft_magnitude, peak_idx, 3)
+        # 提取谐波信息（2倍频、3倍频附近的实际峰值）
+        harmonic_peaks = self._find_harmonic_peaks(fft_magnitude, interpolated_idx, 3)
 
         return {
             'frequency': fundamental_freq,
             'amplitude': amplitude,
-            'harmonics': harmonics,
+            'harmonics': [peak_amplitude for _, peak_amplitude in harmonic_peaks],
+            'harmonic_frequencies': [idx * self.sample_rate / self.chunk_size
+                                     for idx, _ in harmonic_peaks],
             'fft_magnitude': fft_magnitude
         }
 
+    def find_peaks(self, fft_magnitude, signal_freq_range=(2500, 6000), max_peaks=4,
+                   min_level_db=-20.0, min_separation=30.0, allowed=None):
+        """
+        多个杯子同时敲击时，信号频段内幅度最大的若干个互不成谐波关系的峰
+        一次向量化比较找出全部局部极大值并插值，按幅度排序后用select_distinct_peaks
+        舍弃旁瓣和已选峰的谐波
+
+        Args:
+            fft_magnitude: 幅度谱（SpectralFrame.magnitude）
+            signal_freq_range: 信号频率范围 (min_freq, max_freq)
+            max_peaks: 最多返回的峰数
+            min_level_db: 峰值幅度相对最强峰的下限（dB）
+            min_separation: 两个峰的最小频率间隔（Hz）
+            allowed: 可选的布尔数组（与幅度谱等长），只在为True的bin中选峰
+                     （如逐bin信噪比超过门限的bin）
+
+        Returns:
+            tuple: (峰值bin, 插值后的峰值索引)，均为按幅度从大到小排列的数组，没有峰时为空
+        """
+        signal_slice, _ = self._get_band_slices(signal_freq_range)
+        lo = max(signal_slice.start, 1)
+        hi = min(signal_slice.stop, len(fft_magnitude) - 1)
+        if hi <= lo:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        band = fft_magnitude[lo:hi]
+        is_peak = (band > fft_magnitude[lo - 1:hi - 1]) & (band >= fft_magnitude[lo + 1:hi + 1])
+        if allowed is not None:
+            is_peak &= allowed[lo:hi]
+        candidates = np.flatnonzero(is_peak) + lo
+        if not len(candidates):
+            return candidates, np.zeros(0)
+        amplitudes = fft_magnitude[candidates]
+        keep = amplitudes >= amplitudes.max() * 10 ** (min_level_db / 20)
+        candidates = candidates[keep]
+        # 按幅度从大到小，只检查前若干个（旁瓣和谐波最多占去几个名额）
+        order = np.argsort(amplitudes[keep])[::-1][:4 * max_peaks]
+        candidates = candidates[order]
+        # 抛物线插值（局部极大值的分母恒为负，且都不在频谱边缘）
+        alpha = fft_magnitude[candidates - 1]
+        beta = fft_magnitude[candidates]
+        gamma = fft_magnitude[candidates + 1]
+        positions = candidates + 0.5 * (alpha - gamma) / (alpha - 2 * beta + gamma)
+
+        bin_hz = self.sample_rate / self.chunk_size
+        selected = select_distinct_peaks(positions * bin_hz, max_peaks, min_separation)
+        return candidates[selected], positions[selected]
+
+    def _interpolate_peak(self, fft_magnitude, peak_idx):
+        """
+        三点抛物线插值，返回亚bin精度的峰值索引
+
+        Args:
+            fft_magnitude: FFT幅度谱
+            peak_idx: 峰值所在bin
+
+        Returns:
+            float: 插值后的峰值索引
+        """
+        if 0 < peak_idx < len(fft_magnitude) - 1:
+            alpha = fft_magnitude[peak_idx - 1]
+            beta = fft_magnitude[peak_idx]
+            gamma = fft_magnitude[peak_idx + 1]
+
+            # 计算插值偏移
+            p = 0.5 * (alpha - gamma) / (alpha - 2 * beta + gamma)
+            return peak_idx + p
+        return peak_idx
+
     def _extract_harmonics(self, fft_magnitude, fundamental_idx, num_harmonics=3):
         """
         提取谐波信息
 
         Args:
             fft_magnitude: FFT幅度谱
-            fundamental_idx: 基频索引
+            fundamental_idx: 基频索引（可为插值后的小数索引）
             num_harmonics: 要提取的谐波数量
 
         Returns:
             list: 谐波幅度列表
         """
-        harmonics = []
+        return [peak_amplitude for _, peak_amplitude
+                in self._find_harmonic_peaks(fft_magnitude, fundamental_idx, num_harmonics)]
+
+    def _harmonic_window(self, expected_idx):
+        """
+        谐波搜索窗口：以期望bin为中心，半宽查分析计划的谐波搜索表
+        （中心bin的HARMONIC_SEARCH_RATIO倍，至少2个bin）
+        """
+        center = np.rint(expected_idx).astype(np.int64)
+        table = self.plan.harmonic_half
+        half = table[np.minimum(center, len(table) - 1)]
+        return center, half
+
+    def _find_harmonic_peaks(self, fft_magnitude, fundamental_idx, num_harmonics=3):
+        """
+        在各整数倍频附近搜索实际谐波峰值
+        敲击类声音的泛音并不严格位于整数倍，直接取int(f0 * i)处的bin会错过峰值
+
+        Args:
+            fft_magnitude: FFT幅度谱
+            fundamental_idx: 基频索引（插值后）
+            num_harmonics: 要提取的谐波数量
+
+        Returns:
+            list: [(插值后的谐波索引, 谐波幅度), ...]，超出频谱范围时为(0.0, 0)
+        """
+        peaks = []
+        size = len(fft_magnitude)
+        lo_table = self.plan.harmonic_lo
+        hi_table = self.plan.harmonic_hi
+        fundamental_idx = float(fundamental_idx)
         for i in range(2, num_harmonics + 1):
-            harmonic_idx = int(fundamental_idx * i)
-            if harmonic_idx < len(fft_magnitude):
-                harmonics.append(fft_magnitude[harmonic_idx])
-            else:
-                harmonics.append(0)
-        return harmonics
+            # round()与np.rint相同，均为四舍六入五成双
+            center = round(fundamental_idx * i)
+            if center >= size:
+                peaks.append((0.0, 0))
+                continue
+            lo = lo_table[center]
+            hi = hi_table[center]
+            peak_idx = lo + int(np.argmax(fft_magnitude[lo:hi]))
+            peaks.append((self._interpolate_peak(fft_magnitude, peak_idx),
+                          fft_magnitude[peak_idx]))
+        return peaks
+
+    def _get_band_slices(self, signal_freq_range):
+        """
+        获取信号/噪声频段对应的bin切片（缓存在分析计划中）
+
+        Args:
+            signal_freq_range: 信号频率范围 (min_freq, max_freq)
 
-    def calculate_snr(self, audio_data, signal_freq_range=(2500, 6000)):
+        Returns:
+            tuple: (signal_slice, noise_slice)
+        """
+        return self.plan.band_slices(signal_freq_range)
+
+    def calculate_snr(self, audio_data, signal_freq_range=(2500, 6000), frame=None):
         """
         计算信噪比（SNR）评估信号质量
 
         Args:
             audio_data: 音频数据数组
             signal_freq_range: 信号频率范围 (min_freq, max_freq)
+            frame: 已计算好的SpectralFrame，传入时不再重复FFT
 
         Returns:
             float: 信噪比（dB）
         """
-        # 执行FFT
-        fft_result = np.fft.fft(audio_data * self.window)
-        fft_magnitude = np.abs(fft_result[:self.chunk_size // 2])
-
-        # 计算频率轴
-        freqs = np.fft.fftfreq(self.chunk_size, 1 / self.sample_rate)[:self.chunk_size // 2]
+        if frame is None:
+            frame = self.compute_spectrum(audio_data)
+        power = frame.power
+        signal_slice, noise_slice = self._get_band_slices(signal_freq_range)
 
         # 信号频段
-        signal_mask = (freqs >= signal_freq_range[0]) & (freqs <= signal_freq_range[1])
-        signal_power = np.sum(fft_magnitude[signal_mask] ** 2)
+        signal_power = np.sum(power[signal_slice])
 
         # 噪声频段（低频噪声）
-        noise_mask = freqs < signal_freq_range[0]
-        noise_power = np.sum(fft_magnitude[noise_mask] ** 2)
+        noise_power = np.sum(power[noise_slice])
 
         # 避免除零
         if noise_power == 0:
@@ -119,10 +405,179 @@ class AudioProcessor:
         snr = 10 * np.log10(signal_power / noise_power)
         return snr
 
+    def frame_signal(self, audio_signal, hop_size=None):
+        """
+        将长信号切分为重叠帧（零拷贝的跨步视图）
+
+        Args:
+            audio_signal: 一维音频信号
+            hop_size: 帧移（采样点），默认为chunk_size（不重叠）
+
+        Returns:
+            np.ndarray: 形状为(N, chunk_size)的只读视图
+        """
+        hop_size = hop_size or self.chunk_size
+        audio_signal = np.asarray(audio_signal)
+        if len(audio_signal) < self.chunk_size:
+            return np.empty((0, self.chunk_size), dtype=audio_signal.dtype)
+        frames = np.lib.stride_tricks.sliding_window_view(audio_signal, self.chunk_size)
+        return frames[::hop_size]
+
+    def analyze_frames(self, frames, signal_freq_range=(2500, 6000), num_harmonics=3,
+                       block_size=256, with_fingerprint=False):
+        """
+        批量分析多帧数据，结果与逐帧调用analyze_frame一致
+
+        Args:
+            frames: 形状为(N, chunk_size)的数组或frame_signal返回的视图
+            signal_freq_range: 信号频率范围 (min_freq, max_freq)
+            num_harmonics: 要提取的谐波数量
+            block_size: 每批FFT的帧数，限制临时内存占用
+            with_fingerprint: 是否同时计算频谱指纹
+
+        Returns:
+            dict: 'frequency'、'amplitude'、'snr'为(N,)数组，
+                  'harmonics'、'harmonic_frequencies'为(N, num_harmonics - 1)数组，
+                  with_fingerprint时另含(N, FINGERPRINT_SIZE)的'fingerprint'
+        """
+        frames = np.asarray(frames)
+        if frames.ndim != 2 or frames.shape[1] != self.chunk_size:
+            raise ValueError(f"frames形状应为(N, {self.chunk_size})，实际为{frames.shape}")
+
+        num_frames = frames.shape[0]
+        num_orders = max(num_harmonics - 1, 0)
+        frequency = np.empty(num_frames)
+        amplitude = np.empty(num_frames)
+        snr = np.empty(num_frames)
+        harmonics = np.zeros((num_frames, num_orders))
+        harmonic_frequencies = np.zeros((num_frames, num_orders))
+        fingerprints = (np.zeros((num_frames, FINGERPRINT_SIZE), dtype=np.float32)
+                        if with_fingerprint else None)
+        signal_slice, noise_slice = self._get_band_slices(signal_freq_range)
+        harmonic_orders = np.arange(2, num_harmonics + 1)
+        bin_hz = self.sample_rate / self.chunk_size
+
+        for start in range(0, num_frames, block_size):
+            stop = min(start + block_size, num_frames)
+            fft_result = np.fft.rfft(frames[start:stop] * self.window, axis=1)
+            fft_magnitude = np.abs(fft_result[:, :self.half_size])
+            rows = np.arange(stop - start)
+
+            # 峰值及抛物线插值
+            peak_idx = np.argmax(fft_magnitude, axis=1)
+            interpolated = self._interpolate_peaks(fft_magnitude, peak_idx)
+            frequency[start:stop] = interpolated * bin_hz
+            amplitude[start:stop] = fft_magnitude[rows, peak_idx]
+
+            # 谐波：与_find_harmonic_peaks相同，在整数倍频附近搜索实际峰值
+            if num_orders:
+                h_idx, h_amp = self._find_harmonic_peaks_batch(
+                    fft_magnitude, interpolated, harmonic_orders)
+                harmonics[start:stop] = h_amp
+                harmonic_frequencies[start:stop] = h_idx * bin_hz
+
+            if with_fingerprint:
+                fingerprints[start:stop] = self._fingerprint_block(
+                    frames[start:stop], fft_magnitude, frequency[start:stop],
+                    amplitude[start:stop], harmonic_frequencies[start:stop],
+                    harmonics[start:stop], signal_slice)
+
+            # 信噪比
+            power = fft_magnitude * fft_magnitude
+            signal_power = np.sum(power[:, signal_slice], axis=1)
+            noise_power = np.sum(power[:, noise_slice], axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                block_snr = 10 * np.log10(signal_power / noise_power)
+            snr[start:stop] = np.where(noise_power == 0, np.inf, block_snr)
+
+        result = {
+            'frequency': frequency,
+            'amplitude': amplitude,
+            'harmonics': harmonics,
+            'harmonic_frequencies': harmonic_frequencies,
+            'snr': snr
+        }
+        if with_fingerprint:
+            result['fingerprint'] = fingerprints
+        return result
+
+    def _find_harmonic_peaks_batch(self, fft_magnitude, fundamental_idx, harmonic_orders):
+        """
+        _find_harmonic_peaks的批量版本
+
+        Args:
+            fft_magnitude: 形状为(N, bins)的幅度谱
+            fundamental_idx: 各帧插值后的基频索引，形状为(N,)
+            harmonic_orders: 谐波阶数数组，如[2, 3]
+
+        Returns:
+            tuple: (插值后的谐波索引, 谐波幅度)，形状均为(N, 阶数)
+        """
+        size = fft_magnitude.shape[1]
+        rows = np.arange(fft_magnitude.shape[0])[:, None]
+        center, half = self._harmonic_window(fundamental_idx[:, None] * harmonic_orders[None, :])
+        max_half = int(half.max())
+        idx = center[..., None] + (np.arange(2 * max_half + 1) - max_half)
+        in_window = ((np.abs(idx - center[..., None]) <= half[..., None])
+                     & (idx >= 0) & (idx < size))
+        values = fft_magnitude[rows[..., None], np.clip(idx, 0, size - 1)]
+        values = np.where(in_window, values, -np.inf)
+        best = np.argmax(values, axis=2)
+        present = center < size
+        peak_idx = np.where(present, np.take_along_axis(idx, best[..., None], axis=2)[..., 0], 0)
+
+        amplitude = np.where(present, fft_magnitude[rows, peak_idx], 0)
+        order_rows = np.broadcast_to(rows, peak_idx.shape)
+        interpolated = self._interpolate_peaks(fft_magnitude, peak_idx.ravel(), order_rows.ravel())
+        interpolated = np.where(present, interpolated.reshape(peak_idx.shape), 0.0)
+        return interpolated, amplitude
+
+    def analyze_signal(self, audio_signal, hop_size=None, signal_freq_range=(2500, 6000)):
+        """
+        对长信号按帧移切帧后批量分析（离线重新评分使用）
+
+        Args:
+            audio_signal: 一维音频信号
+            hop_size: 帧移（采样点），默认为chunk_size
+            signal_freq_range: 信号频率范围 (min_freq, max_freq)
+
+        Returns:
+            dict: 同analyze_frames，另含各帧起始采样点'offsets'
+        """
+        hop_size = hop_size or self.chunk_size
+        frames = self.frame_signal(audio_signal, hop_size)
+        result = self.analyze_frames(frames, signal_freq_range)
+        result['offsets'] = np.arange(frames.shape[0]) * hop_size
+        return result
+
+    def _interpolate_peaks(self, fft_magnitude, peak_idx, rows=None):
+        """
+        向量化的三点抛物线插值（_interpolate_peak的批量版本）
+
+        Args:
+            fft_magnitude: 形状为(N, bins)的幅度谱
+            peak_idx: 峰值bin，形状为(M,)
+            rows: 各峰值所在的行，默认为0..M-1（每帧一个峰）
+
+        Returns:
+            np.ndarray: 插值后的峰值索引
+        """
+        if rows is None:
+            rows = np.arange(len(peak_idx))
+        inner = (peak_idx > 0) & (peak_idx < fft_magnitude.shape[1] - 1)
+        left = np.where(inner, peak_idx - 1, peak_idx)
+        right = np.where(inner, peak_idx + 1, peak_idx)
+        alpha = fft_magnitude[rows, left]
+        beta = fft_magnitude[rows, peak_idx]
+        gamma = fft_magnitude[rows, right]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = 0.5 * (alpha - gamma) / (alpha - 2 * beta + gamma)
+        return np.where(inner, peak_idx + p, peak_idx)
+
     def cluster_frequencies_dbscan(self, frequencies, eps=30, min_samples=3):
         """
         使用DBSCAN算法对频率进行聚类
-        自动识别频率簇并过滤离群点
+        自动识别频率簇并过滤离群点（基于StreamingFrequencyClusterer）
 
         Args:
             frequencies: 频率列表
@@ -135,34 +590,9 @@ class AudioProcessor:
         if len(frequencies) < min_samples:
             return None
 
-        # 转换为二维数组（DBSCAN要求）
-        freq_array = np.array(frequencies).reshape(-1, 1)
-
-        # 执行DBSCAN聚类
-        clustering = DBSCAN(eps=eps, min_samples=min_samples).fit(freq_array)
-        labels = clustering.labels_
-
-        # 找到最大的簇（排除噪声点，标签为-1）
-        unique_labels = set(labels)
-        if -1 in unique_labels:
-            unique_labels.remove(-1)
-
-        if not unique_labels:
-            return None
-
-        # 找到最大簇
-        largest_cluster_label = max(unique_labels,
-                                   key=lambda label: np.sum(labels == label))
-        cluster_mask = labels == largest_cluster_label
-        cluster_freqs = freq_array[cluster_mask].flatten()
-
-        return {
-            'mean_frequency': np.mean(cluster_freqs),
-            'std_deviation': np.std(cluster_freqs),
-            'cluster_size': len(cluster_freqs),
-            'total_samples': len(frequencies),
-            'cluster_ratio': len(cluster_freqs) / len(frequencies)
-        }
+        # 一维数据使用流式密度聚类，语义与DBSCAN相同，无需构建sklearn估计器
+        clusterer = StreamingFrequencyClusterer(eps=eps, min_samples=min_samples)
+        return clusterer.extend(frequencies)
 
     def analyze_frequency_stability(self, frequencies):
         """
@@ -0,0 +1,341 @@
+"""
+音频源抽象层
+AudioWorker从音频源按帧移读取采样，支持实时麦克风、WAV文件回放和合成信号，
+便于在没有音频硬件的机器上运行、测试和性能分析整条处理链路
+"""
+import struct
+import time
+
+import numpy as np
+
+from frame_queue import FrameQueue, DROP_OLDEST
+
+try:
+    import pyaudio
+except ImportError:  # 无音频硬件/未安装PyAudio时仍可使用文件和合成音频源
+    pyaudio = None
+
+
+class AudioSource:
+    """
+    音频源基类
+
+    read(num_samples)返回int16数组（单声道为一维，多声道为(n, channels)）；
+    实时源暂无数据时返回空数组，数据结束时返回None。
+    """
+
+    sample_rate = 12000
+    channels = 1
+
+    def start(self):
+        """开始产生数据（默认无操作）"""
+
+    def read(self, num_samples):
+        raise NotImplementedError
+
+    def stop(self):
+        """请求停止（可从其他线程调用，默认无操作）"""
+
+    def close(self):
+        """释放资源（默认无操作）"""
+
+    def stats(self):
+        """
+        音频源统计信息
+
+        Returns:
+            dict: 各实现自定义的计数
+        """
+        return {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _Pacer:
+    """按采样率控制回放速度"""
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self._start = None
+        self._delivered = 0
+
+    def wait(self, num_samples):
+        if self._start is None:
+            self._start = time.perf_counter()
+        self._delivered += num_samples
+        delay = self._start + self._delivered / self.sample_rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class PyAudioSource(AudioSource):
+    """实时麦克风输入（阻塞读取或回调+有界队列）"""
+
+    def __init__(self, sample_rate=12000, frames_per_buffer=2048, capture_mode='blocking',
+                 queue_size=32, queue_policy=DROP_OLDEST, input_device_index=None, channels=1):
+        """
+        Args:
+            sample_rate: 采样率
+            frames_per_buffer: 每次读取/回调的采样数
+            capture_mode: 'blocking'为阻塞读取，'callback'为回调采集写入帧队列
+            queue_size: 回调模式下帧队列的容量
+            queue_policy: 回调模式下队列满时的背压策略（见frame_queue），
+                          回调线程不等待，BLOCK策略下队列满时新帧直接丢弃
+            input_device_index: 输入设备编号，None为默认设备
+            channels: 声道数，大于1时read返回(n, channels)的交织数据视图
+        """
+        if pyaudio is None:
+            raise RuntimeError("未安装PyAudio，无法打开实时音频输入")
+        if capture_mode not in ('blocking', 'callback'):
+            raise ValueError(f"未知的采集模式：{capture_mode}")
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self.capture_mode = capture_mode
+        self.channels = channels
+        self.overflowed = 0  # PortAudio报告的输入溢出次数
+        self.frame_queue = None
+        self._active = False
+        self.p = pyaudio.PyAudio()
+        if capture_mode == 'callback':
+            # 回调线程只负责入队，分析在消费者线程中进行
+            self.frame_queue = FrameQueue(queue_size, queue_policy)
+            self.stream = self.p.open(format=pyaudio.paInt16,
+                                      channels=channels,
+                                      rate=sample_rate,
+                                      input=True,
+                                      input_device_index=input_device_index,
+                                      frames_per_buffer=frames_per_buffer,
+                                      stream_callback=self._on_audio,
+                                      start=False)
+        else:
+            self.stream = self.p.open(format=pyaudio.paInt16,
+                                      channels=channels,
+                                      rate=sample_rate,
+                                      input=True,
+                                      input_device_index=input_device_index,
+                                      frames_per_buffer=frames_per_buffer)
+
+    def _on_audio(self, in_data, frame_count, time_info, status_flags):
+        """PyAudio回调：记录溢出并将原始数据放入帧队列"""
+        if status_flags & pyaudio.paInputOverflow:
+            self.overflowed += 1
+        # 回调线程不能阻塞：BLOCK策略下队列满时立即放弃新帧（计入丢弃数），不等待消费者
+        self.frame_queue.put(in_data, timeout=0)
+        return (None, pyaudio.paContinue if self._active else pyaudio.paComplete)
+
+    def start(self):
+        self._active = True
+        if self.capture_mode == 'callback':
+            self.stream.start_stream()
+
+    def read(self, num_samples):
+        if self.capture_mode == 'callback':
+            raw = self.frame_queue.get(timeout=0.5)
+            if raw is None:
+                return None if self.frame_queue.closed else np.empty(0, dtype=np.int16)
+        else:
+            raw = self.stream.read(num_samples, exception_on_overflow=False)
+        samples = np.frombuffer(raw, dtype=np.int16)
+        if self.channels > 1:
+            return deinterleave(samples, self.channels)
+        return samples
+
+    def stop(self):
+        """请求停止（可从其他线程调用），回调模式下唤醒等待中的read"""
+        self._active = False
+        if self.frame_queue is not None:
+            self.frame_queue.close()
+
+    def close(self):
+        self.stop()
+        self.stream.stop_stream()
+        self.stream.close()
+        self.p.terminate()
+
+    def stats(self):
+        stats = {'overflowed': self.overflowed}
+        if self.frame_queue is not None:
+            stats.update(self.frame_queue.stats())
+        return stats
+
+
+def deinterleave(samples, channels):
+    """
+    将交织的多声道采样转为(n, channels)视图，不复制数据
+    samples[:, c]即为第c个声道
+
+    Args:
+        samples: 一维交织采样
+        channels: 声道数
+
+    Returns:
+        np.ndarray: 形状为(n, channels)的视图
+    """
+    return samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+
+
+def _find_wav_data(path):
+    """
+    解析RIFF/WAVE头，返回(声道数, 采样率, 位宽, 数据偏移, 数据字节数)
+    只读取头部，不加载音频数据
+    """
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"不是有效的WAV文件：{path}")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"WAV文件缺少data块：{path}")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack(
+                    '<HHIIHH', f.read(16))
+                f.seek(chunk_size - 16 + (chunk_size & 1), 1)
+                if audio_format not in (1, 0xFFFE):
+                    raise ValueError(f"仅支持PCM格式的WAV文件：{path}")
+                fmt = (channels, sample_rate, bits)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"WAV文件的data块位于fmt块之前：{path}")
+                return fmt + (f.tell(), chunk_size)
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+
+class WavFileSource(AudioSource):
+    """
+    WAV文件回放（内存映射）
+    数据通过np.memmap按需分页读入，多GB的录音也不会整体加载到内存
+    """
+
+    def __init__(self, path, channel=0, realtime=False, loop=False, start_sample=0):
+        """
+        Args:
+            path: 16位PCM WAV文件路径
+            channel: 多声道文件中要回放的声道，None时回放全部声道（read返回(n, channels)）
+            realtime: True按采样率实时回放，False尽可能快地回放
+            loop: 到达文件末尾后是否从头循环
+            start_sample: 起始采样点
+        """
+        channels, sample_rate, bits, offset, size = _find_wav_data(path)
+        if bits != 16:
+            raise ValueError(f"仅支持16位PCM，实际为{bits}位：{path}")
+        if channel is not None and not 0 <= channel < channels:
+            raise ValueError(f"声道{channel}超出范围（共{channels}个声道）")
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels if channel is None else 1
+        self.realtime = realtime
+        self.loop = loop
+        num_frames = size // (2 * channels)
+        if num_frames:
+            data = np.memmap(path, dtype='<i2', mode='r', offset=offset,
+                             shape=(num_frames, channels))
+            self._samples = data if channel is None else data[:, channel]
+        else:
+            self._samples = np.empty((0, channels) if channel is None else 0, dtype=np.int16)
+        self._position = min(start_sample, len(self._samples))
+        self._pacer = _Pacer(sample_rate) if realtime else None
+        self.samples_read = 0
+
+    def __len__(self):
+        return len(self._samples)
+
+    @property
+    def position(self):
+        """当前回放位置（采样点）"""
+        return self._position
+
+    def read(self, num_samples):
+        if self._position >= len(self._samples):
+            if not self.loop or not len(self._samples):
+                return None
+            self._position = 0
+        end = min(self._position + num_samples, len(self._samples))
+        chunk = self._samples[self._position:end]
+        self._position = end
+        self.samples_read += len(chunk)
+        if self._pacer is not None:
+            self._pacer.wait(len(chunk))
+        return chunk
+
+    def close(self):
+        self._samples = np.empty(0, dtype=np.int16)
+
+    def stats(self):
+        return {'position': self._position, 'samples_read': self.samples_read}
+
+
+class ToneSource(AudioSource):
+    """
+    合成敲击信号发生器
+    周期性产生带谐波的指数衰减正弦波，叠加高斯白噪声
+    """
+
+    def __init__(self, frequencies=(3000.0,), sample_rate=12000, amplitude=8000.0,
+                 noise_level=100.0, knock_interval=0.5, decay=20.0,
+                 harmonics=(0.3, 0.1), duration=None, realtime=False, seed=0):
+        """
+        Args:
+            frequencies: 依次循环敲击的基频列表（Hz）
+            sample_rate: 采样率
+            amplitude: 敲击峰值幅度
+            noise_level: 噪声标准差
+            knock_interval: 相邻两次敲击的间隔（秒）
+            decay: 衰减系数（1/秒）
+            harmonics: 2倍频、3倍频……相对基频的幅度
+            duration: 总时长（秒），None为无限
+            realtime: True按采样率实时产生，False尽可能快地产生
+            seed: 随机种子，保证可重复
+        """
+        self.frequencies = list(frequencies)
+        self.sample_rate = sample_rate
+        self.amplitude = amplitude
+        self.noise_level = noise_level
+        self.knock_interval = knock_interval
+        self.decay = decay
+        self.harmonics = tuple(harmonics)
+        self.total_samples = None if duration is None else int(duration * sample_rate)
+        self._rng = np.random.default_rng(seed)
+        self._pacer = _Pacer(sample_rate) if realtime else None
+        self._position = 0
+
+    def knock_at(self, sample_index):
+        """
+        给定采样点所处的敲击序号和基频
+
+        Returns:
+            tuple: (敲击序号, 基频)
+        """
+        knock = int(sample_index // int(self.knock_interval * self.sample_rate))
+        return knock, self.frequencies[knock % len(self.frequencies)]
+
+    def read(self, num_samples):
+        if self.total_samples is not None:
+            num_samples = min(num_samples, self.total_samples - self._position)
+            if num_samples <= 0:
+                return None
+        indices = np.arange(self._position, self._position + num_samples)
+        interval = int(self.knock_interval * self.sample_rate)
+        knock = indices // interval
+        t = (indices - knock * interval) / self.sample_rate
+        freqs = np.asarray(self.frequencies)[knock % len(self.frequencies)]
+        envelope = self.amplitude * np.exp(-self.decay * t)
+        phase = 2 * np.pi * freqs * t
+        signal = np.sin(phase)
+        nyquist = self.sample_rate / 2
+        for order, weight in enumerate(self.harmonics, start=2):
+            # 高于奈奎斯特频率的谐波会被采集前的抗混叠滤波滤除
+            signal += weight * (order * freqs < nyquist) * np.sin(order * phase)
+        signal = envelope * signal + self._rng.normal(0, self.noise_level, num_samples)
+        self._position += num_samples
+        if self._pacer is not None:
+            self._pacer.wait(num_samples)
+        return np.clip(signal, -32768, 32767).astype(np.int16)
@@ -1,101 +1,156 @@
-import numpy as np
-import pyaudio
+import logging
+import time
+
 from PyQt5.QtCore import QObject, pyqtSignal
-from audio_processor import AudioProcessor
+from audio_source import PyAudioSource
+from detection_pipeline import DetectionPipeline, decided_results
+from frame_queue import DROP_OLDEST
+from metrics import PipelineMetrics, RateLimitedLogger
+from result_batch import ResultBatcher
+
+logger = logging.getLogger(__name__)
 
 class AudioWorker(QObject):
-    frequencyDetected = pyqtSignal(float)
-    # 新增信号：发送频率和信号质量信息
-    frequencyWithQuality = pyqtSignal(dict)
+    # 一批检测结果（result_batch.RESULT_DTYPE记录数组），每秒最多batch_rate批
+    detectionsReady = pyqtSignal(object)
 
-    def __init__(self):
+    def __init__(self, hop_size=None, capture_mode='blocking',
+                 queue_size=32, queue_policy=DROP_OLDEST, source=None, onset_gate=True,
+                 metrics=None, batch_rate=30.0, pipeline_options=None, record_path=None):
+        """
+        Args:
+            hop_size: 帧移（采样点），优先于pipeline_options，默认为CHUNK的一半
+            capture_mode: 'blocking'为阻塞读取，'callback'为回调采集+独立分析循环
+            queue_size: 回调模式下帧队列的容量
+            queue_policy: 回调模式下队列满时的背压策略（见frame_queue）
+            source: 音频源（见audio_source），None时打开默认麦克风
+            onset_gate: 是否启用起振检测，只在敲击后的窗口内做频谱分析
+            metrics: 性能指标（metrics.PipelineMetrics），None时新建
+            batch_rate: 每秒最多向界面线程发送的结果批数
+            pipeline_options: 其他DetectionPipeline参数（如deployment.load_deployment()的结果，
+                              含采样率、帧长、帧移和窗函数），优先于onset_gate；
+                              指定source时采样率以音频源为准
+            record_path: 会话录制文件路径（见session_log），None为不录制
+        """
         super(AudioWorker, self).__init__()
-        self.CHUNK = 4096
-        self.RATE = 12000
+        # 分析参数（采样率、帧长、帧移、窗函数）与其他流水线参数来自同一份配置
+        options = {'onset_gate': onset_gate, 'min_snr': 5.0,
+                   'sample_rate': 12000, 'chunk_size': 4096}
+        options.update(pipeline_options or {})
+        if source is not None:
+            options['sample_rate'] = source.sample_rate
+        self.CHUNK = options['chunk_size']
+        self.RATE = options['sample_rate']
         self.CHUNK_2 = self.CHUNK // 2
-        self.data_end = np.zeros(self.CHUNK_2)
-        self.p = pyaudio.PyAudio()
-        self.stream = self.p.open(format=pyaudio.paInt16,
-                                  channels=1,
-                                  rate=self.RATE,
-                                  input=True,
-                                  frames_per_buffer=self.CHUNK_2)
-        self.data2 = []
+        # 帧移，默认50%重叠
+        self.HOP = options['hop_size'] = hop_size or options.get('hop_size') or self.CHUNK_2
+        self._running = False
+        if source is None:
+            source = PyAudioSource(sample_rate=self.RATE,
+                                   frames_per_buffer=self.HOP,
+                                   capture_mode=capture_mode,
+                                   queue_size=queue_size,
+                                   queue_policy=queue_policy)
+        self.source = source
+        # 热路径指标：读取/FFT/SNR/聚类耗时直方图，队列深度和丢帧数在导出时读取
+        self.metrics = metrics or PipelineMetrics()
+        if self.metrics.stats_provider is None:
+            self.metrics.stats_provider = self.source.stats
+        self._log = RateLimitedLogger(logger, interval=1.0)
+        # 检测结果写入定长记录数组，按限定频率整批发出
+        self.batcher = ResultBatcher(max_rate=batch_rate)
 
-        # 初始化音频处理器
-        self.audio_processor = AudioProcessor(sample_rate=self.RATE, chunk_size=self.CHUNK)
-
-        # 信号质量阈值
-        self.min_snr = 5.0  # 最小信噪比（dB）
+        # 逐帧检测流水线（环形缓冲、起振门控、频谱分析、流式聚类）
+        self.pipeline = DetectionPipeline(metrics=self.metrics, **options)
+        self.audio_processor = self.pipeline.audio_processor
+        # 会话录制：原始音频和逐帧结果由后台线程写盘，界面的模式切换和识别结果作为事件写入
+        self.recorder = None
+        if record_path:
+            from session_log import SessionRecorder
+            self.recorder = SessionRecorder(
+                record_path, self.RATE, self.CHUNK, self.HOP,
+                metadata={'pipeline': options, 'source': type(self.source).__name__})
 
         print("音频Worker初始化完成（已启用优化算法）")
 
     def process_audio(self):
         print("音频处理开始")
+        self._running = True
         try:
-            while True:
-                audio_chunk = self.stream.read(self.CHUNK_2, exception_on_overflow=False)
-                audio_data = np.frombuffer(audio_chunk, dtype=np.int16)
-                audio_data = np.concatenate((audio_data, self.data_end), axis=None)
-
-                # 使用优化的频率提取算法
-                freq_info = self.audio_processor.extract_frequency_with_harmonics(
-                    audio_data[:self.CHUNK])
-                f_max = freq_info['frequency']
-                amplitude = freq_info['amplitude']
-
-                # 计算信噪比
-                snr = self.audio_processor.calculate_snr(audio_data[:self.CHUNK])
-
-                # 只处理高质量信号
-                if f_max > 2500 and snr > self.min_snr:
-                    self.data2.append(f_max)
-
-                    if len(self.data2) > 25:
-                        # 使用DBSCAN聚类算法
-                        cluster_result = self.audio_processor.cluster_frequencies_dbscan(
-                            self.data2, eps=30, min_samples=3)
-
-                        if cluster_result:
-                            f_max = cluster_result['mean_frequency']
-                            quality_info = {
-                                'frequency': f_max,
-                                'snr': snr,
-                                'cluster_size': cluster_result['cluster_size'],
-                                'std': cluster_result['std_deviation']
-                            }
-                            self.frequencyWithQuality.emit(quality_info)
-                            print(f"发送频率：{f_max:.1f} Hz, SNR: {snr:.1f} dB, "
-                                  f"簇大小: {cluster_result['cluster_size']}")
-                        else:
-                            # 回退到原始算法
-                            freq_mode = self.seekingMode(self.data2)
-                            if freq_mode:
-                                f_max = freq_mode[0]
-                            quality_info = {'frequency': f_max, 'snr': snr}
-                            self.frequencyWithQuality.emit(quality_info)
-
-                        self.data2 = []
-                        self.frequencyDetected.emit(f_max)
-                    else:
-                        self.frequencyDetected.emit(f_max)
+            if self.recorder is not None:
+                self.recorder.start()
+            self.source.start()
+            metrics = self.metrics
+            while self._running:
+                t_read = time.perf_counter()
+                audio_chunk = self.source.read(self.HOP)
+                captured_at = time.perf_counter()
+                if audio_chunk is None:
+                    print("音频源数据结束。")
+                    break
+                if len(audio_chunk):
+                    metrics.read.observe(captured_at - t_read)
+                    metrics.frames += 1
+                    self._process_chunk(audio_chunk, captured_at)
+                batch = self.batcher.poll()
+                if batch is not None:
+                    self.detectionsReady.emit(batch)
+                metrics.maybe_log_summary()
         except KeyboardInterrupt:
             print("用户终止程序。")
         except Exception as e:
             print(f"发生错误：{e}")
         finally:
-            self.stream.stop_stream()
-            self.stream.close()
-            self.p.terminate()
-            print("音频流已关闭。")
+            self._running = False
+            batch = self.batcher.flush()
+            if batch is not None:
+                self.detectionsReady.emit(batch)
+            self.source.close()
+            if self.recorder is not None:
+                self.recorder.close()
+            print(f"音频流已关闭。统计：{self.capture_stats()}")
+            print(f"性能摘要：{self.metrics.format_summary()}")
+
+    def stop(self):
+        """请求停止处理循环（可从其他线程调用）"""
+        self._running = False
+        self.source.stop()
+
+    def capture_stats(self):
+        """
+        采集统计信息
+
+        Returns:
+            dict: 音频源统计（溢出次数、队列深度、丢弃数等），起振检测统计，以及结果攒批统计
+        """
+        stats = dict(self.source.stats())
+        stats.update(self.pipeline.stats())
+        stats['batches'] = self.batcher.stats()
+        if self.recorder is not None:
+            stats['recorder'] = self.recorder.stats()
+        return stats
+
+    def _process_chunk(self, audio_chunk, captured_at=None):
+        """
+        处理一个帧移的采样数据
 
-    def seekingMode(self, numList):
-        if not numList:
-            return []
-        uniqueList = list(set(numList))
-        frequencyDict = {num: numList.count(num) for num in uniqueList}
-        sortedDict = sorted(frequencyDict.items(), key=lambda item: item[1], reverse=True)
-        maxFrequency = sortedDict[0][1]
-        keys = [key for key, value in frequencyDict.items() if value == maxFrequency]
-        keys.sort()
-        return keys
\ No newline at end of file
+        Args:
+            audio_chunk: 一维采样数组
+            captured_at: 读到该帧移的时刻（time.perf_counter），随结果发送用于统计端到端延迟
+        """
+        if captured_at is None:
+            captured_at = time.perf_counter()
+        recorder = self.recorder
+        if recorder is None:
+            result = self.pipeline.process(audio_chunk)
+        else:
+            start = time.perf_counter()
+            result = self.pipeline.process(audio_chunk)
+            recorder.record(audio_chunk, result, captured_at, time.perf_counter() - start)
+        # 多峰模式下同一帧可能有多个杯子的判决，各占一条记录（captured_at相同）
+        for decided in decided_results(result):
+            quality_info = decided['quality']
+            self.batcher.add(decided, captured_at)
+            self._log.info('send', "发送频率：%.1f Hz, SNR: %.1f dB, 簇大小: %d",
+                           quality_info['frequency'], quality_info['snr'],
+                           quality_info.get('cluster_size', 0))
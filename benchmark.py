@@ -0,0 +1,421 @@
+"""
+检测链路离线基准测试
+生成合成敲击信号，测量频率提取、SNR、聚类和匹配的速度与准确率，
+结果可写入JSON并与历史结果对比，用于发现性能回退；
+--sweep对比不同采样率、帧长、重叠比例和窗函数的CPU开销与分辨率，供部署配置选择参数
+
+用法：
+    python benchmark.py --duration 60 --snr 20 --output bench.json
+    python benchmark.py --compare bench.json
+    python benchmark.py --sweep --chunk-sizes 1024 2048 4096 8192 --overlaps 0.5 0.75
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from analysis_plan import get_plan, hop_from_overlap
+from audio_processor import AudioProcessor
+from audio_source import ToneSource
+from detection_pipeline import DetectionPipeline
+from onset_detector import OnsetDetector
+from stream_cluster import StreamingFrequencyClusterer
+from targeted_detector import TargetedDetector
+from utils import CupMatcher, find_closest_cup_with_confidence
+
+DEFAULT_CUPS = (2800.0, 3000.0, 3200.0, 3400.0, 3600.0, 3800.0, 4000.0, 4200.0)
+
+
+def make_knock_signal(cup_frequencies, duration=30.0, snr_db=20.0, sample_rate=12000,
+                      amplitude=8000.0, knock_interval=0.5, decay=20.0, seed=0):
+    """
+    生成合成敲击信号
+
+    Args:
+        cup_frequencies: 依次循环敲击的杯子基频
+        duration: 时长（秒）
+        snr_db: 敲击起始时刻的信噪比（dB），据此计算噪声标准差
+        sample_rate: 采样率
+        amplitude: 敲击峰值幅度
+        knock_interval: 敲击间隔（秒）
+        decay: 衰减系数（1/秒）
+        seed: 随机种子
+
+    Returns:
+        tuple: (信号数组, ToneSource实例，用于查询各采样点对应的真实频率)
+    """
+    noise_level = amplitude / np.sqrt(2) / 10 ** (snr_db / 20)
+    source = ToneSource(frequencies=cup_frequencies, sample_rate=sample_rate,
+                        amplitude=amplitude, noise_level=noise_level,
+                        knock_interval=knock_interval, decay=decay,
+                        duration=duration, seed=seed)
+    return source.read(int(duration * sample_rate)), source
+
+
+def time_calls(func, items):
+    """
+    逐个调用并记录耗时
+
+    Returns:
+        np.ndarray: 每次调用的耗时（秒）
+    """
+    latencies = np.empty(len(items))
+    clock = time.perf_counter
+    for i, item in enumerate(items):
+        start = clock()
+        func(item)
+        latencies[i] = clock() - start
+    return latencies
+
+
+def summarize(latencies, items_per_call=1):
+    """
+    汇总耗时分布
+
+    Returns:
+        dict: 吞吐量（项/秒）和延迟分位数（微秒）
+    """
+    if not len(latencies):
+        return {'calls': 0}
+    total = float(np.sum(latencies))
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+    return {
+        'calls': int(len(latencies)),
+        'throughput': len(latencies) * items_per_call / total if total > 0 else float('inf'),
+        'mean_us': total / len(latencies) * 1e6,
+        'p50_us': float(p50),
+        'p90_us': float(p90),
+        'p99_us': float(p99),
+        'max_us': float(np.max(latencies) * 1e6)
+    }
+
+
+def measure_peak_memory(func):
+    """
+    测量函数执行期间的Python/NumPy内存分配峰值
+
+    Returns:
+        int: 峰值字节数
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_benchmark(cup_frequencies=DEFAULT_CUPS, duration=30.0, snr_db=20.0, hop_size=2048,
+                  sample_rate=12000, chunk_size=4096, min_snr=5.0, tolerance=10.0, seed=0):
+    """
+    运行完整基准测试
+
+    Returns:
+        dict: 各阶段的耗时统计、内存峰值和检测准确率
+    """
+    processor = AudioProcessor(sample_rate=sample_rate, chunk_size=chunk_size)
+    audio_signal, source = make_knock_signal(cup_frequencies, duration, snr_db,
+                                             sample_rate, seed=seed)
+    frames = processor.frame_signal(audio_signal.astype(np.float64), hop_size)
+    frame_list = list(frames)
+    # 帧末尾采样点所在的敲击决定该帧的真实频率
+    knocks = np.array([source.knock_at(i * hop_size + chunk_size - 1)[0]
+                       for i in range(len(frame_list))], dtype=int)
+    truth_cups = knocks % len(cup_frequencies)
+    truth = np.asarray(cup_frequencies)[truth_cups]
+
+    stages = {
+        'extract_frequency': summarize(time_calls(
+            processor.extract_frequency_with_harmonics, frame_list)),
+        'calculate_snr': summarize(time_calls(processor.calculate_snr, frame_list)),
+        'analyze_frame': summarize(time_calls(processor.analyze_frame, frame_list)),
+    }
+    detector = OnsetDetector(sample_rate, hop_size)
+    hops = [audio_signal[i:i + hop_size] for i in range(0, len(audio_signal), hop_size)]
+    stages['onset_detect'] = summarize(time_calls(detector.update, hops))
+
+    batch_start = time.perf_counter()
+    batch = processor.analyze_frames(frames)
+    batch_elapsed = time.perf_counter() - batch_start
+    stages['analyze_frames_batch'] = summarize(np.array([batch_elapsed]), len(frame_list))
+
+    # 检测质量门限与频率误差
+    accepted = (batch['frequency'] > 2500) & (batch['snr'] > min_snr)
+    errors = np.abs(batch['frequency'][accepted] - truth[accepted])
+    accepted_freqs = batch['frequency'][accepted]
+
+    # 聚类：批量（每26个样本一次）和流式（每个样本一次）
+    batches = [accepted_freqs[i:i + 26] for i in range(0, len(accepted_freqs) - 25, 26)]
+    stages['cluster_batch'] = summarize(time_calls(
+        lambda values: processor.cluster_frequencies_dbscan(values, eps=30, min_samples=3),
+        batches))
+    clusterer = StreamingFrequencyClusterer(eps=30, min_samples=3)
+    stages['cluster_streaming'] = summarize(time_calls(clusterer.add, accepted_freqs))
+
+    # 匹配：以真实频率作为学习结果
+    location = list(cup_frequencies)
+    location_stds = [5.0] * len(location)
+    stages['match'] = summarize(time_calls(
+        lambda freq: find_closest_cup_with_confidence(location, location_stds, freq),
+        accepted_freqs))
+    matcher = CupMatcher(location, location_stds)
+    stages['match_indexed'] = summarize(time_calls(matcher.match, accepted_freqs))
+    batch_start = time.perf_counter()
+    matches = matcher.match_batch(accepted_freqs)['cup_index']
+    stages['match_batch'] = summarize(np.array([time.perf_counter() - batch_start]),
+                                      len(accepted_freqs))
+    true_cups = truth_cups[accepted]
+
+    # 定向检测：与识别阶段相同，以各杯子的动态容差为搜索范围
+    targeted = TargetedDetector(matcher.freqs, matcher.tolerances, sample_rate=sample_rate,
+                                chunk_size=chunk_size, cup_indices=matcher.cup_indices)
+    stages['targeted_analyze'] = summarize(time_calls(targeted.analyze, frame_list))
+    targeted_freqs = np.array([targeted.analyze(frame)['frequency'] for frame in frame_list])
+    targeted_errors = np.abs(targeted_freqs[accepted] - truth[accepted])
+
+    # 完整流水线每个帧移的开销（关闭起振门控，每帧都分析）：学习阶段的完整FFT与识别阶段的定向检测
+    for name, targets in (('pipeline_full', None), ('pipeline_targeted', matcher)):
+        pipeline = DetectionPipeline(sample_rate=sample_rate, chunk_size=chunk_size,
+                                     hop_size=hop_size, onset_gate=False)
+        if targets is not None:
+            pipeline.set_targets(targets.freqs, targets.tolerances, targets.cup_indices,
+                                 targets.stds)
+        stages[name] = summarize(time_calls(pipeline.process, hops))
+
+    def pipeline():
+        for frame in frame_list:
+            processor.analyze_frame(frame)
+    peak_memory = measure_peak_memory(pipeline)
+
+    realtime_fps = sample_rate / hop_size
+    return {
+        'config': {
+            'cups': list(cup_frequencies),
+            'duration': duration,
+            'snr_db': snr_db,
+            'sample_rate': sample_rate,
+            'chunk_size': chunk_size,
+            'hop_size': hop_size,
+            'frames': len(frame_list),
+            'seed': seed
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine()
+        },
+        'stages': stages,
+        'memory_peak_bytes': peak_memory,
+        'onset': detector.stats(),
+        'realtime_factor': stages['analyze_frame']['throughput'] / realtime_fps,
+        'accuracy': {
+            'accepted_ratio': float(np.mean(accepted)) if len(accepted) else 0.0,
+            'frequency_error_mean': float(np.mean(errors)) if len(errors) else None,
+            'frequency_error_p95': float(np.percentile(errors, 95)) if len(errors) else None,
+            'frequency_error_targeted_mean': (float(np.mean(targeted_errors))
+                                              if len(targeted_errors) else None),
+            'within_tolerance': float(np.mean(errors <= tolerance)) if len(errors) else None,
+            'match_accuracy': float(np.mean(matches == true_cups)) if len(matches) else None
+        }
+    }
+
+
+def run_sweep(sample_rates=(12000,), chunk_sizes=(1024, 2048, 4096, 8192), overlaps=(0.5,),
+              windows=('hamming',), cup_frequencies=DEFAULT_CUPS, duration=20.0, snr_db=20.0,
+              signal_band=(2500, 6000), min_snr=5.0, max_frames=200, seed=0):
+    """
+    对比各组分析参数的CPU开销、分辨率和频率误差
+
+    Args:
+        sample_rates: 采样率列表
+        chunk_sizes: FFT帧长列表
+        overlaps: 重叠比例列表
+        windows: 窗函数列表（见analysis_plan.WINDOWS）
+        cup_frequencies: 合成信号的杯子基频
+        duration: 合成信号时长（秒）
+        snr_db: 敲击信噪比（dB）
+        signal_band: 信号频段，超出奈奎斯特频率的采样率被跳过
+        min_snr: 频率误差统计的信噪比门限（dB）
+        max_frames: 单帧分析计时的最多帧数
+        seed: 随机种子
+
+    Returns:
+        list: 每组参数一个dict，含AnalysisPlan.describe()的字段，
+              'frame_us'（单帧分析p50耗时）、'cpu_full'（每帧都分析时占一个核的比例）、
+              'cpu_pipeline'（完整流水线含起振门控的实际占比）、'detections'，
+              以及'error_p50_hz'、'error_p95_hz'（通过门限的帧的频率误差）
+    """
+    results = []
+    for sample_rate in sample_rates:
+        if signal_band[1] > sample_rate / 2:
+            continue
+        audio_signal, source = make_knock_signal(cup_frequencies, duration, snr_db,
+                                                 sample_rate, seed=seed)
+        samples = audio_signal.astype(np.float64)
+        for chunk_size in chunk_sizes:
+            for overlap in overlaps:
+                hop_size = hop_from_overlap(chunk_size, overlap)
+                for window in windows:
+                    description = get_plan(sample_rate, chunk_size, window).describe(hop_size)
+                    processor = AudioProcessor(sample_rate, chunk_size, window=window)
+                    frames = processor.frame_signal(samples, hop_size)
+                    frame_us = summarize(time_calls(
+                        processor.analyze_frame, list(frames[:max_frames])))['p50_us']
+
+                    pipeline = DetectionPipeline(sample_rate=sample_rate, chunk_size=chunk_size,
+                                                 hop_size=hop_size, window=window,
+                                                 signal_band=signal_band)
+                    detections = 0
+                    start = time.perf_counter()
+                    for offset in range(0, len(audio_signal) - hop_size + 1, hop_size):
+                        result = pipeline.process(audio_signal[offset:offset + hop_size])
+                        if result is not None and result['quality'] is not None:
+                            detections += 1
+                    pipeline_seconds = time.perf_counter() - start
+
+                    # 帧末尾采样点所在的敲击决定该帧的真实频率
+                    batch = processor.analyze_frames(frames, signal_band)
+                    knocks = np.array([source.knock_at(i * hop_size + chunk_size - 1)[0]
+                                       for i in range(len(frames))], dtype=int)
+                    truth = np.asarray(cup_frequencies)[knocks % len(cup_frequencies)]
+                    accepted = ((batch['frequency'] > signal_band[0])
+                                & (batch['snr'] > min_snr))
+                    errors = np.abs(batch['frequency'][accepted] - truth[accepted])
+
+                    entry = dict(description)
+                    entry.update({
+                        'frame_us': frame_us,
+                        'cpu_full': frame_us * 1e-6 * sample_rate / hop_size,
+                        'cpu_pipeline': pipeline_seconds / duration,
+                        'detections': detections,
+                        'error_p50_hz': float(np.median(errors)) if len(errors) else None,
+                        'error_p95_hz': float(np.percentile(errors, 95)) if len(errors) else None
+                    })
+                    results.append(entry)
+    return results
+
+
+def format_sweep(results):
+    """参数扫描结果的文本表格"""
+    lines = [f"{'采样率':>7}{'帧长':>7}{'帧移':>7}{'窗函数':>12}{'bin(Hz)':>9}{'分辨率(Hz)':>11}"
+             f"{'帧长(ms)':>9}{'帧移(ms)':>9}{'单帧(us)':>10}{'满载CPU':>9}{'流水线CPU':>10}"
+             f"{'识别':>6}{'误差p50':>9}{'误差p95':>9}"]
+    for r in results:
+        p50 = '-' if r['error_p50_hz'] is None else f"{r['error_p50_hz']:.2f}"
+        p95 = '-' if r['error_p95_hz'] is None else f"{r['error_p95_hz']:.2f}"
+        lines.append(f"{r['sample_rate']:>7}{r['chunk_size']:>7}{r['hop_size']:>7}"
+                     f"{r['window']:>12}{r['bin_hz']:>9.2f}{r['resolution_hz']:>11.2f}"
+                     f"{r['frame_ms']:>9.0f}{r['hop_ms']:>9.0f}{r['frame_us']:>10.1f}"
+                     f"{r['cpu_full']:>9.2%}{r['cpu_pipeline']:>10.2%}{r['detections']:>6}"
+                     f"{p50:>9}{p95:>9}")
+    return '\n'.join(lines)
+
+
+def compare_results(current, baseline, threshold=0.1):
+    """
+    与历史结果对比
+
+    Args:
+        current: 本次结果
+        baseline: 历史结果
+        threshold: 允许的相对退化比例
+
+    Returns:
+        list: 退化项描述
+    """
+    regressions = []
+    for stage, stats in current['stages'].items():
+        old = baseline.get('stages', {}).get(stage)
+        if not old or 'throughput' not in old or 'throughput' not in stats:
+            continue
+        if stats['throughput'] < old['throughput'] * (1 - threshold):
+            regressions.append(f"{stage}: 吞吐量 {old['throughput']:.0f} -> "
+                               f"{stats['throughput']:.0f} /s")
+    for key, value in current['accuracy'].items():
+        old = baseline.get('accuracy', {}).get(key)
+        if value is None or old is None or key.startswith('frequency_error'):
+            continue
+        if value < old - threshold * abs(old):
+            regressions.append(f"{key}: {old:.3f} -> {value:.3f}")
+    return regressions
+
+
+def format_report(results):
+    """生成可读的文本报告"""
+    lines = [f"帧数: {results['config']['frames']}  "
+             f"SNR: {results['config']['snr_db']} dB  "
+             f"实时倍数: {results['realtime_factor']:.1f}x"]
+    lines.append(f"{'阶段':<22}{'吞吐量/s':>12}{'p50(us)':>10}{'p90(us)':>10}{'p99(us)':>10}")
+    for stage, stats in results['stages'].items():
+        if not stats.get('calls'):
+            continue
+        lines.append(f"{stage:<22}{stats['throughput']:>12.0f}{stats['p50_us']:>10.1f}"
+                     f"{stats['p90_us']:>10.1f}{stats['p99_us']:>10.1f}")
+    lines.append(f"内存峰值: {results['memory_peak_bytes'] / 1024:.1f} KiB")
+    lines.append(f"起振激活比例: {results['onset']['active_ratio']:.3f}")
+    for key, value in results['accuracy'].items():
+        lines.append(f"{key}: {'-' if value is None else f'{value:.3f}'}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="音频杯感应检测链路基准测试")
+    parser.add_argument('--duration', type=float, default=30.0, help="合成信号时长（秒）")
+    parser.add_argument('--snr', type=float, default=20.0, help="敲击信噪比（dB）")
+    parser.add_argument('--hop', type=int, default=2048, help="帧移（采样点）")
+    parser.add_argument('--cups', type=float, nargs='+', default=list(DEFAULT_CUPS),
+                        help="杯子基频列表（Hz）")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--output', help="结果JSON输出路径")
+    parser.add_argument('--compare', help="用于对比的历史结果JSON")
+    parser.add_argument('--threshold', type=float, default=0.1, help="允许的相对退化比例")
+    parser.add_argument('--sweep', action='store_true', help="对比各组分析参数的开销与分辨率")
+    parser.add_argument('--rates', type=int, nargs='+', default=[12000], help="扫描的采样率")
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[1024, 2048, 4096, 8192],
+                        help="扫描的FFT帧长")
+    parser.add_argument('--overlaps', type=float, nargs='+', default=[0.5],
+                        help="扫描的重叠比例")
+    parser.add_argument('--windows', nargs='+', default=['hamming'], help="扫描的窗函数")
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        results = run_sweep(sample_rates=args.rates, chunk_sizes=args.chunk_sizes,
+                            overlaps=args.overlaps, windows=args.windows,
+                            cup_frequencies=tuple(args.cups), duration=args.duration,
+                            snr_db=args.snr, seed=args.seed)
+        print(format_sweep(results))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            print(f"结果已写入 {args.output}")
+        return 0
+
+    results = run_benchmark(cup_frequencies=tuple(args.cups), duration=args.duration,
+                            snr_db=args.snr, hop_size=args.hop, seed=args.seed)
+    print(format_report(results))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print("检测到性能/准确率退化：")
+            for item in regressions:
+                print(f"  {item}")
+            return 1
+        print("未发现退化。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,476 @@
+"""
+批量标定
+从已标注的录音批量学习杯子，生成杯子档案（profile_store），代替在界面上逐个按键敲击学习。
+录音目录中每个杯子一个WAV文件（文件名即杯子名称），或每个杯子一个子目录（子目录名为名称，
+其中全部WAV文件属于该杯子）；同一文件中的多段录音用清单文件（JSON）标注：
+    [{"file": "session1.wav", "label": "cup_1", "start": 0.0, "end": 12.5}, ...]
+名称为cup_N的杯子对应界面上的N号杯子，其余名称按字母顺序占用剩下的编号。
+
+各段录音在进程池中并行分析：按帧移送入与识别时相同的检测流水线（部署配置的帧长、帧移、窗函数、
+信号频段、起振门控、自适应噪声谱和逐bin信噪比门限），每个杯子的频率与学习时一样做密度聚类，
+报告各杯子的稳定性，以及杯子两两之间的可分性（频率间隔、d'、按识别阶段的匹配器逐帧匹配的混淆率），
+有冲突的杯子在部署前标出。
+
+用法：
+    python calibration.py recordings/ --output cup_profiles.acsp
+    python calibration.py recordings/ --manifest segments.json --deployment hall.json --report calib.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import sys
+import time
+
+import numpy as np
+
+from audio_source import WavFileSource
+from cup_detector import CupDetector
+from deployment import load_deployment
+from detection_pipeline import DetectionPipeline
+from fingerprint import FINGERPRINT_SIZE
+from profile_store import ProfileStore
+from stream_cluster import StreamingFrequencyClusterer
+
+# 学习时的聚类参数（与CupDetector一致）
+CLUSTER_EPS = 30
+CLUSTER_MIN_SAMPLES = 3
+# d'计算时标准差的下限（Hz），与SequentialDecider的sigma_floor相同
+SIGMA_FLOOR = 3.0
+
+
+def find_recordings(directory, manifest=None):
+    """
+    列出标定任务
+
+    Args:
+        directory: 录音目录
+        manifest: 清单文件路径（JSON，文件路径相对录音目录），None时按目录结构标注
+
+    Returns:
+        list: 每段录音一个dict：'path'、'label'、'start'、'end'（秒，None为文件末尾）
+    """
+    if manifest is not None:
+        with open(manifest, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError(f"清单须为JSON数组：{manifest}")
+        jobs = []
+        for entry in entries:
+            if 'file' not in entry or 'label' not in entry:
+                raise ValueError(f"清单条目缺少file或label：{entry}")
+            jobs.append({'path': os.path.join(directory, entry['file']),
+                         'label': str(entry['label']),
+                         'start': float(entry.get('start', 0.0)),
+                         'end': None if entry.get('end') is None else float(entry['end'])})
+        return jobs
+
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            for child in sorted(os.listdir(path)):
+                if child.lower().endswith('.wav'):
+                    jobs.append({'path': os.path.join(path, child), 'label': name,
+                                 'start': 0.0, 'end': None})
+        elif name.lower().endswith('.wav'):
+            jobs.append({'path': path, 'label': os.path.splitext(name)[0],
+                         'start': 0.0, 'end': None})
+    return jobs
+
+
+def assign_cup_indices(labels, reserved=None):
+    """
+    杯子名称到界面编号（从0开始）：cup_N为N-1，其余按字母顺序占用剩下的编号
+
+    Args:
+        labels: 杯子名称
+        reserved: 档案中已有杯子的编号{名称: 编号}，同名杯子沿用原编号，其余名称不占用这些编号
+
+    Returns:
+        dict: {名称: 编号}
+    """
+    reserved = reserved or {}
+    indices = {}
+    for label in labels:
+        match = re.fullmatch(r'cup_(\d+)', label)
+        if match and int(match.group(1)) >= 1:
+            indices[label] = int(match.group(1)) - 1
+        elif label in reserved:
+            indices[label] = reserved[label]
+    used = set(indices.values()) | set(reserved.values())
+    next_index = 0
+    for label in sorted(labels):
+        if label in indices:
+            continue
+        while next_index in used:
+            next_index += 1
+        indices[label] = next_index
+        used.add(next_index)
+    return indices
+
+
+def extract_segment(job):
+    """
+    分析一段录音（进程池工作函数）
+
+    Args:
+        job: find_recordings()的一项，另含'options'（部署配置）
+
+    Returns:
+        dict: 'label'、'path'、'sample_rate'、'duration'（秒）、'frames'（总帧数）、
+              'active'（起振门控判定需要分析的帧数）、'frequencies'和'fingerprints'
+              （通过与识别时相同的质量过滤的帧，形状为(n,)和(n, FINGERPRINT_SIZE)）、'elapsed'（秒），
+              出错时只含'label'、'path'和'error'
+    """
+    options = job['options']
+    start_time = time.perf_counter()
+    try:
+        source = WavFileSource(job['path'])
+    except (OSError, ValueError) as e:
+        return {'label': job['label'], 'path': job['path'], 'error': str(e)}
+    with source:
+        sample_rate = source.sample_rate
+        low, high = options['signal_band']
+        if high > sample_rate / 2:
+            return {'label': job['label'], 'path': job['path'],
+                    'error': f"信号频段上限{high} Hz超过采样率{sample_rate} Hz的一半"}
+        first = min(int(round(job['start'] * sample_rate)), len(source))
+        last = len(source) if job['end'] is None else int(round(job['end'] * sample_rate))
+        last = max(first, min(last, len(source)))
+
+        # 与识别时相同的检测流水线（起振门控、自适应噪声谱和逐bin信噪比门限都按部署配置），
+        # 标定样本与部署后匹配的帧来自同一套质量过滤；每段录音只有一个杯子，按单峰检测
+        pipeline = DetectionPipeline(**dict(options, sample_rate=sample_rate, max_peaks=1,
+                                            with_fingerprint=True))
+        chunk_size = pipeline.chunk_size
+        hop_size = pipeline.hop_size
+        hops_per_frame = -(-chunk_size // hop_size)
+        onset = pipeline.onset_detector
+        # 按帧移从内存映射中读取，长录音也不会整段转换为浮点数
+        source.read(first)
+        hop_count = (last - first) // hop_size
+        frequencies = []
+        fingerprints = []
+        active = 0
+        for index in range(hop_count):
+            result = pipeline.process(source.read(hop_size))
+            if index >= hops_per_frame - 1 and (onset is None or onset.active):
+                active += 1
+            if result is not None:
+                frequencies.append(result['raw_frequency'])
+                fingerprints.append(result['fingerprint'])
+    return {
+        'label': job['label'],
+        'path': job['path'],
+        'sample_rate': sample_rate,
+        'duration': (last - first) / sample_rate,
+        'frames': max(0, hop_count - hops_per_frame + 1),
+        'active': active,
+        'frequencies': np.array(frequencies, dtype=np.float64),
+        'fingerprints': (np.array(fingerprints, dtype=np.float32) if fingerprints
+                         else np.zeros((0, FINGERPRINT_SIZE), dtype=np.float32)),
+        'elapsed': time.perf_counter() - start_time
+    }
+
+
+def summarize_cup(label, frequencies, fingerprints, max_std=5.0, min_ratio=0.8):
+    """
+    聚类一个杯子的全部样本（与CupDetector.finish_learning相同）并评估稳定性
+
+    Args:
+        label: 杯子名称
+        frequencies: 通过质量过滤的各帧频率
+        fingerprints: 对应的指纹
+        max_std: 簇标准差超过此值（Hz）视为不稳定
+        min_ratio: 最大簇占全部样本的比例低于此值视为不稳定（混入了其他频率）
+
+    Returns:
+        dict: 'label'、'samples'、'frequency'、'std'、'cluster_size'、'cluster_ratio'、
+              'min_frequency'、'max_frequency'、'stability'（1 / (1 + 变异系数)），
+              'issues'（问题说明列表），以及簇内样本'cluster_frequencies'、'cluster_fingerprints'；
+              没有成簇时'frequency'为None
+    """
+    summary = {'label': label, 'samples': int(len(frequencies)), 'frequency': None, 'std': None,
+               'cluster_size': 0, 'cluster_ratio': 0.0, 'issues': []}
+    cluster = None
+    if len(frequencies) >= CLUSTER_MIN_SAMPLES:
+        cluster = StreamingFrequencyClusterer(
+            eps=CLUSTER_EPS, min_samples=CLUSTER_MIN_SAMPLES).extend(frequencies.tolist())
+    if not cluster:
+        summary['issues'].append(f"有效样本{len(frequencies)}个，未能成簇")
+        return summary
+
+    mean = cluster['mean_frequency']
+    std = cluster['std_deviation']
+    # 与学习时相同，只保留簇附近的样本
+    window = CLUSTER_EPS + 2 * std
+    keep = np.abs(frequencies - mean) <= window
+    kept = frequencies[keep]
+    summary.update({
+        'frequency': mean,
+        'std': std,
+        'cluster_size': cluster['cluster_size'],
+        'cluster_ratio': cluster['cluster_ratio'],
+        'min_frequency': float(kept.min()),
+        'max_frequency': float(kept.max()),
+        'stability': 1 / (1 + std / mean),
+        'cluster_frequencies': kept,
+        'cluster_fingerprints': fingerprints[keep]
+    })
+    if std > max_std:
+        summary['issues'].append(f"标准差{std:.1f} Hz超过{max_std:.1f} Hz")
+    if cluster['cluster_ratio'] < min_ratio:
+        summary['issues'].append(f"最大簇只占{cluster['cluster_ratio']:.0%}的样本")
+    return summary
+
+
+def separability(cups, detector, existing=(), max_confusion=0.01):
+    """
+    杯子两两之间的可分性
+
+    混淆率按识别阶段实际使用的匹配器逐帧计算：定向检测不计算指纹，按频率动态容差匹配
+    （CupMatcher）；指纹最近邻匹配（FingerprintMatcher）的混淆率一并给出供参考。
+    逐帧匹配比序贯判决后的匹配更严格。
+
+    Args:
+        cups: summarize_cup()的结果中已成簇的，另含'cup_index'
+        detector: 已加载标定结果的CupDetector
+        existing: 档案中已有、本次未标定的杯子（dict含'label'、'cup_index'、'frequency'、'std'），
+                  只作为比较对象
+        max_confusion: 一对杯子的混淆率（任一方向）超过此值视为冲突
+
+    Returns:
+        tuple: (各杯子的指标dict列表, 冲突的杯子对列表)；
+               指标含'recall'（按频率匹配到自己的比例）、'unmatched'、'fingerprint_recall'，
+               以及最接近（d'最小）的杯子'nearest'、'separation'、'd_prime'
+    """
+    n = len(cups)
+    targets = list(cups) + list(existing)
+    m = len(targets)
+    labels = [cup['label'] for cup in targets]
+    # 编号相同时以本次标定的杯子为准
+    position = {cup['cup_index']: i for i, cup in reversed(list(enumerate(targets)))}
+    means = np.array([cup['frequency'] for cup in targets])
+    sigmas = np.maximum(np.array([cup['std'] for cup in targets]), SIGMA_FLOOR)
+    separation = np.abs(means[:, None] - means[None, :])
+    d_prime = separation / np.sqrt((sigmas[:, None] ** 2 + sigmas[None, :] ** 2) / 2)
+    np.fill_diagonal(d_prime, np.inf)
+
+    # confusion[i, j]：杯子i的样本被匹配成杯子j的比例
+    confusion = np.zeros((m, m))
+    fingerprint_confusion = np.zeros((m, m))
+    metrics = []
+    for i, cup in enumerate(cups):
+        frequencies = cup['cluster_frequencies']
+        matched = detector.cup_matcher.match_batch(frequencies)['cup_index']
+        fp_matched = detector.fingerprint_matcher.match_batch(cup['cluster_fingerprints'])['cup_index']
+        for row, indices in ((confusion, matched), (fingerprint_confusion, fp_matched)):
+            found = indices[indices >= 0]
+            if len(found):
+                columns = np.array([position.get(int(c), -1) for c in found])
+                np.add.at(row[i], columns[columns >= 0], 1.0)
+            row[i] /= max(len(indices), 1)
+        nearest = int(np.argmin(d_prime[i])) if m > 1 else None
+        metrics.append({
+            'label': cup['label'],
+            'recall': float(confusion[i, i]),
+            'unmatched': float(np.mean(matched < 0)) if len(matched) else 0.0,
+            'fingerprint_recall': float(fingerprint_confusion[i, i]),
+            'nearest': labels[nearest] if nearest is not None else None,
+            'separation': float(separation[i, nearest]) if nearest is not None else None,
+            'd_prime': float(d_prime[i, nearest]) if nearest is not None else None
+        })
+
+    conflicts = []
+    for i in range(n):
+        for j in range(i + 1, m):
+            rate = max(confusion[i, j], confusion[j, i])
+            if separation[i, j] < CLUSTER_EPS or rate > max_confusion:
+                conflicts.append({
+                    'cups': (labels[i], labels[j]),
+                    'separation': float(separation[i, j]),
+                    'd_prime': float(d_prime[i, j]),
+                    'confusion': float(rate),
+                    'fingerprint_confusion': float(max(fingerprint_confusion[i, j],
+                                                       fingerprint_confusion[j, i]))
+                })
+    conflicts.sort(key=lambda c: c['d_prime'])
+    return metrics, conflicts
+
+
+def calibrate(directory, output, manifest=None, options=None, workers=None, update=False,
+              max_std=5.0, max_confusion=0.01):
+    """
+    批量标定并写入杯子档案
+
+    Args:
+        directory: 录音目录
+        output: 杯子档案文件路径
+        manifest: 清单文件路径，None时按目录结构标注
+        options: 部署配置（deployment.load_deployment()的结果），None为默认配置
+        workers: 进程数，默认为CPU核数；为1时在当前进程中分析
+        update: True时在已有档案上替换标定到的杯子（已有的杯子参与可分性比较），
+                False时只写本次标定的杯子
+        max_std: 杯子频率标准差上限（Hz）
+        max_confusion: 杯子对的混淆率上限
+
+    Returns:
+        dict: 'segments'（各段录音的分析统计）、'cups'（各杯子的聚类结果、稳定性和可分性）、
+              'conflicts'（冲突的杯子对）、'failed'（未能成簇的杯子）、'elapsed'（秒）
+    """
+    start_time = time.perf_counter()
+    options = options or load_deployment()
+    jobs = find_recordings(directory, manifest)
+    if not jobs:
+        raise ValueError(f"没有找到录音：{directory}")
+    for job in jobs:
+        job['options'] = options
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        results = [extract_segment(job) for job in jobs]
+    else:
+        with multiprocessing.get_context().Pool(workers) as pool:
+            # 每段录音单独分发，长短不一时各进程负载均衡；结果顺序与任务一致
+            results = pool.map(extract_segment, jobs, chunksize=1)
+
+    segments = []
+    samples = {}
+    for result in results:
+        segment = {key: value for key, value in result.items()
+                   if key not in ('frequencies', 'fingerprints')}
+        if 'error' not in result:
+            segment['accepted'] = int(len(result['frequencies']))
+            frequencies, fingerprints = samples.setdefault(result['label'], ([], []))
+            frequencies.append(result['frequencies'])
+            fingerprints.append(result['fingerprints'])
+        segments.append(segment)
+
+    store = ProfileStore()
+    if update and os.path.exists(output):
+        store = ProfileStore.load(output, mmap=False)
+    stored = {label: store.get(label) for label in store.labels}
+    indices = assign_cup_indices(list(samples), {label: info['cup_index']
+                                                 for label, info in stored.items()})
+    summaries = []
+    for label in sorted(samples, key=lambda name: indices[name]):
+        frequencies, fingerprints = samples[label]
+        summary = summarize_cup(label, np.concatenate(frequencies),
+                                np.concatenate(fingerprints), max_std=max_std)
+        summary['cup_index'] = indices[label]
+        summaries.append(summary)
+    cups = [summary for summary in summaries if summary['frequency'] is not None]
+
+    station = platform.node()
+    for cup in cups:
+        store.update(cup['label'], cup['cluster_frequencies'], cup['cluster_fingerprints'],
+                     cup_index=cup['cup_index'], replace=True, station=station)
+    store.save(output)
+
+    conflicts = []
+    if cups:
+        # 按识别时的方式加载刚写入的档案
+        existing = [{'label': label, 'cup_index': info['cup_index'],
+                     'frequency': info['mean_frequency'], 'std': info['std_deviation']}
+                    for label, info in stored.items() if label not in samples]
+        num_cups = max([cup['cup_index'] + 1 for cup in cups + existing])
+        detector = CupDetector(num_cups, profile_path=output)
+        detector.load_profiles()
+        metrics, conflicts = separability(cups, detector, existing, max_confusion=max_confusion)
+        for cup, metric in zip(cups, metrics):
+            cup.update(metric)
+            if cup['recall'] < 1 - max_confusion:
+                cup['issues'].append(f"按频率匹配只有{cup['recall']:.0%}的帧识别为自己")
+    conflicted = {label for conflict in conflicts for label in conflict['cups']}
+    for cup in cups:
+        if cup['label'] in conflicted:
+            cup['issues'].append("与其他杯子冲突")
+        del cup['cluster_frequencies'], cup['cluster_fingerprints']
+    return {
+        'output': output,
+        'segments': segments,
+        'cups': summaries,
+        'conflicts': conflicts,
+        'failed': [summary['label'] for summary in summaries if summary['frequency'] is None],
+        'elapsed': time.perf_counter() - start_time
+    }
+
+
+def format_report(report):
+    """标定结果的文本报告"""
+    segments = report['segments']
+    errors = [segment for segment in segments if 'error' in segment]
+    analyzed = [segment for segment in segments if 'error' not in segment]
+    duration = sum(segment['duration'] for segment in analyzed)
+    lines = [f"分析{len(analyzed)}段录音（共{duration:.1f} s），耗时{report['elapsed']:.2f} s，"
+             f"写入{len(report['cups']) - len(report['failed'])}个杯子 -> {report['output']}"]
+    for segment in errors:
+        lines.append(f"  读取失败 {segment['path']}：{segment['error']}")
+    lines.append(f"{'杯子':<16}{'编号':>5}{'频率(Hz)':>10}{'标准差':>8}{'样本':>10}{'簇占比':>8}"
+                 f"{'识别率':>8}  最接近的杯子")
+    for cup in report['cups']:
+        if cup['frequency'] is None:
+            lines.append(f"{cup['label']:<16}{cup['cup_index'] + 1:>5}{'-':>10}{'-':>8}"
+                         f"{cup['samples']:>10}{'-':>8}{'-':>8}  {'；'.join(cup['issues'])}")
+            continue
+        nearest = '-'
+        if cup.get('nearest') is not None:
+            nearest = f"{cup['nearest']}（间隔{cup['separation']:.1f} Hz，d'={cup['d_prime']:.1f}）"
+        line = (f"{cup['label']:<16}{cup['cup_index'] + 1:>5}{cup['frequency']:>10.1f}"
+                f"{cup['std']:>8.2f}{cup['cluster_size']:>5}/{cup['samples']:<4}"
+                f"{cup['cluster_ratio']:>8.0%}{cup.get('recall', 1.0):>8.0%}  {nearest}")
+        if cup['issues']:
+            line += f"  [{'；'.join(cup['issues'])}]"
+        lines.append(line)
+    if report['conflicts']:
+        lines.append("冲突的杯子：")
+        for conflict in report['conflicts']:
+            a, b = conflict['cups']
+            lines.append(f"  {a} / {b}：间隔{conflict['separation']:.1f} Hz，"
+                         f"d'={conflict['d_prime']:.1f}，逐帧混淆率{conflict['confusion']:.1%}"
+                         f"（指纹{conflict['fingerprint_confusion']:.1%}）")
+    else:
+        lines.append("没有冲突的杯子")
+    return '\n'.join(lines)
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"无法序列化：{type(obj).__name__}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从已标注的录音批量标定杯子")
+    parser.add_argument('directory', help="录音目录")
+    parser.add_argument('--output', default='cup_profiles.acsp', help="杯子档案文件")
+    parser.add_argument('--manifest', default=None, help="录音分段清单（JSON）")
+    parser.add_argument('--deployment', default=None, help="部署配置文件，见deployment.py")
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument('--update', action='store_true', help="在已有档案上替换标定到的杯子")
+    parser.add_argument('--max-std', type=float, default=5.0, help="杯子频率标准差上限（Hz）")
+    parser.add_argument('--max-confusion', type=float, default=0.01, help="杯子对的混淆率上限")
+    parser.add_argument('--report', default=None, help="标定报告写入JSON文件")
+    args = parser.parse_args(argv)
+
+    try:
+        options = load_deployment(args.deployment)
+        report = calibrate(args.directory, args.output, manifest=args.manifest, options=options,
+                           workers=args.workers, update=args.update, max_std=args.max_std,
+                           max_confusion=args.max_confusion)
+    except (OSError, ValueError) as e:
+        print(f"标定失败：{e}")
+        return 2
+    print(format_report(report))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=_json_default)
+        print(f"报告已写入 {args.report}")
+    # 有冲突或未能成簇的杯子时返回非零，部署脚本可据此中止
+    return 1 if report['conflicts'] or report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+杯子学习与识别（不依赖Qt）
+收集学习样本、聚类得到杯子频率、学习指纹、匹配检测结果、读写杯子档案，
+GUI和无界面检测服务共用同一套逻辑
+"""
+import os
+import platform
+
+from fingerprint import FingerprintMatcher
+from profile_store import ProfileStore
+from stream_cluster import StreamingFrequencyClusterer
+from utils import CupMatcher
+
+
+class CupDetector:
+    """已学习杯子表 + 学习/识别状态"""
+
+    def __init__(self, num_cups=8, profile_path=None, base_tolerance=50,
+                 confidence_threshold=0.5, learn_min_samples=5, learn_max_std=5.0):
+        """
+        Args:
+            num_cups: 杯子数量
+            profile_path: 杯子档案文件路径，None为不持久化
+            base_tolerance: 频率匹配的基础容差（Hz）
+            confidence_threshold: 最低置信度阈值
+            learn_min_samples: 学习提前结束所需的最少簇内样本数
+            learn_max_std: 学习提前结束时簇的最大标准差（Hz）
+        """
+        self.num_cups = num_cups
+        self.learn_min_samples = learn_min_samples
+        self.learn_max_std = learn_max_std
+        self.profile_path = profile_path
+        self.location = [0.0] * num_cups  # 确保列表元素为浮点数
+        self.location_stds = [0.0] * num_cups  # 存储各杯子的频率标准差
+        # 杯子档案：启动时从磁盘恢复，每次学习完成后原子保存
+        self.profile_store = ProfileStore()
+        # 向量化匹配器，学习完成后重建索引
+        self.cup_matcher = CupMatcher(self.location, self.location_stds,
+                                      base_tolerance=base_tolerance,
+                                      confidence_threshold=confidence_threshold)
+        # 指纹匹配器：基频相近的杯子靠谐波、衰减和质心区分
+        self.fingerprint_matcher = FingerprintMatcher(confidence_threshold=confidence_threshold)
+        self.learning_cup = None
+        self.frequencies = []
+        self.fingerprints = []
+
+    def load_profiles(self):
+        """
+        从档案文件恢复已学习的杯子
+
+        Returns:
+            bool: 是否加载成功（文件不存在时为False）
+        """
+        if not self.profile_path or not os.path.exists(self.profile_path):
+            return False
+        try:
+            self.profile_store = ProfileStore.load(self.profile_path)
+        except (OSError, ValueError) as e:
+            print(f"加载杯子档案失败：{e}")
+            return False
+        self.location, self.location_stds = self.profile_store.to_location(self.num_cups)
+        self.profile_store.load_fingerprints(self.fingerprint_matcher)
+        self.cup_matcher.set_cups(self.location, self.location_stds)
+        return True
+
+    def _save_profile(self, cup_number, frequencies, fingerprints):
+        """用本次学习的样本替换该杯子的档案并保存"""
+        self.profile_store.update(f"cup_{cup_number}", frequencies, fingerprints or None,
+                                  cup_index=cup_number - 1, replace=True,
+                                  station=platform.node())
+        if not self.profile_path:
+            return
+        try:
+            self.profile_store.save(self.profile_path)
+        except OSError as e:
+            print(f"保存杯子档案失败：{e}")
+
+    def start_learning(self, cup_number):
+        """
+        开始学习一个杯子（清空样本）
+
+        Args:
+            cup_number: 杯子编号（从1开始）
+        """
+        if not 1 <= cup_number <= self.num_cups:
+            raise ValueError(f"杯子编号超出范围：{cup_number}")
+        self.learning_cup = cup_number
+        self.frequencies = []
+        self.fingerprints = []
+
+    def cancel_learning(self):
+        """放弃当前学习（不修改杯子表）"""
+        self.learning_cup = None
+        self.frequencies = []
+        self.fingerprints = []
+
+    def add_sample(self, quality_info):
+        """
+        加入一条学习样本（频率和可选的指纹）
+
+        Returns:
+            bool: 样本是否已足够稳定，可以提前结束学习
+        """
+        self.frequencies.append(quality_info.get('frequency', 0))
+        fingerprint = quality_info.get('fingerprint')
+        if fingerprint is not None:
+            self.fingerprints.append(fingerprint)
+        return self.learning_converged()
+
+    def learning_converged(self):
+        """
+        当前样本的最大簇是否已有learn_min_samples个样本、标准差不超过learn_max_std，
+        且包含绝大多数样本
+        """
+        if len(self.frequencies) < self.learn_min_samples:
+            return False
+        cluster_result = StreamingFrequencyClusterer(eps=30, min_samples=3).extend(self.frequencies)
+        return bool(cluster_result
+                    and cluster_result['cluster_size'] >= self.learn_min_samples
+                    and cluster_result['std_deviation'] <= self.learn_max_std
+                    and cluster_result['cluster_ratio'] >= 0.8)
+
+    def finish_learning(self):
+        """
+        结束学习：聚类得到杯子频率，学习指纹，更新匹配器并保存档案
+
+        Returns:
+            dict: 'cup_number'、'frequency'、'std'、'samples'、'fallback'（是否使用回退算法）；
+                  没有样本时'frequency'为None
+        """
+        cup_number = self.learning_cup
+        frequencies = self.frequencies
+        fingerprints = self.fingerprints
+        self.learning_cup = None
+        self.frequencies = []
+        self.fingerprints = []
+        result = {'cup_number': cup_number, 'frequency': None, 'std': None,
+                  'samples': len(frequencies), 'fallback': False}
+        if cup_number is None or not frequencies:
+            return result
+
+        # 使用DBSCAN聚类算法
+        cluster_result = None
+        if len(frequencies) >= 3:
+            cluster_result = StreamingFrequencyClusterer(eps=30, min_samples=3).extend(frequencies)
+
+        if cluster_result:
+            # 使用聚类结果
+            learned_freq = cluster_result['mean_frequency']
+            learned_std = cluster_result['std_deviation']
+            self.location[cup_number - 1] = learned_freq
+            self.location_stds[cup_number - 1] = learned_std
+            # 只用属于该簇的敲击学习指纹
+            window = 30 + 2 * learned_std
+            fingerprints = [fp for fp in fingerprints if abs(fp[0] - learned_freq) <= window]
+            self.fingerprint_matcher.learn(cup_number - 1, fingerprints)
+            samples = [f for f in frequencies if abs(f - learned_freq) <= window]
+            self._save_profile(cup_number, samples, fingerprints)
+            result.update(frequency=learned_freq, std=learned_std)
+        else:
+            # 回退到原始算法
+            freq_mode = self.seekingMode(frequencies)
+            if freq_mode:
+                self.location[cup_number - 1] = freq_mode[0]
+                self.location_stds[cup_number - 1] = 20.0  # 默认标准差
+                self._save_profile(cup_number, [freq_mode[0]], None)
+                result.update(frequency=freq_mode[0], std=20.0)
+            result['fallback'] = True
+        self.cup_matcher.set_cups(self.location, self.location_stds)
+        return result
+
+    def match(self, quality_info):
+        """
+        识别一条检测结果
+
+        Returns:
+            dict: 包含杯子索引、置信度、频率差等信息，格式同find_closest_cup_with_confidence
+        """
+        frequency = quality_info.get('frequency', 0)
+        fingerprint = quality_info.get('fingerprint')
+        if fingerprint is not None and len(self.fingerprint_matcher):
+            # 指纹最近邻匹配
+            match_result = self.fingerprint_matcher.match(fingerprint)
+            cup_index = match_result['cup_index']
+            match_result['frequency_diff'] = (
+                abs(self.location[cup_index] - frequency) if cup_index != -1 else float('inf'))
+            return match_result
+        # 使用优化的匹配算法
+        return self.cup_matcher.match(frequency)
+
+    def targets(self):
+        """
+        定向检测的目标（见DetectionPipeline.set_targets）
+
+        Returns:
+            tuple: (已学习杯子的频率, 动态容差, 杯子索引, 标准差)，均按频率排序，未学习时为空
+        """
+        matcher = self.cup_matcher
+        return matcher.freqs, matcher.tolerances, matcher.cup_indices, matcher.stds
+
+    def cups(self):
+        """
+        Returns:
+            list: 各杯子的(编号从1开始, 频率, 标准差)，未学习的频率为0
+        """
+        return [(i + 1, freq, std)
+                for i, (freq, std) in enumerate(zip(self.location, self.location_stds))]
+
+    def seekingMode(self, numList):
+        if not numList:
+            return []
+        uniqueList = list(set(numList))
+        frequencyDict = {num: numList.count(num) for num in uniqueList}
+        sortedDict = sorted(frequencyDict.items(), key=lambda item: item[1], reverse=True)
+        maxFrequency = sortedDict[0][1]
+        keys = [key for key, value in frequencyDict.items() if value == maxFrequency]
+        keys.sort()
+        return keys
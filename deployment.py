@@ -0,0 +1,115 @@
+"""
+部署配置
+不同场地（安静的实验室、有空调嗡声的大厅……）的采样率、帧长、帧移、窗函数、信号频段和质量门限
+写在JSON文件里，GUI、AudioWorker和检测服务按同一份配置构建检测流水线，
+换场地只需换配置文件，不用改代码重新调参。帧长越长频率分辨率越高、延迟越大，
+各组参数的CPU开销和分辨率可用 python benchmark.py --sweep 对比
+
+配置文件示例（未写的键使用默认值；帧移可写"hop_size"（采样点）或"overlap"（重叠比例））：
+    {
+        "chunk_size": 2048,
+        "overlap": 0.75,
+        "window": "hann",
+        "signal_band": [2800, 5000],
+        "min_bin_snr": 18.0,
+        "onset_threshold_db": 6.0
+    }
+"""
+import json
+
+from analysis_plan import WINDOWS, hop_from_overlap
+
+# 键与DetectionPipeline的同名参数对应
+DEFAULTS = {
+    'sample_rate': 12000,         # 采样率（Hz）
+    'chunk_size': 4096,           # FFT帧长（采样点）
+    'hop_size': None,             # 帧移（采样点），None为帧长的一半
+    'window': 'hamming',          # 窗函数（见analysis_plan.WINDOWS）
+    'signal_band': (2500, 6000),  # 信号频段（Hz）
+    'adaptive_snr': True,         # 估计噪声谱，按逐bin信噪比选峰和过滤
+    'min_bin_snr': 15.0,          # 逐bin信噪比门限（dB）
+    'min_snr': 5.0,               # 噪声谱估计可用前的频段信噪比门限（dB）
+    'min_target_snr': 15.0,       # 噪声谱估计可用前的定向检测信噪比门限（dB）
+    'noise_alpha': 0.05,          # 噪声谱上升时的指数平均系数
+    'noise_interval': 0.5,        # 噪声谱更新间隔（秒）
+    'onset_gate': True,           # 起振检测门控
+    'onset_threshold_db': 10.0,   # 起振能量需高于时域噪声基底的分贝数
+    'max_peaks': 1,               # 每帧最多检测的峰数（同时敲击的杯子数）
+    'zoom_factor': 4,             # 定向检测在峰值附近的细分倍数（频率间隔为bin间隔的1/zoom_factor）
+}
+
+
+def validate(options):
+    """
+    检查并规范化配置
+
+    Args:
+        options: 配置dict（可只含部分键，可用'overlap'代替'hop_size'）
+
+    Returns:
+        dict: 补全默认值后的配置
+
+    Raises:
+        ValueError: 未知的键或取值不合法
+    """
+    options = dict(options)
+    overlap = options.pop('overlap', None)
+    unknown = set(options) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"未知的配置项：{', '.join(sorted(unknown))}")
+    config = dict(DEFAULTS)
+    config.update(options)
+
+    sample_rate = config['sample_rate'] = int(config['sample_rate'])
+    chunk_size = config['chunk_size'] = int(config['chunk_size'])
+    if sample_rate <= 0:
+        raise ValueError(f"采样率须为正数：{sample_rate}")
+    # 定向检测按16倍降采样分块
+    if chunk_size < 256 or chunk_size % 16:
+        raise ValueError(f"帧长须为不小于256的16的倍数：{chunk_size}")
+    if overlap is not None:
+        if options.get('hop_size') is not None:
+            raise ValueError("hop_size与overlap只能指定一个")
+        config['hop_size'] = hop_from_overlap(chunk_size, float(overlap))
+    elif config['hop_size'] is None:
+        config['hop_size'] = chunk_size // 2
+    config['hop_size'] = int(config['hop_size'])
+    if not 0 < config['hop_size'] <= chunk_size:
+        raise ValueError(f"帧移须在(0, 帧长]内：{config['hop_size']}")
+    if config['window'] not in WINDOWS:
+        raise ValueError(f"未知窗函数：{config['window']}（可选{', '.join(WINDOWS)}）")
+
+    low, high = (float(f) for f in config['signal_band'])
+    if not 0 < low < high <= sample_rate / 2:
+        raise ValueError(f"信号频段不合法（须在0到采样率一半之间）：{config['signal_band']}")
+    config['signal_band'] = (low, high)
+    if not 0 < config['noise_alpha'] <= 1:
+        raise ValueError(f"noise_alpha须在(0, 1]内：{config['noise_alpha']}")
+    if config['noise_interval'] <= 0:
+        raise ValueError(f"noise_interval须为正数：{config['noise_interval']}")
+    config['max_peaks'] = int(config['max_peaks'])
+    if config['max_peaks'] < 1:
+        raise ValueError(f"max_peaks须为正整数：{config['max_peaks']}")
+    config['zoom_factor'] = int(config['zoom_factor'])
+    if config['zoom_factor'] < 1:
+        raise ValueError(f"zoom_factor须为正整数：{config['zoom_factor']}")
+    return config
+
+
+def load_deployment(path=None):
+    """
+    读取部署配置
+
+    Args:
+        path: JSON配置文件路径，None时使用默认配置
+
+    Returns:
+        dict: 可直接作为DetectionPipeline关键字参数的配置
+    """
+    if path is None:
+        return validate({})
+    with open(path, 'r', encoding='utf-8') as f:
+        options = json.load(f)
+    if not isinstance(options, dict):
+        raise ValueError(f"部署配置须为JSON对象：{path}")
+    return validate(options)
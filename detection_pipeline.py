@@ -0,0 +1,547 @@
+"""
+检测流水线（不依赖Qt）
+环形缓冲 -> 起振门控 -> 单帧频谱分析 -> 质量过滤 -> 序贯判决（或固定批次的流式聚类），
+AudioWorker、多通道进程池等都复用同一套逐帧处理逻辑。
+设置了目标频率（已学习的杯子）时，频谱分析改用定向检测，只计算各杯子附近的能量。
+max_peaks大于1时每帧取多个互不成谐波关系的峰，各峰分别跟踪和判决（多个杯子同时敲击）
+"""
+import math
+import time
+
+import numpy as np
+
+from audio_processor import AudioProcessor, select_distinct_peaks
+from noise_estimator import NoiseSpectrumEstimator
+from onset_detector import OnsetDetector
+from peak_tracker import PeakTracker
+from ring_buffer import FrameRingBuffer
+from sequential_decision import SequentialDecider
+from stream_cluster import StreamingFrequencyClusterer
+from targeted_detector import TargetedDetector
+
+
+def decided_results(result):
+    """
+    process()结果中满足判决条件的各峰
+
+    Args:
+        result: DetectionPipeline.process()的返回值（可为None）
+
+    Returns:
+        list: 'quality'不为None的结果dict；单峰模式下至多一个（即result本身），
+              多峰模式下为result['peaks']中已判决的峰，按强度从大到小
+    """
+    if result is None:
+        return []
+    peaks = result.get('peaks')
+    if peaks is None:
+        return [result] if result['quality'] is not None else []
+    return [peak for peak in peaks if peak['quality'] is not None]
+
+
+class DetectionPipeline:
+    """单通道逐帧检测"""
+
+    def __init__(self, sample_rate=12000, chunk_size=4096, hop_size=None, onset_gate=True,
+                 min_snr=5.0, signal_band=(2500, 6000), batch_size=25, with_fingerprint=True,
+                 metrics=None, min_target_snr=15.0, decision='sequential', adaptive_snr=True,
+                 min_bin_snr=15.0, noise_alpha=0.05, noise_interval=0.5, onset_threshold_db=10.0,
+                 window='hamming', max_peaks=1, zoom_factor=4):
+        """
+        Args:
+            sample_rate: 采样率
+            chunk_size: FFT帧长
+            hop_size: 帧移（采样点），默认为帧长的一半
+            onset_gate: 是否启用起振检测门控
+            min_snr: 最小信噪比（dB，信号频段相对低频段的功率比），噪声谱估计可用前使用
+            signal_band: 信号频段 (min_freq, max_freq)（Hz），峰值频率须落在其中
+            batch_size: 'batch'判决方式下累计多少个有效频率后重新开始聚类
+            with_fingerprint: 是否为通过质量过滤的帧计算频谱指纹
+            metrics: 性能指标（metrics.PipelineMetrics），None时不计时
+            min_target_snr: 定向检测时的最小信噪比（dB，峰值相对平均每bin功率，
+                            纯噪声约8 dB）
+            decision: 'sequential'为滑动窗口序贯判决（满足条件立即上报），
+                      'batch'为原来的固定批次聚类
+            adaptive_snr: 是否估计噪声谱，按逐bin信噪比选峰和过滤
+            min_bin_snr: 逐bin信噪比门限（dB，峰值bin功率相对该处噪声功率；
+                         纯噪声帧频段内最大值约8~10 dB）
+            noise_alpha: 噪声谱上升时的指数平均系数
+            noise_interval: 噪声谱更新间隔（秒），只用起振门控跳过的静音帧更新
+            onset_threshold_db: 起振能量需高于时域噪声基底的分贝数
+            window: 分析窗函数（见analysis_plan.WINDOWS），定向检测使用同一个窗
+            max_peaks: 每帧最多检测的峰数（同时敲击的杯子数），大于1时各峰按频率连成轨迹、
+                       各自序贯判决（须为'sequential'判决方式）
+            zoom_factor: 定向检测在峰值附近的细分倍数，频率间隔为采样率/帧长/zoom_factor
+                         （默认4，12 kHz、4096点时约0.73 Hz）
+        """
+        if decision not in ('sequential', 'batch'):
+            raise ValueError(f"未知判决方式：{decision}")
+        if max_peaks < 1 or (max_peaks > 1 and decision != 'sequential'):
+            raise ValueError(f"max_peaks须为正整数，大于1时须使用序贯判决：{max_peaks}")
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.hop_size = hop_size or chunk_size // 2
+        self.min_snr = min_snr
+        self.signal_band = (float(signal_band[0]), float(signal_band[1]))
+        self.min_bin_snr = min_bin_snr
+        self.batch_size = batch_size
+        self.with_fingerprint = with_fingerprint
+        self.metrics = metrics
+        self.min_target_snr = min_target_snr
+        self.zoom_factor = int(zoom_factor)
+        # 定向检测器，可由其他线程通过set_targets()整体替换，process()每帧只读取一次
+        self.targeted_detector = None
+        # 预分配的环形缓冲区，每次读取一个帧移，帧内全部为真实信号
+        self.ring_buffer = FrameRingBuffer(chunk_size, self.hop_size)
+        self.audio_processor = AudioProcessor(sample_rate=sample_rate, chunk_size=chunk_size,
+                                              window=window)
+        # 噪声谱估计器：静音帧按间隔做一次FFT更新，敲击帧复用自己的频谱
+        self.noise_estimator = None
+        if adaptive_snr:
+            self.noise_estimator = NoiseSpectrumEstimator(
+                self.audio_processor.freqs, signal_band=self.signal_band, alpha=noise_alpha)
+        self._noise_hops = max(1, int(round(noise_interval * sample_rate / self.hop_size)))
+        self._next_noise_update = 0
+        # 连续多少个帧移处于背景噪声：整帧都是背景噪声时才用于更新噪声谱，
+        # 避免敲击余振混入（余振集中在杯子频率上，会明显抬高这些bin的噪声估计）
+        self._quiet_hops = 0
+        self._hops_per_frame = -(-chunk_size // self.hop_size)
+        # 起振检测器：静音帧跳过FFT
+        self.onset_detector = None
+        if onset_gate:
+            self.onset_detector = OnsetDetector(sample_rate, self.hop_size,
+                                                threshold_db=onset_threshold_db)
+        # 流式聚类器，每次检测后即可给出当前簇
+        self.frequency_clusterer = StreamingFrequencyClusterer(eps=30, min_samples=3)
+        self.data2 = []
+        # 序贯判决器，按帧移计数换算的时间维护滑动窗口
+        self.decider = SequentialDecider(eps=30, min_samples=3) if decision == 'sequential' else None
+        # 多峰模式：每个峰一条轨迹，各自一个序贯判决器
+        self.max_peaks = int(max_peaks)
+        self.peak_tracker = None
+        if self.max_peaks > 1:
+            self.peak_tracker = PeakTracker(eps=30, max_tracks=2 * self.max_peaks,
+                                            min_samples=3)
+        self._hops = 0
+
+    def set_targets(self, frequencies, tolerances, cup_indices=None, stds=None):
+        """
+        设置目标频率，之后改用定向检测（不计算完整频谱和指纹），
+        序贯判决同时启用候选杯子间的概率比检验
+
+        Args:
+            frequencies: 各杯子的学习频率（Hz），为空时等同clear_targets()
+            tolerances: 各杯子的频率容差（Hz）
+            cup_indices: 各目标对应的杯子索引，默认为0..n-1
+            stds: 各杯子的频率标准差（Hz），None时不启用概率比检验
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64).ravel()
+        if not len(frequencies):
+            self.clear_targets()
+            return
+        self.targeted_detector = TargetedDetector(
+            frequencies, tolerances, sample_rate=self.sample_rate, chunk_size=self.chunk_size,
+            window=self.audio_processor.window, zoom_factor=self.zoom_factor,
+            cup_indices=cup_indices)
+        for decider in (self.decider, self.peak_tracker):
+            if decider is None:
+                continue
+            if stds is None:
+                decider.clear_cups()
+            else:
+                decider.set_cups(frequencies, stds, cup_indices)
+
+    def clear_targets(self):
+        """恢复完整FFT分析（学习阶段使用）"""
+        self.targeted_detector = None
+        for decider in (self.decider, self.peak_tracker):
+            if decider is not None:
+                decider.clear_cups()
+
+    def process(self, audio_chunk):
+        """
+        处理一个帧移的采样数据
+
+        Args:
+            audio_chunk: 一维采样数组
+
+        Returns:
+            dict: 当前帧通过质量过滤时返回
+                  'frequency'为要上报的频率（批次结束时为簇均值），
+                  'raw_frequency'为本帧频率，'snr'为本帧信噪比，
+                  'quality'为簇质量信息（尚未成簇或尚未满足判决条件时为None），
+                  启用指纹时另含本帧的'fingerprint'；
+                  定向检测时另含'cup_energies'（各目标的峰值功率）和
+                  'target_cup'（能量最大的杯子索引），不含指纹；
+                  多峰模式下另含'peaks'：本帧各峰的同格式结果（按强度从大到小，
+                  含轨迹编号'track'，只有一个峰时才计算指纹），顶层字段与最强的峰相同，
+                  已判决的峰用decided_results()取出；
+                  否则返回None
+        """
+        self._hops += 1
+        if not self.ring_buffer.push(audio_chunk):
+            if self.onset_detector is not None:
+                self.onset_detector.update(audio_chunk)
+            return None
+        # 每个帧移都更新起振检测器（维护噪声基底），非敲击窗口内跳过FFT
+        if self.onset_detector is not None and not self.onset_detector.update(audio_chunk):
+            self._quiet_hops = self._quiet_hops + 1 if self.onset_detector.quiet() else 0
+            if (self.noise_estimator is not None and self._hops >= self._next_noise_update
+                    and self._quiet_hops >= self._hops_per_frame):
+                # 到达更新间隔的静音帧用于更新噪声谱
+                self._update_noise(
+                    self.audio_processor.compute_spectrum(self.ring_buffer.frame()))
+            else:
+                self.ring_buffer.skip()
+            return None
+
+        self._quiet_hops = 0
+        metrics = self.metrics
+        t_start = t_prev = None
+        if metrics is not None:
+            t_start = time.perf_counter()
+
+        targeted_detector = self.targeted_detector
+        if targeted_detector is not None:
+            return self._process_targeted(targeted_detector, t_start)
+
+        # 单次FFT完成频率提取和信噪比计算（直接使用环形缓冲区视图）
+        audio_frame = self.ring_buffer.frame()
+        spectrum = self.audio_processor.compute_spectrum(audio_frame)
+        if self.peak_tracker is not None:
+            return self._process_peaks(audio_frame, spectrum, t_start)
+        estimator = self.noise_estimator
+        adaptive = estimator is not None and estimator.ready
+        if adaptive:
+            # 按逐bin信噪比在信号频段内选峰，稳定的嗡声谐波不会被选中
+            peak_index, snr = estimator.peak(spectrum.power, self.min_bin_snr)
+            freq_info = self.audio_processor.extract_frequency_with_harmonics(
+                audio_frame, frame=spectrum, peak_index=peak_index)
+        else:
+            freq_info = self.audio_processor.extract_frequency_with_harmonics(
+                audio_frame, frame=spectrum)
+        f_max = freq_info['frequency']
+        if metrics is not None:
+            t_fft = time.perf_counter()
+            metrics.fft.observe(t_fft - t_start)
+        if adaptive:
+            min_snr = self.min_bin_snr
+        else:
+            snr = self.audio_processor.calculate_snr(
+                audio_frame, signal_freq_range=self.signal_band, frame=spectrum)
+            min_snr = self.min_snr
+        if metrics is not None:
+            t_prev = time.perf_counter()
+            metrics.snr.observe(t_prev - t_fft)
+
+        # 只处理高质量信号
+        if not (self.signal_band[0] < f_max <= self.signal_band[1] and snr > min_snr):
+            self._reject(spectrum, t_start, t_prev)
+            return None
+
+        fingerprint = None
+        if self.with_fingerprint:
+            fingerprint = self.audio_processor.extract_fingerprint(
+                audio_frame, frame=spectrum, freq_info=freq_info)
+            if metrics is not None:
+                t_fp = time.perf_counter()
+                metrics.fingerprint.observe(t_fp - t_prev)
+                t_prev = t_fp
+
+        return self._update_cluster(f_max, snr, fingerprint, None, t_start, t_prev)
+
+    def _reject(self, spectrum, t_start, t_prev):
+        """本帧没有通过质量过滤"""
+        if (self.noise_estimator is not None and self.onset_detector is None
+                and self._hops >= self._next_noise_update):
+            # 没有起振门控时，用未通过过滤的帧更新噪声谱（复用本帧频谱）
+            self._update_noise(spectrum)
+        if self.metrics is not None:
+            self.metrics.frame.observe(t_prev - t_start)
+
+    def _process_peaks(self, audio_frame, spectrum, t_start):
+        """多峰检测：信号频段内互不成谐波关系的前max_peaks个峰分别过滤、跟踪和判决"""
+        processor = self.audio_processor
+        estimator = self.noise_estimator
+        metrics = self.metrics
+        t_prev = None
+        adaptive = estimator is not None and estimator.ready
+        # 有噪声谱时只在逐bin信噪比超过门限的bin中选峰，稳定的嗡声谐波不占名额
+        allowed = estimator.above(spectrum.power, self.min_bin_snr) if adaptive else None
+        peak_bins, positions = processor.find_peaks(
+            spectrum.magnitude, self.signal_band, self.max_peaks, allowed=allowed)
+        frequencies = positions * (processor.sample_rate / processor.chunk_size)
+        if metrics is not None:
+            t_fft = time.perf_counter()
+            metrics.fft.observe(t_fft - t_start)
+        if adaptive:
+            snrs = [estimator.bin_snr(spectrum.power, index) for index in peak_bins.tolist()]
+            min_snr = self.min_bin_snr
+        else:
+            # 没有噪声谱时各峰共用整帧的频段信噪比，弱峰由find_peaks的相对幅度门限排除
+            snrs = [processor.calculate_snr(audio_frame, signal_freq_range=self.signal_band,
+                                            frame=spectrum)] * len(peak_bins)
+            min_snr = self.min_snr
+        if metrics is not None:
+            t_prev = time.perf_counter()
+            metrics.snr.observe(t_prev - t_fft)
+
+        low, high = self.signal_band
+        peaks = [(i, float(frequencies[i]), snrs[i]) for i in range(len(peak_bins))
+                 if low < frequencies[i] <= high and snrs[i] > min_snr]
+        if not peaks:
+            self._reject(spectrum, t_start, t_prev)
+            return None
+
+        fingerprint = None
+        if self.with_fingerprint and len(peaks) == 1:
+            # 衰减率和频谱质心按整帧计算，几个杯子混在一起时没有意义
+            freq_info = processor.extract_frequency_with_harmonics(
+                audio_frame, frame=spectrum, peak_index=peak_bins[peaks[0][0]])
+            fingerprint = processor.extract_fingerprint(
+                audio_frame, frame=spectrum, freq_info=freq_info)
+            if metrics is not None:
+                t_fp = time.perf_counter()
+                metrics.fingerprint.observe(t_fp - t_prev)
+                t_prev = t_fp
+        return self._update_tracks([(frequency, snr, fingerprint, None)
+                                    for _, frequency, snr in peaks], t_start, t_prev)
+
+    def _process_targeted(self, targeted_detector, t_start):
+        """
+        定向检测：只分析各杯子频率附近，不计算完整频谱和指纹
+        峰值附近按采样率/帧长/zoom_factor的间隔细分，频率网格比完整FFT的bin间隔细zoom_factor倍
+        """
+        analysis = targeted_detector.analyze(self.ring_buffer.frame())
+        if self.peak_tracker is not None:
+            return self._process_targeted_peaks(targeted_detector, analysis, t_start)
+        estimator = self.noise_estimator
+        if estimator is not None and estimator.ready:
+            # 定向检测的bin功率与完整FFT同一量纲，直接与噪声谱比较
+            snr = estimator.snr_at(analysis['frequency'], analysis['amplitude'] ** 2)
+            min_snr = self.min_bin_snr
+        else:
+            snr = analysis['snr']
+            min_snr = self.min_target_snr
+        metrics = self.metrics
+        t_prev = None
+        if metrics is not None:
+            t_prev = time.perf_counter()
+            metrics.fft.observe(t_prev - t_start)
+        if snr <= min_snr:
+            if metrics is not None:
+                metrics.frame.observe(t_prev - t_start)
+            return None
+        targets = {'cup_energies': analysis['energies'],
+                   'target_cup': analysis['cup_index']}
+        return self._update_cluster(analysis['frequency'], snr, None, targets, t_start, t_prev)
+
+    def _process_targeted_peaks(self, targeted_detector, analysis, t_start):
+        """多峰定向检测：各杯子容差范围内的峰分别过滤、跟踪和判决"""
+        energies = analysis['energies']
+        frequencies = analysis['frequencies']
+        estimator = self.noise_estimator
+        if estimator is not None and estimator.ready:
+            snrs = [estimator.snr_at(f, e) for f, e in zip(frequencies.tolist(), energies.tolist())]
+            min_snr = self.min_bin_snr
+        else:
+            snrs = analysis['snrs'].tolist()
+            min_snr = self.min_target_snr
+        metrics = self.metrics
+        t_prev = None
+        if metrics is not None:
+            t_prev = time.perf_counter()
+            metrics.fft.observe(t_prev - t_start)
+        # analyze()选出的杯子优先（容差范围重叠时中心频率最接近峰值的），其余按能量从大到小
+        order = [analysis['target']] + [int(i) for i in np.argsort(energies)[::-1]
+                                        if i != analysis['target']]
+        order = [i for i in order if snrs[i] > min_snr]
+        if not order:
+            if metrics is not None:
+                metrics.frame.observe(t_prev - t_start)
+            return None
+        selected = select_distinct_peaks(frequencies[order], self.max_peaks)
+        cup_indices = targeted_detector.cup_indices
+        return self._update_tracks(
+            [(float(frequencies[order[k]]), snrs[order[k]], None,
+              {'cup_energies': energies, 'target_cup': cup_indices[order[k]]})
+             for k in selected], t_start, t_prev)
+
+    def _update_tracks(self, peaks, t_start, t_prev):
+        """
+        把本帧通过质量过滤的各峰加入峰值跟踪，组装结果
+
+        Args:
+            peaks: [(频率, 信噪比, 指纹或None, 定向检测字段或None), ...]，按强度从大到小
+        """
+        decisions = self.peak_tracker.update(
+            [frequency for frequency, _, _, _ in peaks],
+            self._hops * self.hop_size / self.sample_rate)
+        metrics = self.metrics
+        if metrics is not None:
+            t_cluster = time.perf_counter()
+            metrics.cluster.observe(t_cluster - t_prev)
+            metrics.frame.observe(t_cluster - t_start)
+            metrics.detections += 1
+        results = []
+        for (frequency, snr, fingerprint, targets), (track_id, decision) in zip(peaks, decisions):
+            peak = self._decision_result(frequency, snr, fingerprint, targets, decision)
+            peak['track'] = track_id
+            results.append(peak)
+        result = dict(results[0])
+        result['peaks'] = results
+        return result
+
+    def _update_cluster(self, f_max, snr, fingerprint, targets, t_start, t_prev):
+        """把通过质量过滤的一帧加入聚类，组装结果"""
+        if self.decider is not None:
+            return self._update_decision(f_max, snr, fingerprint, targets, t_start, t_prev)
+        metrics = self.metrics
+        raw_frequency = f_max
+        self.data2.append(f_max)
+
+        # 增量更新聚类，簇形成后每次检测都给出稳定结果
+        quality_info = None
+        cluster_result = self.frequency_clusterer.add(f_max)
+        if metrics is not None:
+            t_cluster = time.perf_counter()
+            metrics.cluster.observe(t_cluster - t_prev)
+            metrics.frame.observe(t_cluster - t_start)
+            metrics.detections += 1
+        if cluster_result:
+            quality_info = {
+                'frequency': cluster_result['mean_frequency'],
+                'snr': snr,
+                'cluster_size': cluster_result['cluster_size'],
+                'std': cluster_result['std_deviation']
+            }
+            if fingerprint is not None:
+                quality_info['fingerprint'] = fingerprint
+            if targets is not None:
+                quality_info.update(targets)
+
+        if len(self.data2) > self.batch_size:
+            if cluster_result:
+                f_max = cluster_result['mean_frequency']
+            else:
+                # 回退到原始算法
+                freq_mode = self.seekingMode(self.data2)
+                if freq_mode:
+                    f_max = freq_mode[0]
+                quality_info = {'frequency': f_max, 'snr': snr}
+
+            self.data2 = []
+            self.frequency_clusterer.reset()
+
+        result = {
+            'frequency': f_max,
+            'raw_frequency': raw_frequency,
+            'snr': snr,
+            'quality': quality_info
+        }
+        if fingerprint is not None:
+            result['fingerprint'] = fingerprint
+        if targets is not None:
+            result.update(targets)
+        return result
+
+    def _update_decision(self, f_max, snr, fingerprint, targets, t_start, t_prev):
+        """序贯判决：滑动窗口内最新敲击的簇满足判决条件时立即上报，不清空窗口"""
+        decision = self.decider.add(f_max, self._hops * self.hop_size / self.sample_rate)
+        metrics = self.metrics
+        if metrics is not None:
+            t_cluster = time.perf_counter()
+            metrics.cluster.observe(t_cluster - t_prev)
+            metrics.frame.observe(t_cluster - t_start)
+            metrics.detections += 1
+        return self._decision_result(f_max, snr, fingerprint, targets, decision)
+
+    def _decision_result(self, f_max, snr, fingerprint, targets, decision):
+        """按一个峰的序贯判决结果组装结果dict"""
+        quality_info = None
+        frequency = f_max
+        if decision['decided']:
+            frequency = decision['frequency']
+            quality_info = {
+                'frequency': frequency,
+                'snr': snr,
+                'cluster_size': decision['cluster_size'],
+                'std': decision['std'],
+                'decision': decision['method']
+            }
+            if decision['llr'] is not None:
+                quality_info['decided_cup'] = decision['cup_index']
+                quality_info['llr'] = decision['llr']
+            if fingerprint is not None:
+                quality_info['fingerprint'] = fingerprint
+            if targets is not None:
+                quality_info.update(targets)
+
+        result = {
+            'frequency': frequency,
+            'raw_frequency': f_max,
+            'snr': snr,
+            'quality': quality_info
+        }
+        if fingerprint is not None:
+            result['fingerprint'] = fingerprint
+        if targets is not None:
+            result.update(targets)
+        return result
+
+    def skip_hops(self, count):
+        """
+        跳过count个没有音频的帧移（如会话录制中丢失的块）
+
+        帧移计数照常前进，判决窗口、峰值轨迹和噪声谱更新间隔按实际时间推进；
+        环形缓冲区清空（重新填满前不分析），起振检测结束当前分析窗口，噪声谱和噪声基底保留
+
+        Args:
+            count: 丢失的帧移数
+
+        Returns:
+            int: 之后多少个帧移的结果仍可能受缺口影响（环形缓冲区重新填满，
+                 且缺口中的样本已移出判决窗口）
+        """
+        if count <= 0:
+            return 0
+        self._hops += count
+        self.ring_buffer.reset()
+        self._quiet_hops = 0
+        if self.onset_detector is not None:
+            self.onset_detector.interrupt()
+        max_age = 0.0
+        if self.decider is not None:
+            max_age = self.decider.max_age
+        elif self.peak_tracker is not None:
+            max_age = self.peak_tracker.max_age
+        return self._hops_per_frame + int(math.ceil(max_age * self.sample_rate / self.hop_size))
+
+    def _update_noise(self, spectrum):
+        self.noise_estimator.update(spectrum.power)
+        self._next_noise_update = self._hops + self._noise_hops
+
+    def stats(self):
+        """
+        流水线统计
+
+        Returns:
+            dict: 起振检测统计、噪声谱估计统计（未启用的不含）
+        """
+        stats = {}
+        if self.onset_detector is not None:
+            stats['onset'] = self.onset_detector.stats()
+        if self.noise_estimator is not None:
+            stats['noise'] = self.noise_estimator.stats()
+        return stats
+
+    def seekingMode(self, numList):
+        if not numList:
+            return []
+        uniqueList = list(set(numList))
+        frequencyDict = {num: numList.count(num) for num in uniqueList}
+        sortedDict = sorted(frequencyDict.items(), key=lambda item: item[1], reverse=True)
+        maxFrequency = sortedDict[0][1]
+        keys = [key for key, value in frequencyDict.items() if value == maxFrequency]
+        keys.sort()
+        return keys
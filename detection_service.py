@@ -0,0 +1,606 @@
+"""
+无界面检测服务
+不依赖Qt：采集 -> DetectionPipeline -> CupDetector学习/识别，
+识别结果通过本地套接字（TCP或Unix域）批量推送给任意多个订阅者
+
+协议（客户端 -> 服务，每行一个JSON命令，可带"id"用于对应回复）：
+    {"cmd": "subscribe", "format": "json" | "binary"}   订阅识别结果
+    {"cmd": "unsubscribe"}
+    {"cmd": "detect"}                                    进入识别模式
+    {"cmd": "idle"}                                      停止识别
+    {"cmd": "learn", "cup": 3, "duration": 2.0}          学习3号杯子（最长2秒，样本稳定后提前结束）
+    {"cmd": "cups"} / {"cmd": "status"}                  查询
+
+服务 -> 客户端：
+    json格式：每行一个JSON对象，"type"为"detections"（"items"为一批结果）、
+              "reply"（命令回复）或"learned"（学习完成事件，发给所有客户端）
+    binary格式：每条消息为FRAME_HEADER（类型1字节 + 负载长度4字节）+ 负载，
+              MSG_DETECTIONS的负载为DETECTION_DTYPE记录数组，MSG_JSON的负载为UTF-8 JSON
+
+用法：
+    python detection_service.py serve --tcp 127.0.0.1:9200 --tone 3000,3400
+    python detection_service.py client --tcp 127.0.0.1:9200 --send '{"cmd": "detect"}'
+"""
+import argparse
+import json
+import math
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from analysis_plan import format_description
+from audio_source import PyAudioSource, ToneSource, WavFileSource
+from cup_detector import CupDetector
+from deployment import load_deployment
+from detection_pipeline import DetectionPipeline, decided_results
+from frame_queue import FrameQueue, DROP_OLDEST
+from session_log import SessionRecorder
+
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+
+# 二进制消息头：类型（1字节）+ 负载长度（4字节）
+FRAME_HEADER = struct.Struct('<BI')
+MSG_DETECTIONS = 1
+MSG_JSON = 2
+
+# 二进制识别结果记录（每条28字节）
+DETECTION_DTYPE = np.dtype([
+    ('timestamp', '<f8'),       # Unix时间戳（读到该帧移的时刻）
+    ('cup_index', '<i2'),       # 杯子索引（从0开始），-1为未匹配
+    ('cluster_size', '<i2'),
+    ('frequency', '<f4'),       # 簇频率（Hz）
+    ('snr', '<f4'),             # 信噪比（dB）
+    ('confidence', '<f4'),
+    ('frequency_diff', '<f4'),  # 与匹配杯子的频率差（Hz），未匹配时为inf
+])
+
+
+def encode_json(obj, fmt):
+    """按客户端格式编码一条JSON消息"""
+    data = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    if fmt == FORMAT_BINARY:
+        return FRAME_HEADER.pack(MSG_JSON, len(data)) + data
+    return data + b'\n'
+
+
+def encode_detections(records, fmt):
+    """
+    按客户端格式编码一批识别结果
+
+    Args:
+        records: DETECTION_DTYPE记录数组
+        fmt: FORMAT_JSON或FORMAT_BINARY
+
+    Returns:
+        bytes: 编码后的消息
+    """
+    if fmt == FORMAT_BINARY:
+        payload = records.tobytes()
+        return FRAME_HEADER.pack(MSG_DETECTIONS, len(payload)) + payload
+    items = []
+    for record in records.tolist():
+        item = dict(zip(DETECTION_DTYPE.names, record))
+        if math.isinf(item['frequency_diff']):
+            item['frequency_diff'] = None
+        items.append(item)
+    return encode_json({'type': 'detections', 'items': items}, fmt)
+
+
+def parse_address(tcp=None, unix=None):
+    """命令行地址转为(host, port)元组或Unix套接字路径"""
+    if unix:
+        return unix
+    host, _, port = (tcp or '127.0.0.1:9200').rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _Client:
+    """一个已连接的客户端：有界发送队列 + 独立发送线程，慢消费者只丢自己的旧消息"""
+
+    def __init__(self, sock, queue_size):
+        self.sock = sock
+        self.format = FORMAT_JSON
+        self.subscribed = False
+        self.queue = FrameQueue(queue_size, DROP_OLDEST)
+        self._thread = threading.Thread(target=self._send_loop, daemon=True)
+        self._thread.start()
+
+    def send(self, data):
+        self.queue.put(data)
+
+    def _send_loop(self):
+        while True:
+            data = self.queue.get(timeout=0.5)
+            if data is None:
+                if self.queue.closed:
+                    break
+                continue
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.queue.close()
+                break
+
+    def close(self):
+        self.queue.close()
+
+
+class DetectionService:
+    """
+    无界面检测服务
+
+    采集线程逐帧处理并把识别结果放入待发送列表；
+    发送线程最多等待batch_interval秒（或攒够max_batch条）后，
+    每种格式只编码一次，再放入各订阅者的发送队列。
+    """
+
+    def __init__(self, source, address, detector=None, hop_size=2048, chunk_size=4096,
+                 onset_gate=True, min_snr=5.0, batch_interval=0.01, max_batch=64,
+                 client_queue_size=256, pipeline_options=None, record_path=None):
+        """
+        Args:
+            source: 音频源（见audio_source）
+            address: (host, port)为TCP，字符串为Unix套接字路径
+            detector: CupDetector，None时新建（不持久化）
+            hop_size: 帧移（采样点）
+            chunk_size: FFT帧长
+            onset_gate: 是否启用起振检测门控
+            min_snr: 最小信噪比（dB）
+            batch_interval: 识别结果最长攒批时间（秒）
+            max_batch: 每批最多条数
+            client_queue_size: 每个客户端发送队列容量（消息数），满时丢弃最旧消息
+            pipeline_options: 其他DetectionPipeline参数（如deployment.load_deployment()的结果），
+                              优先于hop_size、chunk_size、onset_gate和min_snr；
+                              采样率以音频源为准
+            record_path: 会话录制文件路径（见session_log），None为不录制
+        """
+        self.source = source
+        self.address = address
+        self.detector = detector or CupDetector()
+        options = {'onset_gate': onset_gate, 'min_snr': min_snr,
+                   'chunk_size': chunk_size, 'hop_size': hop_size}
+        options.update(pipeline_options or {})
+        options['sample_rate'] = source.sample_rate
+        self.pipeline = DetectionPipeline(**options)
+        self.hop_size = self.pipeline.hop_size
+        self.recorder = None
+        if record_path:
+            self.recorder = SessionRecorder(
+                record_path, source.sample_rate, self.pipeline.chunk_size, self.hop_size,
+                metadata={'pipeline': options, 'source': type(source).__name__})
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self.client_queue_size = client_queue_size
+        self.mode = 'idle'
+        self.published = 0
+        self._learn_deadline = None
+        self._lock = threading.RLock()
+        self._clients = set()
+        self._pending = []
+        self._pending_cond = threading.Condition()
+        self._running = False
+        self._server = None
+        self._threads = []
+
+    # ---- 套接字服务 ----
+
+    def _make_server(self):
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                if self.request.family != socket.AF_UNIX:
+                    # 识别结果是小消息，关闭Nagle算法避免攒包延迟
+                    self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                client = _Client(self.request, service.client_queue_size)
+                with service._lock:
+                    service._clients.add(client)
+                try:
+                    for line in self.rfile:
+                        line = line.strip()
+                        if line:
+                            reply = service.handle_command(client, line)
+                            client.send(encode_json(reply, client.format))
+                except OSError:
+                    pass
+                finally:
+                    with service._lock:
+                        service._clients.discard(client)
+                    client.close()
+
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            return _UnixServer(self.address, Handler)
+        return _TCPServer(self.address, Handler)
+
+    @property
+    def bound_address(self):
+        """实际监听的地址（TCP端口为0时由系统分配）"""
+        return self._server.server_address if self._server is not None else self.address
+
+    def handle_command(self, client, line):
+        """
+        执行一条客户端命令
+
+        Args:
+            client: 发出命令的客户端
+            line: 一行JSON（bytes或str）
+
+        Returns:
+            dict: 回复
+        """
+        try:
+            command = json.loads(line)
+            cmd = command['cmd']
+        except (ValueError, KeyError, TypeError) as e:
+            return {'type': 'reply', 'ok': False, 'error': f"无效命令：{e}"}
+        reply = {'type': 'reply', 'ok': True, 'cmd': cmd}
+        if 'id' in command:
+            reply['id'] = command['id']
+        try:
+            with self._lock:
+                if cmd == 'subscribe':
+                    fmt = command.get('format', FORMAT_JSON)
+                    if fmt not in (FORMAT_JSON, FORMAT_BINARY):
+                        raise ValueError(f"未知格式：{fmt}")
+                    client.format = fmt
+                    client.subscribed = True
+                elif cmd == 'unsubscribe':
+                    client.subscribed = False
+                elif cmd == 'detect':
+                    self._set_mode('detection')
+                elif cmd == 'idle':
+                    self._set_mode('idle')
+                elif cmd == 'learn':
+                    cup = int(command['cup'])
+                    duration = float(command.get('duration', 2.0))
+                    self.detector.start_learning(cup)
+                    self.pipeline.clear_targets()
+                    if self.recorder is not None:
+                        self.recorder.event('learn', cup=cup)
+                    self.mode = f"learning_{cup}"
+                    self._learn_deadline = time.monotonic() + duration
+                elif cmd == 'cups':
+                    reply['cups'] = self.detector.cups()
+                elif cmd == 'status':
+                    reply.update(self.status())
+                else:
+                    raise ValueError(f"未知命令：{cmd}")
+        except (ValueError, KeyError, TypeError) as e:
+            reply['ok'] = False
+            reply['error'] = str(e)
+        return reply
+
+    def _set_mode(self, mode):
+        # 切换模式时放弃未完成的学习
+        if self.mode.startswith('learning_'):
+            self.detector.cancel_learning()
+        self._learn_deadline = None
+        self.mode = mode
+        # 检测模式只分析已学习杯子附近的频率，其余模式使用完整FFT
+        if mode == 'detection':
+            self.pipeline.set_targets(*self.detector.targets())
+        else:
+            self.pipeline.clear_targets()
+        if self.recorder is not None:
+            if mode == 'detection':
+                self.recorder.snapshot(self.detector)
+            self.recorder.event('detect' if mode == 'detection' else 'idle')
+
+    def status(self):
+        """
+        Returns:
+            dict: 当前模式、客户端数、已推送条数、流水线和音频源统计
+        """
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'clients': len(self._clients),
+                'subscribers': sum(1 for c in self._clients if c.subscribed),
+                'published': self.published,
+                'pipeline': self.pipeline.stats(),
+                'source': self.source.stats()
+            }
+
+    def broadcast(self, obj):
+        """向所有客户端发送一条JSON消息（每种格式编码一次）"""
+        encoded = {}
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            if client.format not in encoded:
+                encoded[client.format] = encode_json(obj, client.format)
+            client.send(encoded[client.format])
+
+    # ---- 批量推送 ----
+
+    def _publish(self, record):
+        with self._pending_cond:
+            self._pending.append(record)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._pending_cond.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._pending_cond:
+                while not self._pending and self._running:
+                    self._pending_cond.wait(0.5)
+                if not self._pending and not self._running:
+                    break
+                # 第一条到达后最多再等batch_interval，攒够max_batch立即发送
+                deadline = time.monotonic() + self.batch_interval
+                while len(self._pending) < self.max_batch and self._running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_cond.wait(remaining)
+                batch, self._pending = self._pending, []
+            self._deliver(np.array(batch, dtype=DETECTION_DTYPE))
+
+    def _deliver(self, records):
+        encoded = {}
+        with self._lock:
+            subscribers = [c for c in self._clients if c.subscribed]
+            self.published += len(records)
+        for client in subscribers:
+            if client.format not in encoded:
+                encoded[client.format] = encode_detections(records, client.format)
+            client.send(encoded[client.format])
+
+    # ---- 采集与识别 ----
+
+    def _on_quality(self, quality_info, captured_at):
+        with self._lock:
+            if self.mode.startswith('learning_'):
+                if self.detector.add_sample(quality_info):
+                    # 样本已稳定，下一次检查时提前结束学习
+                    self._learn_deadline = time.monotonic()
+                return
+            if self.mode != 'detection':
+                return
+            match = self.detector.match(quality_info)
+            if self.recorder is not None:
+                self.recorder.match(captured_at, match)
+        self._publish((captured_at, match['cup_index'], quality_info.get('cluster_size', 0),
+                       quality_info['frequency'], quality_info['snr'],
+                       match['confidence'], match['frequency_diff']))
+
+    def _check_learning(self):
+        with self._lock:
+            if self._learn_deadline is None or time.monotonic() < self._learn_deadline:
+                return
+            self._learn_deadline = None
+            result = self.detector.finish_learning()
+            self.mode = 'idle'
+            if self.recorder is not None:
+                self.recorder.event('learned', **result)
+        result['type'] = 'learned'
+        print(f"学习完成：{result}")
+        self.broadcast(result)
+
+    def start(self):
+        """启动套接字服务和发送线程（采集在run()中进行）"""
+        self._running = True
+        self._server = self._make_server()
+        for target in (self._server.serve_forever, self._flush_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        plan = self.pipeline.audio_processor.plan
+        print(f"检测服务已启动：{self.bound_address}，"
+              f"分析配置：{format_description(plan.describe(self.hop_size))}")
+
+    def run(self):
+        """采集循环，直到音频源结束或调用stop()"""
+        if self._server is None:
+            self.start()
+        recorder = self.recorder
+        try:
+            if recorder is not None:
+                recorder.start()
+            self.source.start()
+            while self._running:
+                samples = self.source.read(self.hop_size)
+                captured_at = time.time()
+                if samples is None:
+                    print("音频源数据结束。")
+                    break
+                if len(samples):
+                    start = time.perf_counter()
+                    result = self.pipeline.process(samples)
+                    if recorder is not None:
+                        recorder.record(samples, result, captured_at,
+                                        time.perf_counter() - start)
+                    for decided in decided_results(result):
+                        self._on_quality(decided['quality'], captured_at)
+                self._check_learning()
+        finally:
+            self.source.close()
+            if recorder is not None:
+                recorder.close()
+                print(f"会话录制：{recorder.stats()}")
+
+    def stop(self):
+        """请求停止（可从其他线程调用）"""
+        self._running = False
+        self.source.stop()
+
+    def close(self):
+        """停止服务，推送剩余结果并断开所有客户端"""
+        self.stop()
+        with self._pending_cond:
+            self._pending_cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.remove(self.address)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        with self._lock:
+            clients = list(self._clients)
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ServiceClient:
+    """检测服务客户端"""
+
+    def __init__(self, address, fmt=FORMAT_JSON, timeout=None):
+        """
+        Args:
+            address: (host, port)或Unix套接字路径
+            fmt: 订阅格式，FORMAT_JSON或FORMAT_BINARY
+            timeout: 读取超时（秒），None为一直等待
+        """
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.format = FORMAT_JSON
+        self._reader = self.sock.makefile('rb')
+        # 服务端在回复subscribe之前切换格式，回复本身已是新格式
+        self.send('subscribe', format=fmt)
+        self.format = fmt
+
+    def send(self, cmd, **kwargs):
+        """发送一条命令（回复通过messages()读取）"""
+        kwargs['cmd'] = cmd
+        self.sock.sendall(json.dumps(kwargs).encode('utf-8') + b'\n')
+
+    def messages(self):
+        """
+        逐条读取服务端消息
+
+        Yields:
+            dict: JSON消息；二进制格式的识别结果为{'type': 'detections', 'items': 记录数组}
+        """
+        while True:
+            if self.format == FORMAT_BINARY:
+                header = self._reader.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                kind, length = FRAME_HEADER.unpack(header)
+                payload = self._reader.read(length)
+                if kind == MSG_DETECTIONS:
+                    yield {'type': 'detections',
+                           'items': np.frombuffer(payload, dtype=DETECTION_DTYPE)}
+                else:
+                    yield json.loads(payload)
+            else:
+                line = self._reader.readline()
+                if not line:
+                    return
+                yield json.loads(line)
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _make_source(args, config):
+    if args.wav:
+        return WavFileSource(args.wav, realtime=args.realtime)
+    if args.tone:
+        frequencies = [float(f) for f in args.tone.split(',')]
+        return ToneSource(frequencies, sample_rate=config['sample_rate'], realtime=True)
+    return PyAudioSource(sample_rate=config['sample_rate'], frames_per_buffer=config['hop_size'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面检测服务")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('serve', 'client'):
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--tcp', default=None, help="TCP地址 host:port（默认127.0.0.1:9200）")
+        sub.add_argument('--unix', default=None, help="Unix套接字路径")
+    serve = subparsers.choices['serve']
+    serve.add_argument('--wav', default=None, help="从WAV文件读取（默认麦克风）")
+    serve.add_argument('--realtime', action='store_true', help="WAV文件按实时速度回放")
+    serve.add_argument('--tone', default=None, help="合成敲击信号，逗号分隔的频率列表")
+    serve.add_argument('--hop', type=int, default=None, help="帧移（采样点），优先于部署配置")
+    serve.add_argument('--profiles', default='cup_profiles.acsp', help="杯子档案文件")
+    serve.add_argument('--detect', action='store_true', help="启动后直接进入识别模式")
+    serve.add_argument('--batch-interval', type=float, default=0.01, help="最长攒批时间（秒）")
+    serve.add_argument('--max-batch', type=int, default=64, help="每批最多条数")
+    serve.add_argument('--deployment', default=None, help="部署配置文件（信号频段、质量门限）")
+    serve.add_argument('--record', default=None, help="录制会话到文件（用session_log.py回放）")
+    client = subparsers.choices['client']
+    client.add_argument('--format', choices=(FORMAT_JSON, FORMAT_BINARY), default=FORMAT_JSON)
+    client.add_argument('--send', action='append', default=[], help="发送的JSON命令，可重复")
+    args = parser.parse_args(argv)
+    address = parse_address(args.tcp, args.unix)
+
+    if args.command == 'serve':
+        try:
+            pipeline_options = load_deployment(args.deployment)
+        except (OSError, ValueError) as e:
+            parser.error(f"部署配置无效：{e}")
+        if args.hop:
+            pipeline_options['hop_size'] = args.hop
+        detector = CupDetector(profile_path=args.profiles)
+        if detector.load_profiles():
+            print(f"已加载杯子档案：{detector.location}")
+        service = DetectionService(_make_source(args, pipeline_options), address,
+                                   detector=detector, batch_interval=args.batch_interval,
+                                   max_batch=args.max_batch, pipeline_options=pipeline_options,
+                                   record_path=args.record)
+        if args.detect:
+            service._set_mode('detection')
+        try:
+            with service:
+                service.run()
+        except KeyboardInterrupt:
+            print("用户终止服务。")
+        return 0
+
+    with ServiceClient(address, fmt=args.format) as service_client:
+        for command in args.send:
+            command = json.loads(command)
+            service_client.send(command.pop('cmd'), **command)
+        try:
+            for message in service_client.messages():
+                if message['type'] == 'detections' and args.format == FORMAT_BINARY:
+                    for record in message['items']:
+                        print(dict(zip(DETECTION_DTYPE.names, record.tolist())))
+                else:
+                    print(json.dumps(message, ensure_ascii=False))
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+敲击频谱指纹
+每次敲击压缩为固定长度的float32向量（插值基频、实际谐波峰、衰减率、频谱质心），
+学习和匹配都在向量上进行，基频相近的杯子也能靠其他特征区分
+"""
+import numpy as np
+
+# 指纹各维含义
+FINGERPRINT_FIELDS = (
+    'fundamental',  # 插值后的基频（Hz）
+    'h2_ratio',     # 2次谐波实际峰值频率 / 基频（无谐波时为0）
+    'h3_ratio',     # 3次谐波实际峰值频率 / 基频
+    'h2_level',     # 2次谐波幅度 / 基频幅度
+    'h3_level',     # 3次谐波幅度 / 基频幅度
+    'decay_rate',   # 幅度指数衰减率（1/秒）
+    'centroid',     # 信号频段内的频谱质心（Hz）
+)
+FINGERPRINT_SIZE = len(FINGERPRINT_FIELDS)
+
+# 各维尺度下限：学习样本很稳定时避免标准差过小导致距离失真
+FEATURE_SCALE_FLOOR = np.array([3.0, 0.01, 0.01, 0.05, 0.05, 3.0, 30.0], dtype=np.float32)
+
+
+class FingerprintMatcher:
+    """
+    基于指纹向量的最近邻匹配
+
+    每个杯子保存学习样本的均值和标准差（不低于FEATURE_SCALE_FLOOR），
+    距离为各维标准化差值的均方根（对角马氏距离），所有杯子一次向量化计算。
+    置信度 = exp(-距离² / 8)，距离为1、2、3时分别约为0.88、0.61、0.32。
+    """
+
+    def __init__(self, confidence_threshold=0.5, feature_weights=None):
+        """
+        Args:
+            confidence_threshold: 最低置信度阈值
+            feature_weights: 各维权重，默认全部为1
+        """
+        self.confidence_threshold = confidence_threshold
+        self.feature_weights = (np.ones(FINGERPRINT_SIZE, dtype=np.float32)
+                                if feature_weights is None
+                                else np.asarray(feature_weights, dtype=np.float32))
+        self.cup_indices = np.empty(0, dtype=np.int64)
+        self.means = np.empty((0, FINGERPRINT_SIZE), dtype=np.float32)
+        self.scales = np.empty((0, FINGERPRINT_SIZE), dtype=np.float32)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.cup_indices)
+
+    def learn(self, cup_index, fingerprints):
+        """
+        学习（或重新学习）一个杯子
+
+        Args:
+            cup_index: 杯子编号
+            fingerprints: 形状为(n, FINGERPRINT_SIZE)的学习样本
+
+        Returns:
+            bool: 样本为空时返回False
+        """
+        samples = np.asarray(fingerprints, dtype=np.float32).reshape(-1, FINGERPRINT_SIZE)
+        if not len(samples):
+            return False
+        mean = samples.mean(axis=0)
+        scale = np.maximum(samples.std(axis=0), FEATURE_SCALE_FLOOR)
+        self.set_profile(cup_index, mean, scale, len(samples))
+        return True
+
+    def set_profile(self, cup_index, mean, scale, count=1):
+        """直接设置一个杯子的指纹均值和尺度"""
+        self.forget(cup_index)
+        self.cup_indices = np.append(self.cup_indices, cup_index)
+        self.means = np.vstack([self.means, np.asarray(mean, dtype=np.float32)])
+        self.scales = np.vstack([self.scales, np.maximum(np.asarray(scale, dtype=np.float32),
+                                                         FEATURE_SCALE_FLOOR)])
+        self.counts = np.append(self.counts, count)
+
+    def forget(self, cup_index):
+        """删除一个杯子"""
+        keep = self.cup_indices != cup_index
+        self.cup_indices = self.cup_indices[keep]
+        self.means = self.means[keep]
+        self.scales = self.scales[keep]
+        self.counts = self.counts[keep]
+
+    def distances(self, fingerprints):
+        """
+        计算指纹到各杯子的距离
+
+        Args:
+            fingerprints: 形状为(m, FINGERPRINT_SIZE)的指纹
+
+        Returns:
+            np.ndarray: 形状为(m, 杯子数)的距离矩阵
+        """
+        x = np.asarray(fingerprints, dtype=np.float32).reshape(-1, FINGERPRINT_SIZE)
+        z = (x[:, None, :] - self.means[None, :, :]) / self.scales[None, :, :]
+        weighted = z * z * self.feature_weights
+        return np.sqrt(weighted.sum(axis=2) / self.feature_weights.sum())
+
+    def match_batch(self, fingerprints):
+        """
+        批量匹配
+
+        Returns:
+            dict: 'cup_index'、'confidence'、'distance'、'second_distance'，均为数组
+        """
+        x = np.asarray(fingerprints, dtype=np.float32).reshape(-1, FINGERPRINT_SIZE)
+        m = len(x)
+        if not len(self.cup_indices) or not m:
+            return {'cup_index': np.full(m, -1, dtype=np.int64),
+                    'confidence': np.zeros(m),
+                    'distance': np.full(m, np.inf),
+                    'second_distance': np.full(m, np.inf)}
+        dist = self.distances(x)
+        order = np.argsort(dist, axis=1)
+        rows = np.arange(m)
+        best = dist[rows, order[:, 0]]
+        second = dist[rows, order[:, 1]] if dist.shape[1] > 1 else np.full(m, np.inf)
+        confidence = np.exp(-best.astype(np.float64) ** 2 / 8)
+        cup_index = np.where(confidence >= self.confidence_threshold,
+                             self.cup_indices[order[:, 0]], -1)
+        return {'cup_index': cup_index, 'confidence': confidence,
+                'distance': best, 'second_distance': second}
+
+    def match(self, fingerprint):
+        """
+        匹配单个指纹
+
+        Returns:
+            dict: 包含杯子索引、置信度、距离、第二近距离
+        """
+        result = self.match_batch(fingerprint)
+        return {key: (int(value[0]) if key == 'cup_index' else float(value[0]))
+                for key, value in result.items()}
@@ -0,0 +1,129 @@
+"""
+有界帧队列
+连接PyAudio回调线程（生产者）和分析线程（消费者），支持显式的背压策略
+"""
+import collections
+import threading
+
+# 背压策略
+DROP_OLDEST = 'drop_oldest'  # 队列满时丢弃最旧的帧（默认，保证延迟最低）
+DROP_NEWEST = 'drop_newest'  # 队列满时丢弃新到的帧
+BLOCK = 'block'              # 队列满时阻塞生产者直到有空位或超时
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class FrameQueue:
+    """
+    单生产者/单消费者的有界队列
+
+    入队出队直接使用deque的append/popleft（CPython中为原子操作，无需加锁），
+    Event仅用于在队列为空（或BLOCK策略下队列已满）时唤醒等待方。
+    """
+
+    def __init__(self, maxsize=32, policy=DROP_OLDEST):
+        if maxsize <= 0:
+            raise ValueError(f"maxsize必须为正数，实际为{maxsize}")
+        if policy not in POLICIES:
+            raise ValueError(f"未知的背压策略：{policy}，可选：{POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = collections.deque()
+        self._not_empty = threading.Event()
+        self._not_full = threading.Event()
+        self._closed = False
+        # 统计计数
+        self.put_count = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, item, timeout=None):
+        """
+        放入一帧
+
+        Args:
+            item: 帧数据
+            timeout: BLOCK策略下的最长等待时间（秒），None为一直等待
+
+        Returns:
+            bool: 是否成功入队（新帧被丢弃或队列已关闭时为False）
+        """
+        if self._closed:
+            return False
+        if len(self._items) >= self.maxsize:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            elif self.policy == DROP_OLDEST:
+                try:
+                    self._items.popleft()
+                    self.dropped += 1
+                except IndexError:
+                    pass
+            else:
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._not_full.clear()
+                    if len(self._items) < self.maxsize:
+                        break
+                    if not self._not_full.wait(timeout):
+                        self.dropped += 1
+                        return False
+                if self._closed:
+                    return False
+
+        self._items.append(item)
+        self.put_count += 1
+        self._not_empty.set()
+        return True
+
+    def get(self, timeout=None):
+        """
+        取出一帧
+
+        Args:
+            timeout: 最长等待时间（秒），None为一直等待
+
+        Returns:
+            取出的帧；超时或队列已关闭且为空时返回None
+        """
+        while True:
+            try:
+                item = self._items.popleft()
+            except IndexError:
+                if self._closed:
+                    return None
+                self._not_empty.clear()
+                # 清除事件后再检查一次，避免错过刚入队的帧
+                if self._items:
+                    continue
+                if not self._not_empty.wait(timeout):
+                    return None
+                continue
+            if self.policy == BLOCK:
+                self._not_full.set()
+            return item
+
+    def close(self):
+        """关闭队列并唤醒所有等待方"""
+        self._closed = True
+        self._not_empty.set()
+        self._not_full.set()
+
+    def stats(self):
+        """
+        队列统计信息
+
+        Returns:
+            dict: 当前深度、累计入队数、丢弃数
+        """
+        return {
+            'depth': len(self._items),
+            'put_count': self.put_count,
+            'dropped': self.dropped
+        }
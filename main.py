@@ -1,9 +1,67 @@
+import argparse
+import logging
 import sys
-from PyQt5.QtWidgets import QApplication
-from main_window import AudioControlApp
+
+from startup_profile import StartupProfile
+
+startup_profile = StartupProfile()
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = AudioControlApp()
-    window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="音频杯感应系统")
+    parser.add_argument('--fast-start', action='store_true',
+                        help="先显示窗口，分析模块和音频设备随后在处理线程中加载")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="开启本地指标端点 http://127.0.0.1:端口/metrics")
+    parser.add_argument('--log-level', default='INFO', help="日志级别")
+    parser.add_argument('--deployment', default=None,
+                        help="部署配置文件（信号频段、质量门限），见deployment.py")
+    parser.add_argument('--record', default=None,
+                        help="录制会话（原始音频和逐帧结果）到文件，用session_log.py回放")
+    # 其余参数交给Qt
+    args, qt_args = parser.parse_known_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    deployment = None
+    if args.deployment:
+        from deployment import load_deployment
+        try:
+            deployment = load_deployment(args.deployment)
+        except (OSError, ValueError) as e:
+            parser.error(f"部署配置无效：{e}")
+
+    with startup_profile.stage("导入PyQt5"):
+        from PyQt5.QtWidgets import QApplication
+        from PyQt5.QtCore import QTimer
+    with startup_profile.stage("创建QApplication"):
+        app = QApplication(sys.argv[:1] + qt_args)
+    with startup_profile.stage("导入主窗口"):
+        from main_window import AudioControlApp
+    with startup_profile.stage("创建主窗口"):
+        window = AudioControlApp(lazy=args.fast_start, startup_profile=startup_profile,
+                                 metrics_port=args.metrics_port, deployment=deployment,
+                                 record_path=args.record)
+    with startup_profile.stage("显示窗口"):
+        window.show()
+
+    def on_first_paint():
+        # 事件循环处理完首次绘制后执行；快速启动时在此开始后台加载（导入和打开设备在处理线程中）
+        startup_profile.mark("首次绘制")
+        if args.fast_start:
+            window.initAudio(background=True)
+        # 再排一个0毫秒定时器：此前排队的事件处理完、事件循环空闲，窗口才能响应输入
+        QTimer.singleShot(0, on_interactive)
+
+    def on_interactive():
+        startup_profile.mark("窗口可交互")
+        print_report()
+
+    def print_report(ready=None):
+        # 窗口可交互且音频加载结束（成功或失败）后打印一次
+        marks = startup_profile.marks
+        if "窗口可交互" in marks and ("音频就绪" in marks or "音频加载失败" in marks):
+            window.audioReady.disconnect(print_report)
+            print(startup_profile.format_report())
+
+    window.audioReady.connect(print_report)
+    QTimer.singleShot(0, on_first_paint)
+    sys.exit(app.exec_())
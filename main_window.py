@@ -1,19 +1,208 @@
+import logging
+import time
+
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QGroupBox
-from PyQt5.QtCore import QTimer, QThread
-from audio_worker import AudioWorker
-from utils import find_closest_cup, find_closest_cup_with_confidence
-from audio_processor import AudioProcessor
+from PyQt5.QtCore import QObject, QTimer, QThread, pyqtSignal
+from startup_profile import StartupProfile
+
+logger = logging.getLogger(__name__)
+
+class AudioLoader(QObject):
+    """
+    导入分析模块、恢复杯子档案并打开音频设备
+
+    这几步占启动耗时的大部分（NumPy等导入、设备打开可达数百毫秒），
+    快速启动时放在处理线程中执行，界面线程保持响应；完成后worker已属于该线程
+    """
+    # {'detector': CupDetector, 'worker': AudioWorker, 'profiles_loaded': bool}
+    loaded = pyqtSignal(object)
+    # 失败原因
+    failed = pyqtSignal(str)
+
+    def __init__(self, num_cups, profile_path, deployment, record_path, source, startup_profile):
+        super().__init__()
+        self.num_cups = num_cups
+        self.profile_path = profile_path
+        self.deployment = deployment
+        self.record_path = record_path
+        self.source = source
+        self.startup_profile = startup_profile
+
+    def load(self):
+        """
+        在当前线程中加载
+
+        Returns:
+            dict: 见loaded信号
+        """
+        profile = self.startup_profile
+        with profile.stage("初始化音频"):
+            with profile.stage("导入分析模块"):
+                from audio_worker import AudioWorker
+                from cup_detector import CupDetector
+            with profile.stage("加载杯子档案"):
+                # 学习/识别逻辑与无界面检测服务共用
+                detector = CupDetector(self.num_cups, profile_path=self.profile_path,
+                                       base_tolerance=50, confidence_threshold=0.5)
+                profiles_loaded = detector.load_profiles()
+            with profile.stage("打开音频设备"):
+                worker = AudioWorker(source=self.source, pipeline_options=self.deployment,
+                                     record_path=self.record_path)
+        return {'detector': detector, 'worker': worker, 'profiles_loaded': profiles_loaded}
+
+    def run(self):
+        """在处理线程中加载，通过loaded/failed信号返回结果"""
+        try:
+            loaded = self.load()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(loaded)
+
 
 class AudioControlApp(QWidget):
-    def __init__(self):
+    # 音频加载完成（True）或失败（False）
+    audioReady = pyqtSignal(bool)
+    # 在处理线程中启动worker的处理循环
+    _startProcessing = pyqtSignal()
+
+    def __init__(self, num_cups=8, profile_path='cup_profiles.acsp', lazy=False,
+                 startup_profile=None, metrics_port=None, deployment=None, record_path=None,
+                 source=None):
+        """
+        Args:
+            num_cups: 杯子数量
+            profile_path: 杯子档案文件路径，None为不持久化
+            lazy: 快速启动模式，窗口先显示，分析模块和音频设备随后在处理线程中加载
+                  （见initAudio(background=True)），加载完成前的操作在就绪后执行
+            startup_profile: 启动耗时统计（StartupProfile），None时新建
+            metrics_port: 本地指标端点（Prometheus文本格式）端口，None为不开启
+            deployment: 部署配置（deployment.load_deployment()的结果），None为默认配置
+            record_path: 会话录制文件路径（见session_log），None为不录制
+            source: 音频源（见audio_source），None时打开默认麦克风
+        """
         super().__init__()
-        self.initUI()
-        self.location = [0.0] * 8  # 确保列表元素为浮点数
-        self.location_stds = [0.0] * 8  # 存储各杯子的频率标准差
+        self.num_cups = num_cups
+        self.profile_path = profile_path
+        self.startup_profile = startup_profile or StartupProfile()
         self.current_mode = "idle"
-        self.frequencies = []
-        self.audio_processor = AudioProcessor()  # 音频处理器实例
+        # 以下对象依赖NumPy和音频设备，由initAudio创建
+        self.detector = None
+        self.audio_worker = None
+        self.audio_thread = None
+        self.metrics_port = metrics_port
+        self.deployment = deployment
+        self.record_path = record_path
+        self.source = source
+        self.metrics_server = None
+        self._log = None
+        self._loader = None
+        self._pending_action = None
+        self._closing = False
+        # 界面刷新合并：两次刷新之间到达的识别结果只显示最新一帧的（多峰模式下可能有多条）
+        self._pending_records = None
+        self._pending_captured = []
+        self.display_stats = {'events': 0, 'refreshes': 0}
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setSingleShot(True)
+        self.refreshTimer.timeout.connect(self.refreshDisplay)
+        with self.startup_profile.stage("构建界面"):
+            self.initUI()
+        if not lazy:
+            self.initAudio()
+
+    def initAudio(self, background=False):
+        """
+        加载分析模块、恢复杯子档案、打开音频设备并启动处理线程（只执行一次）
+
+        Args:
+            background: True时导入和打开设备在处理线程中进行，界面线程立即返回，
+                        完成后发出audioReady；False时在当前线程中同步完成
+        """
+        if self.audio_thread is not None:
+            return
+        self.startup_profile.mark("开始加载音频")
+        self.audio_thread = QThread()
+        self._loader = AudioLoader(self.num_cups, self.profile_path, self.deployment,
+                                   self.record_path, self.source, self.startup_profile)
+        if background:
+            # 加载器在处理线程中运行，结果经排队信号回到界面线程
+            self._loader.moveToThread(self.audio_thread)
+            self._loader.loaded.connect(self._onAudioLoaded)
+            self._loader.failed.connect(self._onAudioFailed)
+            self.audio_thread.started.connect(self._loader.run)
+            self.audio_thread.start()
+        else:
+            self._onAudioLoaded(self._loader.load())
+
+    def whenAudioReady(self, action):
+        """
+        检查音频是否就绪：未就绪时开始后台加载，记下action在就绪后执行
+        （加载期间只保留最后一次操作）
+
+        Returns:
+            bool: 是否已就绪（已就绪时由调用方继续执行，不调用action）
+        """
+        if self.audio_worker is not None:
+            return True
+        self._pending_action = action
+        self.resultLabel.setText("加载中...")
+        self.initAudio(background=True)
+        return False
+
+    def _onAudioLoaded(self, loaded):
+        """加载完成（界面线程）：接上检测结果信号并开始处理"""
+        if self._closing:
+            loaded['worker'].source.close()
+            return
+        from analysis_plan import format_description
+        from metrics import MetricsServer, RateLimitedLogger
+        self._loader = None
+        self.detector = loaded['detector']
+        self.audio_worker = loaded['worker']
+        if loaded['profiles_loaded']:
+            print(f"已加载{len(self.detector.profile_store)}个杯子档案："
+                  f"{self.detector.location}")
+        plan = self.audio_worker.audio_processor.plan
+        print(f"分析配置：{format_description(plan.describe(self.audio_worker.HOP))}")
+        # 逐帧日志限频输出，端到端延迟记入worker的指标
+        self._log = RateLimitedLogger(logger, interval=1.0)
+        if self.metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(self.audio_worker.metrics,
+                                                    port=self.metrics_port).start()
+            except OSError as e:
+                print(f"指标端点启动失败：{e}")
+        with self.startup_profile.stage("启动处理线程"):
+            # 后台加载时worker已在处理线程中创建，同步加载时移过去
+            if self.audio_worker.thread() is not self.audio_thread:
+                self.audio_worker.moveToThread(self.audio_thread)
+            # 检测结果按批到达，每批一次跨线程信号
+            self.audio_worker.detectionsReady.connect(self.updateDetections)
+            self._startProcessing.connect(self.audio_worker.process_audio)
+            if not self.audio_thread.isRunning():
+                self.audio_thread.start()
+            self._startProcessing.emit()
+        self.startup_profile.mark("音频就绪")
+        if self.resultLabel.text() == "加载中...":
+            self.resultLabel.setText("")
+        self.audioReady.emit(True)
+        action, self._pending_action = self._pending_action, None
+        if action is not None:
+            action()
+
+    def _onAudioFailed(self, message):
+        """后台加载失败（界面线程）：停止处理线程，下次操作时重试"""
+        print(f"音频初始化失败：{message}")
+        self.startup_profile.mark("音频加载失败")
+        self._loader = None
+        self._pending_action = None
+        self.audio_thread.quit()
+        self.audio_thread.wait(2000)
+        self.audio_thread = None
+        self.resultLabel.setText("音频设备不可用")
+        self.audioReady.emit(False)
 
     def initUI(self):
         self.setWindowTitle("音频控制面板")
@@ -72,7 +261,7 @@ class AudioControlApp(QWidget):
         learningLayout = QHBoxLayout(learningGroupBox)
 
         self.cupButtons = {}
-        for i in range(1, 9):
+        for i in range(1, self.num_cups + 1):
             button = QPushButton(f"{i}号杯子")
             button.setMinimumHeight(80)
             button.clicked.connect(lambda _, cup=i: self.learnCup(cup))
@@ -80,17 +269,26 @@ class AudioControlApp(QWidget):
             learningLayout.addWidget(button)
         mainLayout.addWidget(learningGroupBox)
 
-        self.audio_worker = AudioWorker()
-        self.audio_thread = QThread()
-        self.audio_worker.moveToThread(self.audio_thread)
-        self.audio_worker.frequencyDetected.connect(self.updateResultLabel)
-        # 连接新的质量信号
-        self.audio_worker.frequencyWithQuality.connect(self.updateResultWithQuality)
-        self.audio_thread.started.connect(self.audio_worker.process_audio)
-        self.audio_thread.start()
-
         self.setStyleSheet(self.getStyleSheet())
 
+    def closeEvent(self, event):
+        """关闭窗口时停止音频线程"""
+        self._closing = True
+        if self.audio_worker is not None:
+            self.audio_worker.stop()
+            self.audio_thread.quit()
+            self.audio_thread.wait(2000)
+        elif self.audio_thread is not None:
+            # 仍在后台加载：等加载结束（之后到达的结果由_onAudioLoaded关闭）
+            self.audio_thread.quit()
+            self.audio_thread.wait(5000)
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        if self.display_stats['refreshes']:
+            print(f"界面刷新：{self.display_stats['events']}条识别结果合并为"
+                  f"{self.display_stats['refreshes']}次刷新")
+        super().closeEvent(event)
+
     def getStyleSheet(self):
         return """
         QWidget {
@@ -122,7 +320,15 @@ class AudioControlApp(QWidget):
         QtCore.QTimer.singleShot(1000, lambda: self.resultLabel.setText("已启动"))
 
     def detectAudio(self):
+        if not self.whenAudioReady(self.detectAudio):
+            return
         self.current_mode = "detection"
+        # 检测阶段只分析已学习杯子附近的频率
+        self.audio_worker.pipeline.set_targets(*self.detector.targets())
+        recorder = self.audio_worker.recorder
+        if recorder is not None:
+            recorder.snapshot(self.detector)
+            recorder.event('detect')
         self.resultLabel.setText("检测中...")
 
     def testFrequency(self):
@@ -130,88 +336,100 @@ class AudioControlApp(QWidget):
         QtCore.QTimer.singleShot(1500, lambda: self.resultLabel.setText("测试完成"))
 
     def learnCup(self, cup_number):
+        if not self.whenAudioReady(lambda: self.learnCup(cup_number)):
+            return
         self.current_mode = f"learning_{cup_number}"
+        # 学习阶段使用完整FFT
+        self.audio_worker.pipeline.clear_targets()
+        if self.audio_worker.recorder is not None:
+            self.audio_worker.recorder.event('learn', cup=cup_number)
         self.resultLabel.setText(f"{cup_number}号杯子学习中...")
-        self.frequencies = []
+        self.detector.start_learning(cup_number)
         self.timer = QTimer()
         self.timer.timeout.connect(lambda: self.finishLearning(cup_number))
-        self.timer.start(2000)  # 2秒学习时间
+        self.timer.start(2000)  # 最长2秒学习时间，样本稳定后提前结束
 
-    def updateResultWithQuality(self, quality_info):
-        """处理带质量信息的频率数据"""
-        frequency = quality_info.get('frequency', 0)
-        print(f"收到频率（带质量）：{frequency:.1f} Hz")
+    def updateDetections(self, records):
+        """
+        处理一批检测结果（result_batch.RESULT_DTYPE记录数组）
+
+        学习模式下每条都作为学习样本；识别模式下只记下最新一帧的结果
+        （多峰模式下同一帧的多个杯子captured_at相同），按显示器刷新率合并刷新界面
+        """
+        from result_batch import record_to_quality
+        self._log.info('quality', "收到%d条检测结果，最新频率：%.1f Hz",
+                       len(records), records[-1]['frequency'])
 
         if self.current_mode.startswith("learning_"):
-            self.frequencies.append(frequency)
+            for record in records:
+                if self.detector.add_sample(record_to_quality(record)):
+                    self.finishLearning(self.detector.learning_cup)
+                    break
         elif self.current_mode == "detection":
-            # 使用优化的匹配算法
-            match_result = find_closest_cup_with_confidence(
-                self.location, self.location_stds, frequency,
-                base_tolerance=50, confidence_threshold=0.5)
+            self._pending_records = records[records['captured_at'] == records[-1]['captured_at']]
+            self._pending_captured.extend(records['captured_at'].tolist())
+            if not self.refreshTimer.isActive():
+                self.refreshTimer.start(self.refreshInterval())
 
+    def refreshInterval(self):
+        """两次界面刷新的最小间隔（毫秒），取主屏幕刷新率，无法获取时按60 Hz"""
+        screen = QApplication.primaryScreen()
+        rate = screen.refreshRate() if screen is not None else 0
+        return max(1, int(1000 / (rate if rate > 0 else 60)))
+
+    def refreshDisplay(self):
+        """显示合并后的最新识别结果（同一帧识别出多个杯子时全部显示）"""
+        from result_batch import record_to_quality
+        records = self._pending_records
+        captured = self._pending_captured
+        self._pending_records = None
+        self._pending_captured = []
+        if records is None or self.current_mode != "detection":
+            return
+        merged = len(captured)
+        self.display_stats['events'] += merged
+        self.display_stats['refreshes'] += 1
+        if merged > 1:
+            self._log.info('coalesce', "本次刷新合并了%d条识别结果", merged)
+
+        # 有指纹档案时按指纹最近邻匹配，否则按频率动态容差匹配
+        matches = {}
+        for record in records:
+            match_result = self.detector.match(record_to_quality(record))
+            if self.audio_worker.recorder is not None:
+                self.audio_worker.recorder.match(record['captured_at'], match_result)
             if match_result['cup_index'] != -1:
-                cup_num = match_result['cup_index'] + 1
-                confidence = match_result['confidence'] * 100
-                self.resultLabel.setText(f"{cup_num}")
-                self.confidenceLabel.setText(
-                    f"置信度: {confidence:.1f}% | 频差: {match_result['frequency_diff']:.1f} Hz")
-            else:
-                self.resultLabel.setText("?")
-                self.confidenceLabel.setText("未找到匹配杯子")
-
-    def updateResultLabel(self, frequency):
-        """处理简单频率数据（向后兼容）"""
-        print(f"收到频率：{frequency}")
-        if self.current_mode.startswith("learning_"):
-            self.frequencies.append(frequency)
-        elif self.current_mode == "detection":
-            closest_cup = find_closest_cup(self.location, frequency)
-            if closest_cup != -1:
-                self.resultLabel.setText(f"{closest_cup + 1}")
-                self.confidenceLabel.setText("")
-            else:
-                self.resultLabel.setText("?")
-                self.confidenceLabel.setText("未找到匹配杯子")
+                matches.setdefault(match_result['cup_index'], match_result)
+        if matches:
+            self.resultLabel.setText("、".join(f"{cup_index + 1}" for cup_index in matches))
+            self.confidenceLabel.setText("；".join(
+                f"置信度: {m['confidence'] * 100:.1f}% | 频差: {m['frequency_diff']:.1f} Hz"
+                for m in matches.values()))
+        else:
+            self.resultLabel.setText("?")
+            self.confidenceLabel.setText("未找到匹配杯子")
+        now = time.perf_counter()
+        end_to_end = self.audio_worker.metrics.end_to_end
+        for captured_at in captured:
+            end_to_end.observe(now - captured_at)
 
     def finishLearning(self, cup_number):
         self.timer.stop()
-        if self.frequencies:
-            # 使用DBSCAN聚类算法
-            cluster_result = self.audio_processor.cluster_frequencies_dbscan(
-                self.frequencies, eps=30, min_samples=3)
-
-            if cluster_result:
-                # 使用聚类结果
-                learned_freq = cluster_result['mean_frequency']
-                learned_std = cluster_result['std_deviation']
-                self.location[cup_number - 1] = learned_freq
-                self.location_stds[cup_number - 1] = learned_std
-                print(f"学习完成，{cup_number}号杯子频率：{learned_freq:.1f} Hz, "
-                      f"标准差：{learned_std:.1f} Hz")
-                print(f"位置数组：{self.location}")
-                self.resultLabel.setText(f"{cup_number}")
-                self.confidenceLabel.setText(
-                    f"学习完成 | 频率: {learned_freq:.1f} Hz | 稳定性: {learned_std:.1f} Hz")
-            else:
-                # 回退到原始算法
-                freq_mode = self.seekingMode(self.frequencies)
-                if freq_mode:
-                    self.location[cup_number - 1] = freq_mode[0]
-                    self.location_stds[cup_number - 1] = 20.0  # 默认标准差
-                    print(f"学习完成（回退算法），{cup_number}号杯子频率：{freq_mode[0]}")
-                self.resultLabel.setText(f"{cup_number}号杯子学习完成")
-                self.confidenceLabel.setText("")
+        result = self.detector.finish_learning()
+        if self.audio_worker.recorder is not None:
+            self.audio_worker.recorder.event('learned', **result)
+        if result['frequency'] is not None and not result['fallback']:
+            learned_freq = result['frequency']
+            learned_std = result['std']
+            print(f"学习完成，{cup_number}号杯子频率：{learned_freq:.1f} Hz, "
+                  f"标准差：{learned_std:.1f} Hz")
+            print(f"位置数组：{self.detector.location}")
+            self.resultLabel.setText(f"{cup_number}")
+            self.confidenceLabel.setText(
+                f"学习完成 | 频率: {learned_freq:.1f} Hz | 稳定性: {learned_std:.1f} Hz")
+        elif result['samples']:
+            if result['frequency'] is not None:
+                print(f"学习完成（回退算法），{cup_number}号杯子频率：{result['frequency']}")
+            self.resultLabel.setText(f"{cup_number}号杯子学习完成")
+            self.confidenceLabel.setText("")
         self.current_mode = "idle"
-        self.frequencies = []
-
-    def seekingMode(self, numList):
-        if not numList:
-            return []
-        uniqueList = list(set(numList))
-        frequencyDict = {num: numList.count(num) for num in uniqueList}
-        sortedDict = sorted(frequencyDict.items(), key=lambda item: item[1], reverse=True)
-        maxFrequency = sortedDict[0][1]
-        keys = [key for key, value in frequencyDict.items() if value == maxFrequency]
-        keys.sort()
-        return keys
\ No newline at end of file
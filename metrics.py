@@ -0,0 +1,275 @@
+"""
+热路径性能指标
+固定桶数的延迟直方图（观测一次只做一次二分查找和几次加法），
+支持Prometheus文本格式导出（可选的本地HTTP端点）、周期性日志摘要，
+以及按键限频的日志输出，替代逐帧print
+"""
+import bisect
+import http.server
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 默认延迟桶上界（秒）：50微秒 ~ 5秒
+DEFAULT_BOUNDS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                  0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class LatencyHistogram:
+    """
+    固定桶数的延迟直方图
+
+    只允许一个线程写入；读取（导出、摘要）不加锁，并发时读到的各计数可能相差一次观测。
+    """
+
+    def __init__(self, name, help_text, bounds=DEFAULT_BOUNDS):
+        """
+        Args:
+            name: 指标名（不含前缀和_seconds后缀）
+            help_text: 指标说明
+            bounds: 递增的桶上界（秒），最后隐含+Inf桶
+        """
+        self.name = name
+        self.help_text = help_text
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """记录一次耗时（秒）"""
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """
+        由桶计数估计分位数（桶内线性插值，与Prometheus的histogram_quantile一致，
+        落在+Inf桶时返回最大值）
+
+        Args:
+            q: 分位数，0~1
+
+        Returns:
+            float: 秒，无观测时为0
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and cumulative + count >= target:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.max
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: 次数、总和、平均、最大值和p50/p95/p99（秒）
+        """
+        count = self.count
+        return {
+            'count': count,
+            'sum': self.sum,
+            'mean': self.sum / count if count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
+
+
+class PipelineMetrics:
+    """
+    检测链路的指标集合
+
+    直方图：read（读取一个帧移）、fft（频谱+峰值）、snr、fingerprint、cluster、
+    frame（一帧完整处理）、end_to_end（帧移读到 -> 界面显示）。
+    计数：frames（处理的帧移数）、detections（通过质量过滤的帧数）。
+    音频源统计（队列深度、丢弃数、溢出数）通过stats_provider在导出时读取。
+    """
+
+    PREFIX = 'audiocupsense'
+
+    def __init__(self, stats_provider=None, summary_interval=30.0):
+        """
+        Args:
+            stats_provider: 返回音频源统计dict的函数（见AudioSource.stats）
+            summary_interval: 周期性日志摘要的间隔（秒），0为不输出
+        """
+        self.read = LatencyHistogram('read', "读取一个帧移的耗时")
+        self.fft = LatencyHistogram('fft', "频谱计算和峰值提取的耗时")
+        self.snr = LatencyHistogram('snr', "信噪比计算的耗时")
+        self.fingerprint = LatencyHistogram('fingerprint', "频谱指纹提取的耗时")
+        self.cluster = LatencyHistogram('cluster', "流式聚类更新的耗时")
+        self.frame = LatencyHistogram('frame', "一个帧移的完整处理耗时")
+        self.end_to_end = LatencyHistogram('end_to_end', "帧移读到至界面显示的延迟")
+        self.histograms = (self.read, self.fft, self.snr, self.fingerprint, self.cluster,
+                           self.frame, self.end_to_end)
+        self.frames = 0
+        self.detections = 0
+        self.stats_provider = stats_provider
+        self.summary_interval = summary_interval
+        self._last_summary = time.monotonic()
+
+    def source_stats(self):
+        """音频源统计（队列深度、丢弃数、溢出数等），无来源时为空"""
+        if self.stats_provider is None:
+            return {}
+        try:
+            return dict(self.stats_provider())
+        except Exception:  # 导出线程读取统计失败不应影响检测
+            return {}
+
+    def render_prometheus(self):
+        """
+        导出为Prometheus文本格式
+
+        Returns:
+            str: 文本
+        """
+        lines = []
+        for hist in self.histograms:
+            name = f"{self.PREFIX}_{hist.name}_seconds"
+            lines.append(f"# HELP {name} {hist.help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(hist.bounds, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative + hist.counts[-1]}')
+            lines.append(f"{name}_sum {hist.sum:.9f}")
+            lines.append(f"{name}_count {hist.count}")
+        for key, help_text, value in (('frames_total', "处理的帧移数", self.frames),
+                                      ('detections_total', "通过质量过滤的帧数", self.detections)):
+            lines.append(f"# HELP {self.PREFIX}_{key} {help_text}")
+            lines.append(f"# TYPE {self.PREFIX}_{key} counter")
+            lines.append(f"{self.PREFIX}_{key} {value}")
+        source = self.source_stats()
+        for key, metric, kind, help_text in (
+                ('depth', 'queue_depth', 'gauge', "帧队列当前深度"),
+                ('dropped', 'dropped_frames_total', 'counter', "帧队列丢弃的帧数"),
+                ('overflowed', 'input_overflows_total', 'counter', "音频输入溢出次数")):
+            if key in source:
+                lines.append(f"# HELP {self.PREFIX}_{metric} {help_text}")
+                lines.append(f"# TYPE {self.PREFIX}_{metric} {kind}")
+                lines.append(f"{self.PREFIX}_{metric} {source[key]}")
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self):
+        """一行文本摘要（毫秒）"""
+        parts = [f"帧移 {self.frames}", f"检测 {self.detections}"]
+        for hist in self.histograms:
+            if hist.count:
+                snap = hist.snapshot()
+                parts.append(f"{hist.name} p50={snap['p50'] * 1000:.2f} p99={snap['p99'] * 1000:.2f} "
+                             f"max={snap['max'] * 1000:.2f}ms")
+        source = self.source_stats()
+        for key in ('depth', 'dropped', 'overflowed'):
+            if key in source:
+                parts.append(f"{key}={source[key]}")
+        return " | ".join(parts)
+
+    def maybe_log_summary(self):
+        """到达摘要间隔时输出一条日志（每个帧移调用一次，开销为一次时钟读取）"""
+        if not self.summary_interval:
+            return
+        now = time.monotonic()
+        if now - self._last_summary >= self.summary_interval:
+            self._last_summary = now
+            logger.info("性能摘要：%s", self.format_summary())
+
+
+class RateLimitedLogger:
+    """
+    按键限频的日志：同一键在interval秒内最多输出一条，其余只计数，
+    下一条输出时附带被抑制的条数。消息参数延迟格式化，被抑制时不产生格式化开销。
+    """
+
+    def __init__(self, log=None, interval=1.0):
+        self.log = log or logger
+        self.interval = interval
+        self._last = {}
+        self._suppressed = {}
+
+    def info(self, key, message, *args):
+        self._emit(logging.INFO, key, message, args)
+
+    def debug(self, key, message, *args):
+        self._emit(logging.DEBUG, key, message, args)
+
+    def _emit(self, level, key, message, args):
+        if not self.log.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        self._last[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            message += "（期间省略%d条）"
+            args = args + (suppressed,)
+        self.log.log(level, message, *args)
+
+
+class MetricsServer:
+    """
+    本地HTTP指标端点：GET /metrics 返回Prometheus文本格式
+    在后台守护线程中运行，默认只监听127.0.0.1
+    """
+
+    def __init__(self, metrics, host='127.0.0.1', port=9108):
+        self.metrics = metrics
+        metrics_ref = metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics_ref.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 抓取请求不写入日志
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        """实际监听的(host, port)（port为0时由系统分配）"""
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info("指标端点：http://%s:%d/metrics", *self.address[:2])
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
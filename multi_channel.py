@@ -0,0 +1,492 @@
+"""
+多通道/多工位并行检测
+一台主机同时服务多个麦克风：从一个多声道流或多个设备中拆分出各通道，
+按通道分片到固定的进程池中分析（绕开GIL），结果带通道编号返回。
+各通道的识别与单通道相同：CupDetector.match（有指纹档案时指纹最近邻匹配，否则按频率动态容差匹配）
+
+用法：
+    python multi_channel.py --device 2:4 --device default        # 设备2的4个声道 + 默认设备
+    python multi_channel.py --wav hall.wav --channel-ids 站1,站2 --profiles '{channel}.acsp'
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from audio_source import PyAudioSource, ToneSource, WavFileSource
+from cup_detector import CupDetector
+from deployment import load_deployment
+from detection_pipeline import DetectionPipeline, decided_results
+from session_log import detector_snapshot, restore_detector
+
+
+class ChannelAnalyzer:
+    """单个通道的检测状态：检测流水线 + 该通道自己学习的杯子表（CupDetector）"""
+
+    def __init__(self, channel_id, **pipeline_kwargs):
+        self.channel_id = channel_id
+        self.pipeline = DetectionPipeline(**pipeline_kwargs)
+        self.detector = CupDetector()
+
+    def set_cups(self, location, location_stds):
+        """更新该通道的杯子频率表（不含指纹，按频率匹配）"""
+        detector = CupDetector(num_cups=len(location))
+        detector.location = [float(f) for f in location]
+        detector.location_stds = [float(s) for s in location_stds]
+        detector.cup_matcher.set_cups(detector.location, detector.location_stds)
+        self.detector = detector
+
+    def set_detector(self, snapshot):
+        """按session_log.detector_snapshot()的快照更新该通道的杯子表和指纹档案"""
+        self.detector = restore_detector(snapshot)
+
+    def process(self, samples):
+        """
+        处理该通道的一个帧移
+
+        Returns:
+            dict: 带'channel'的检测结果，已学习杯子时已判决的结果附带'match'
+                  （多峰模式下附带在'peaks'的各峰上）；无结果时为None
+        """
+        result = self.pipeline.process(samples)
+        if result is None:
+            return None
+        result['channel'] = self.channel_id
+        detector = self.detector
+        if len(detector.cup_matcher) or len(detector.fingerprint_matcher):
+            for decided in decided_results(result):
+                decided['match'] = detector.match(decided['quality'])
+        return result
+
+
+def _shard_main(channel_ids, pipeline_kwargs, in_queue, out_queue):
+    """
+    工作进程主循环：负责一组固定通道，状态常驻在本进程内
+
+    消息格式：
+        ('frames', {channel_id: samples})   分析一批帧移
+        ('cups', (channel_id, location, stds))  更新杯子表
+        ('detector', (channel_id, snapshot))  更新杯子表和指纹档案
+        None                                  退出
+    """
+    analyzers = {cid: ChannelAnalyzer(cid, **pipeline_kwargs) for cid in channel_ids}
+    while True:
+        message = in_queue.get()
+        if message is None:
+            break
+        kind, payload = message
+        if kind == 'frames':
+            results = []
+            for cid, samples in payload.items():
+                result = analyzers[cid].process(samples)
+                if result is not None:
+                    results.append(result)
+            if results:
+                out_queue.put(results)
+        elif kind == 'cups':
+            cid, location, location_stds = payload
+            analyzers[cid].set_cups(location, location_stds)
+        elif kind == 'detector':
+            cid, snapshot = payload
+            analyzers[cid].set_detector(snapshot)
+    out_queue.put(None)
+
+
+class MultiChannelEngine:
+    """
+    多通道检测引擎
+
+    通道按轮询分配到num_workers个进程，每个进程常驻处理自己的通道，
+    帧移按进程打包发送，减少进程间通信次数。
+    """
+
+    def __init__(self, channel_ids, num_workers=None, sample_rate=12000, chunk_size=4096,
+                 hop_size=None, onset_gate=True, min_snr=5.0, max_pending=64, max_peaks=1,
+                 pipeline_options=None):
+        """
+        Args:
+            channel_ids: 通道编号列表
+            num_workers: 进程数，默认为min(通道数, CPU核数)
+            sample_rate: 采样率
+            chunk_size: FFT帧长
+            hop_size: 帧移（采样点）
+            onset_gate: 是否启用起振检测门控
+            min_snr: 最小信噪比（dB）
+            max_pending: 每个进程未处理消息的上限（超出时submit阻塞）
+            max_peaks: 每帧最多检测的峰数（同一通道同时敲击的杯子数）
+            pipeline_options: 其他DetectionPipeline参数（如deployment.load_deployment()的结果，
+                              含窗函数、信号频段和自适应信噪比设置），优先于以上分析参数，
+                              原样传给每个通道的检测流水线
+        """
+        self.channel_ids = list(channel_ids)
+        if not self.channel_ids:
+            raise ValueError("至少需要一个通道")
+        num_workers = num_workers or min(len(self.channel_ids), os.cpu_count() or 1)
+        self.num_workers = max(1, min(num_workers, len(self.channel_ids)))
+        self.pipeline_kwargs = {
+            'sample_rate': sample_rate,
+            'chunk_size': chunk_size,
+            'hop_size': hop_size,
+            'onset_gate': onset_gate,
+            'min_snr': min_snr,
+            'max_peaks': max_peaks
+        }
+        self.pipeline_kwargs.update(pipeline_options or {})
+        self.max_pending = max_pending
+        self.shards = [self.channel_ids[i::self.num_workers] for i in range(self.num_workers)]
+        self._shard_of = {cid: i for i, shard in enumerate(self.shards) for cid in shard}
+        self._processes = []
+        self._in_queues = []
+        self._out_queue = None
+
+    def start(self):
+        """启动工作进程"""
+        context = multiprocessing.get_context()
+        self._out_queue = context.Queue()
+        for shard in self.shards:
+            in_queue = context.Queue(self.max_pending)
+            process = context.Process(target=_shard_main,
+                                      args=(shard, self.pipeline_kwargs, in_queue, self._out_queue),
+                                      daemon=True)
+            process.start()
+            self._in_queues.append(in_queue)
+            self._processes.append(process)
+
+    def submit(self, hops):
+        """
+        提交一批帧移
+
+        Args:
+            hops: {channel_id: 一维采样数组}
+        """
+        batches = [{} for _ in self.shards]
+        for cid, samples in hops.items():
+            batches[self._shard_of[cid]][cid] = np.ascontiguousarray(samples)
+        for in_queue, batch in zip(self._in_queues, batches):
+            if batch:
+                in_queue.put(('frames', batch))
+
+    def set_cups(self, channel_id, location, location_stds):
+        """更新指定通道的杯子频率表（按频率匹配）"""
+        self._in_queues[self._shard_of[channel_id]].put(
+            ('cups', (channel_id, list(location), list(location_stds))))
+
+    def set_detector(self, channel_id, detector):
+        """
+        按CupDetector更新指定通道的杯子表，学习过指纹的杯子按指纹匹配
+
+        Args:
+            channel_id: 通道编号
+            detector: 已学习（或已加载档案）的CupDetector
+        """
+        self._in_queues[self._shard_of[channel_id]].put(
+            ('detector', (channel_id, detector_snapshot(detector))))
+
+    def results(self, timeout=0.0):
+        """
+        取出已完成的检测结果
+
+        Args:
+            timeout: 没有结果时最多等待的时间（秒）
+
+        Returns:
+            list: 带'channel'字段的结果列表
+        """
+        collected = []
+        try:
+            batch = self._out_queue.get(timeout=timeout) if timeout else self._out_queue.get_nowait()
+            while True:
+                if batch is not None:
+                    collected.extend(batch)
+                batch = self._out_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return collected
+
+    def close(self, timeout=5.0):
+        """
+        通知工作进程退出并等待
+
+        Args:
+            timeout: 最长等待时间（秒）；工作进程已异常退出时不再等待它的结果，
+                     超时仍未退出的进程被终止
+
+        Returns:
+            list: 退出前尚未取走的结果
+        """
+        deadline = time.monotonic() + timeout
+        for process, in_queue in zip(self._processes, self._in_queues):
+            if not process.is_alive():
+                continue
+            try:
+                in_queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+        remaining = []
+        finished = 0
+        while finished < len(self._processes):
+            try:
+                batch = self._out_queue.get(timeout=0.1)
+            except queue.Empty:
+                # 已退出的进程不会再有结果
+                if (not any(process.is_alive() for process in self._processes)
+                        or time.monotonic() >= deadline):
+                    break
+                continue
+            if batch is None:
+                finished += 1
+            else:
+                remaining.extend(batch)
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+        self._in_queues = []
+        return remaining
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._processes:
+            self.close()
+
+
+class MultiChannelCapture:
+    """
+    多设备/多声道采集循环
+
+    inputs为[(音频源, [该源各声道对应的通道编号]), ...]，
+    多声道源按声道拆分，每个帧移打包提交给MultiChannelEngine。
+    """
+
+    def __init__(self, inputs, engine, hop_size=2048):
+        self.inputs = [(source, list(channel_ids)) for source, channel_ids in inputs]
+        self.engine = engine
+        self.hop_size = hop_size
+        self._running = False
+
+    def run(self, on_results=None):
+        """
+        运行采集循环，直到所有音频源结束或调用stop()
+
+        Args:
+            on_results: 结果回调，参数为结果列表
+        """
+        self._running = True
+        for source, _ in self.inputs:
+            source.start()
+        try:
+            active = list(self.inputs)
+            while self._running and active:
+                hops = {}
+                for entry in list(active):
+                    source, channel_ids = entry
+                    samples = source.read(self.hop_size)
+                    if samples is None:
+                        active.remove(entry)
+                        continue
+                    if not len(samples):
+                        continue
+                    if samples.ndim == 1:
+                        hops[channel_ids[0]] = samples
+                    else:
+                        for column, cid in enumerate(channel_ids):
+                            hops[cid] = samples[:, column]
+                if hops:
+                    self.engine.submit(hops)
+                if on_results is not None:
+                    results = self.engine.results()
+                    if results:
+                        on_results(results)
+        finally:
+            self._running = False
+            for source, _ in self.inputs:
+                source.close()
+
+    def run_in_thread(self, on_results=None):
+        """在后台线程中运行采集循环"""
+        thread = threading.Thread(target=self.run, args=(on_results,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """请求停止（可从其他线程调用）"""
+        self._running = False
+        for source, _ in self.inputs:
+            source.stop()
+
+
+def parse_device(spec):
+    """
+    解析设备参数
+
+    Args:
+        spec: '编号[:声道数]'，编号为'default'时为默认输入设备
+
+    Returns:
+        tuple: (设备编号或None, 声道数)
+    """
+    index, _, channels = spec.partition(':')
+    try:
+        index = None if index == 'default' else int(index)
+        channels = int(channels) if channels else 1
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"设备参数应为 编号[:声道数]：{spec}")
+    if channels < 1:
+        raise argparse.ArgumentTypeError(f"声道数须为正整数：{spec}")
+    return index, channels
+
+
+def open_inputs(inputs, options, realtime=False):
+    """
+    按命令行参数打开各音频源
+
+    Args:
+        inputs: [(类型, 参数), ...]，类型为'device'（参数见parse_device）、'wav'（文件路径）
+                或'tone'（逗号分隔的频率列表）
+        options: 检测流水线参数（含'sample_rate'、'hop_size'），
+                 WAV文件的采样率写回其中（所有音频源须一致）
+        realtime: WAV文件是否按实时速度回放
+
+    Returns:
+        list: 与inputs一一对应的音频源
+    """
+    opened = {}
+    try:
+        # 先打开WAV文件，采样率以文件为准，设备和合成信号随之打开
+        wav_rate = None
+        for position, (kind, value) in enumerate(inputs):
+            if kind == 'wav':
+                source = opened[position] = WavFileSource(value, channel=None, realtime=realtime)
+                if wav_rate is not None and source.sample_rate != wav_rate:
+                    raise ValueError(f"采样率不一致：{value}为{source.sample_rate} Hz，"
+                                     f"其他WAV文件为{wav_rate} Hz")
+                wav_rate = options['sample_rate'] = source.sample_rate
+        for position, (kind, value) in enumerate(inputs):
+            if kind == 'device':
+                index, channels = value
+                opened[position] = PyAudioSource(sample_rate=options['sample_rate'],
+                                                 frames_per_buffer=options['hop_size'],
+                                                 input_device_index=index, channels=channels)
+            elif kind == 'tone':
+                frequencies = [float(f) for f in value.split(',')]
+                opened[position] = ToneSource(frequencies, sample_rate=options['sample_rate'],
+                                              realtime=True)
+    except Exception:
+        for source in opened.values():
+            source.close()
+        raise
+    return [opened[position] for position in range(len(inputs))]
+
+
+def _format_result(channel_id, decided):
+    match = decided.get('match')
+    text = f"[通道{channel_id}] {decided['frequency']:.1f} Hz  SNR {decided['snr']:.1f} dB"
+    if match is None:
+        return text
+    if match['cup_index'] == -1:
+        return f"{text}  未匹配"
+    return f"{text}  {match['cup_index'] + 1}号杯子（置信度{match['confidence'] * 100:.1f}%）"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多通道/多工位并行检测")
+    parser.add_argument('--device', dest='inputs', action='append', default=[],
+                        type=lambda spec: ('device', parse_device(spec)), metavar='编号[:声道数]',
+                        help="麦克风输入 编号[:声道数]（编号可为default），可重复")
+    parser.add_argument('--wav', dest='inputs', action='append',
+                        type=lambda path: ('wav', path), metavar='PATH',
+                        help="WAV文件输入（全部声道），可重复")
+    parser.add_argument('--tone', dest='inputs', action='append',
+                        type=lambda frequencies: ('tone', frequencies), metavar='FREQS',
+                        help="合成敲击信号（单声道），逗号分隔的频率列表，可重复")
+    parser.add_argument('--channel-ids', default=None,
+                        help="逗号分隔的通道编号，按输入顺序依次对应各声道，默认为0, 1, 2...")
+    parser.add_argument('--profiles', default=None,
+                        help="各通道的杯子档案文件，{channel}替换为通道编号（不含时各通道共用）")
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认为min(通道数, CPU核数)")
+    parser.add_argument('--deployment', default=None, help="部署配置文件，见deployment.py")
+    parser.add_argument('--hop', type=int, default=None, help="帧移（采样点），优先于部署配置")
+    parser.add_argument('--max-peaks', type=int, default=None,
+                        help="每帧最多检测的峰数，优先于部署配置")
+    parser.add_argument('--realtime', action='store_true', help="WAV文件按实时速度回放")
+    args = parser.parse_args(argv)
+    if not args.inputs:
+        parser.error("至少需要一个输入（--device、--wav或--tone）")
+
+    try:
+        options = load_deployment(args.deployment)
+    except (OSError, ValueError) as e:
+        parser.error(f"部署配置无效：{e}")
+    options['hop_size'] = args.hop or options['hop_size'] or options['chunk_size'] // 2
+    if args.max_peaks is not None:
+        options['max_peaks'] = args.max_peaks
+    try:
+        sources = open_inputs(args.inputs, options, realtime=args.realtime)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"打开输入失败：{e}")
+        return 2
+
+    total = sum(source.channels for source in sources)
+    if args.channel_ids is None:
+        channel_ids = list(range(total))
+    else:
+        channel_ids = [cid.strip() for cid in args.channel_ids.split(',')]
+        if len(channel_ids) != total or len(set(channel_ids)) != total:
+            for source in sources:
+                source.close()
+            parser.error(f"--channel-ids须为{total}个互不相同的编号（各输入共{total}个声道）")
+    inputs = []
+    start = 0
+    for source in sources:
+        inputs.append((source, channel_ids[start:start + source.channels]))
+        start += source.channels
+
+    counts = {cid: {'detections': 0, 'matched': 0} for cid in channel_ids}
+
+    def on_results(results):
+        for result in results:
+            for decided in decided_results(result):
+                counts[result['channel']]['detections'] += 1
+                match = decided.get('match')
+                if match is not None and match['cup_index'] != -1:
+                    counts[result['channel']]['matched'] += 1
+                print(_format_result(result['channel'], decided), flush=True)
+
+    engine = MultiChannelEngine(channel_ids, num_workers=args.workers,
+                                pipeline_options=options)
+    print(f"{len(channel_ids)}个通道，{engine.num_workers}个工作进程，"
+          f"{options['sample_rate']} Hz，帧移{options['hop_size']}")
+    capture = MultiChannelCapture(inputs, engine, hop_size=options['hop_size'])
+    with engine:
+        # 各通道独立的杯子档案（学习过指纹的杯子按指纹匹配）
+        if args.profiles:
+            for cid in channel_ids:
+                path = args.profiles.replace('{channel}', str(cid))
+                detector = CupDetector(profile_path=path)
+                if detector.load_profiles():
+                    engine.set_detector(cid, detector)
+                    print(f"通道{cid}：已加载杯子档案{path}：{detector.location}")
+                else:
+                    print(f"通道{cid}：无杯子档案{path}，只报告频率")
+        try:
+            capture.run(on_results)
+        except KeyboardInterrupt:
+            print("用户终止。")
+        on_results(engine.close())
+    for cid in channel_ids:
+        print(f"通道{cid}：{counts[cid]['detections']}次检测，{counts[cid]['matched']}次匹配")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+自适应噪声谱估计
+在非敲击帧上对功率谱做指数平均，得到各频率bin的噪声功率；
+敲击帧按逐bin信噪比（帧功率 / 噪声功率）评估质量、选取峰值：
+持续的嗡嗡声及其谐波进入噪声谱后逐bin信噪比接近0 dB，不会再被当成敲击，
+而宽带噪声大的场地里真正的敲击也不会因低频段噪声能量高而被拒绝
+"""
+import numpy as np
+
+
+class NoiseSpectrumEstimator:
+    """
+    噪声功率谱的逐bin指数平均（上升慢、下降快，与OnsetDetector的噪声基底相同），
+    混入更新的敲击余振只会缓慢抬高噪声谱
+
+    只保存信号频段内的bin（其余频率不参与判决）；频段噪声总功率在更新时算好，
+    敲击帧计算信噪比时只读取峰值附近几个bin，不再对整个频谱求和。
+    """
+
+    def __init__(self, freqs, signal_band=(2500, 6000), alpha=0.05, alpha_down=0.3,
+                 min_updates=10):
+        """
+        Args:
+            freqs: 频率轴（Hz），与功率谱一一对应（AudioProcessor.freqs）
+            signal_band: 信号频段 (min_freq, max_freq)
+            alpha: 功率高于当前估计时的指数平均系数（跟随新出现的持续噪声）
+            alpha_down: 功率低于当前估计时的指数平均系数（快速跟随安静环境）
+            min_updates: 前多少帧取逐bin中位数作为初始估计（个别帧混入敲击也不受影响），
+                         之后才认为估计可用并开始指数平均
+        """
+        freqs = np.asarray(freqs)
+        self.signal_band = (float(signal_band[0]), float(signal_band[1]))
+        lo = int(np.searchsorted(freqs, self.signal_band[0], side='left'))
+        hi = int(np.searchsorted(freqs, self.signal_band[1], side='right'))
+        if hi - lo < 3:
+            raise ValueError(f"信号频段{signal_band}内的频率bin过少")
+        self.band = slice(lo, hi)
+        self.freqs = freqs[self.band]
+        self.resolution = float(freqs[1] - freqs[0])
+        self.alpha = alpha
+        self.alpha_down = alpha_down
+        self.min_updates = min_updates
+        self.reset()
+
+    def reset(self):
+        """清空估计"""
+        self.noise = None
+        self.band_noise = 0.0
+        self.updates = 0
+        self._warmup = []
+
+    @property
+    def ready(self):
+        """估计是否可用"""
+        return self.noise is not None
+
+    def update(self, power):
+        """
+        用一帧非敲击帧的功率谱更新估计
+
+        Args:
+            power: 完整功率谱（SpectralFrame.power）
+        """
+        band_power = power[self.band]
+        self.updates += 1
+        if self.noise is None:
+            self._warmup.append(np.array(band_power, dtype=np.float64))
+            if len(self._warmup) < self.min_updates:
+                return
+            # 指数分布的中位数为均值的ln2倍
+            self.noise = np.median(self._warmup, axis=0) / np.log(2)
+            self._warmup = []
+        else:
+            # noise += alpha * (power - noise)，逐bin原地更新
+            delta = band_power - self.noise
+            self.noise += np.where(delta > 0, self.alpha, self.alpha_down) * delta
+        np.maximum(self.noise, np.finfo(np.float64).tiny, out=self.noise)
+        self.band_noise = float(self.noise.sum())
+
+    def peak(self, power, min_snr):
+        """
+        信号频段内逐bin信噪比超过min_snr的bin中功率最大的一个
+        （只按信噪比选会选中敲击起振时频谱扩散到噪声较低处的bin）
+
+        Args:
+            power: 完整功率谱
+            min_snr: 逐bin信噪比门限（dB）
+
+        Returns:
+            tuple: (bin索引（完整频谱中的位置）, 该bin的信噪比（dB）)；
+                   没有bin超过门限时为信噪比最大的bin
+        """
+        band_power = power[self.band]
+        ratio = band_power / self.noise
+        above = ratio > 10 ** (min_snr / 10)
+        if above.any():
+            index = int(np.argmax(np.where(above, band_power, 0.0)))
+        else:
+            index = int(np.argmax(ratio))
+        return index + self.band.start, self._local_snr(power, index)
+
+    def above(self, power, min_snr):
+        """
+        逐bin信噪比超过min_snr的bin（多峰检测只在这些bin中选峰）
+
+        Returns:
+            np.ndarray: 与功率谱等长的布尔数组，信号频段外为False
+        """
+        mask = np.zeros(len(power), dtype=bool)
+        mask[self.band] = power[self.band] > self.noise * 10 ** (min_snr / 10)
+        return mask
+
+    def bin_snr(self, power, index):
+        """
+        指定bin（完整频谱中的位置）的信噪比（dB），频段外为-inf
+        """
+        local = index - self.band.start
+        if not 0 <= local < len(self.noise):
+            return float('-inf')
+        return self._local_snr(power, local)
+
+    def snr_at(self, frequency, energy):
+        """
+        给定频率处一个bin的功率相对噪声谱的信噪比（dB）（供定向检测使用，
+        其功率与完整FFT的bin功率同一量纲）
+        """
+        local = int(round((frequency - self.freqs[0]) / self.resolution))
+        if not 0 <= local < len(self.noise):
+            return float('-inf')
+        return float(10 * np.log10(energy / self._local_noise(local)))
+
+    def band_snr(self, power):
+        """整个信号频段的功率相对噪声功率（dB）"""
+        return float(10 * np.log10(float(power[self.band].sum()) / self.band_noise))
+
+    def _local_noise(self, local):
+        # 噪声取该bin及左右相邻bin的平均，单个bin的估计方差较大
+        noise = self.noise[max(local - 1, 0):local + 2]
+        return float(noise.sum()) / len(noise)
+
+    def _local_snr(self, power, local):
+        signal = float(power[self.band.start + local])
+        return float(10 * np.log10(signal / self._local_noise(local)))
+
+    def stats(self):
+        """
+        Returns:
+            dict: 更新次数、信号频段、频段平均噪声功率（dB）
+        """
+        mean = self.band_noise / len(self.freqs) if self.noise is not None else 0.0
+        return {
+            'updates': self.updates,
+            'signal_band': self.signal_band,
+            'noise_db': float(10 * np.log10(mean)) if mean > 0 else None
+        }
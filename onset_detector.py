@@ -0,0 +1,119 @@
+"""
+时域起振（敲击瞬态）检测
+只对敲击之后一段时间内的帧做完整频谱分析，静音帧直接跳过
+"""
+import numpy as np
+
+
+class OnsetDetector:
+    """
+    基于能量和能量突增（时域通量）的起振检测器，带自适应噪声基底
+
+    每个帧移只计算一次均方能量（一次点积），当能量同时满足：
+      1. 高于噪声基底 threshold_db 分贝；
+      2. 相比上一帧移上升 rise_db 分贝以上；
+    即判定为起振，并在之后 hold_time 秒内保持激活。
+    噪声基底只在非激活帧上做指数平均（下降快、上升慢），持续的背景声不会反复触发。
+    """
+
+    def __init__(self, sample_rate=12000, hop_size=2048, threshold_db=10.0, rise_db=3.0,
+                 hold_time=0.5, floor_alpha=0.05, floor_alpha_down=0.5, min_floor=1.0):
+        """
+        Args:
+            sample_rate: 采样率
+            hop_size: 帧移（采样点）
+            threshold_db: 起振能量需高于噪声基底的分贝数
+            rise_db: 起振能量相对上一帧移需上升的分贝数
+            hold_time: 起振后保持激活的时间（秒）
+            floor_alpha: 噪声基底上升时的指数平均系数
+            floor_alpha_down: 噪声基底下降时的指数平均系数（快速跟随安静环境）
+            min_floor: 噪声基底下限（均方能量），避免静音时阈值为0
+        """
+        self.threshold_ratio = 10 ** (threshold_db / 10)
+        self.rise_ratio = 10 ** (rise_db / 10)
+        self.hold_frames = max(1, int(np.ceil(hold_time * sample_rate / hop_size)))
+        self.floor_alpha = floor_alpha
+        self.floor_alpha_down = floor_alpha_down
+        self.min_floor = min_floor
+        self.reset()
+
+    def reset(self):
+        """重置状态"""
+        self.noise_floor = None
+        self.prev_energy = 0.0
+        self.energy = 0.0
+        self._hold = 0
+        self.frames_seen = 0
+        self.frames_active = 0
+        self.onsets = 0
+
+    def interrupt(self):
+        """音频中断（如录音丢失了若干帧移）：结束当前分析窗口，噪声基底保留"""
+        self.prev_energy = 0.0
+        self.energy = 0.0
+        self._hold = 0
+
+    @property
+    def active(self):
+        """当前是否处于起振后的分析窗口内"""
+        return self._hold > 0
+
+    def quiet(self, ratio=2.0):
+        """当前帧移是否为背景噪声（不在分析窗口内，且能量不超过噪声基底的ratio倍）"""
+        return (self._hold == 0 and self.noise_floor is not None
+                and self.energy <= max(self.noise_floor, self.min_floor) * ratio)
+
+    def update(self, samples):
+        """
+        输入一个帧移的新采样
+
+        Args:
+            samples: 一维采样数组
+
+        Returns:
+            bool: 是否应对当前帧做完整频谱分析
+        """
+        n = len(samples)
+        if n == 0:
+            return self.active
+        x = np.asarray(samples, dtype=np.float64)
+        energy = float(np.dot(x, x)) / n
+        self.energy = energy
+        self.frames_seen += 1
+
+        if self.noise_floor is None:
+            self.noise_floor = max(energy, self.min_floor)
+        floor = max(self.noise_floor, self.min_floor)
+
+        onset = (energy > floor * self.threshold_ratio
+                 and energy > self.prev_energy * self.rise_ratio)
+        if onset:
+            self._hold = self.hold_frames
+            self.onsets += 1
+        elif self._hold > 0:
+            self._hold -= 1
+
+        active = self._hold > 0
+        if active:
+            self.frames_active += 1
+        else:
+            # 仅在非激活帧上更新噪声基底，下降快、上升慢
+            alpha = self.floor_alpha if energy > self.noise_floor else self.floor_alpha_down
+            self.noise_floor += alpha * (energy - self.noise_floor)
+        self.prev_energy = energy
+        return active
+
+    def stats(self):
+        """
+        检测统计
+
+        Returns:
+            dict: 已处理帧数、激活帧数、起振次数、激活比例、当前噪声基底
+        """
+        return {
+            'frames_seen': self.frames_seen,
+            'frames_active': self.frames_active,
+            'onsets': self.onsets,
+            'active_ratio': self.frames_active / self.frames_seen if self.frames_seen else 0.0,
+            'noise_floor': self.noise_floor
+        }
@@ -0,0 +1,107 @@
+"""
+多峰跟踪
+多个杯子同时敲击时，一帧里有多个互不成谐波关系的峰（见AudioProcessor.find_peaks）。
+按频率把各帧的峰连成轨迹，每条轨迹有自己的序贯判决器（SequentialDecider），
+各杯子独立成簇、独立判决，同一帧可以给出多个杯子的识别结果
+"""
+from sequential_decision import SequentialDecider
+
+
+class PeakTrack:
+    """一条峰值轨迹"""
+
+    __slots__ = ('track_id', 'frequency', 'updated_at', 'decider')
+
+    def __init__(self, track_id, frequency, timestamp, decider):
+        self.track_id = track_id
+        self.frequency = frequency
+        self.updated_at = timestamp
+        self.decider = decider
+
+
+class PeakTracker:
+    """
+    逐帧峰值跟踪器
+
+    每帧的峰按强度从大到小依次归入频率最接近（不超过eps）且本帧尚未使用的轨迹，
+    找不到时新建轨迹；超过max_age没有新峰的轨迹被移除（与判决窗口时长相同，
+    同一个杯子隔一会儿再敲仍归入原轨迹）。轨迹数达到max_tracks时替换最久未更新的
+    """
+
+    def __init__(self, eps=30, max_tracks=8, max_age=2.0, **decider_options):
+        """
+        Args:
+            eps: 峰归入轨迹的最大频率差（Hz），同时作为各轨迹判决器的eps
+            max_tracks: 同时跟踪的最多轨迹数
+            max_age: 轨迹多久没有新峰后移除（秒）
+            decider_options: 其他SequentialDecider参数
+        """
+        self.eps = eps
+        self.max_tracks = max_tracks
+        self.max_age = max_age
+        self._decider_options = dict(decider_options, eps=eps, max_age=max_age)
+        self._tracks = []
+        self._next_id = 0
+        self._cups = None
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def set_cups(self, frequencies, stds, cup_indices=None):
+        """为全部轨迹（含之后新建的）启用候选杯子的SPRT，参数同SequentialDecider.set_cups"""
+        self._cups = (frequencies, stds, cup_indices)
+        for track in self._tracks:
+            track.decider.set_cups(frequencies, stds, cup_indices)
+
+    def clear_cups(self):
+        """关闭全部轨迹的SPRT"""
+        self._cups = None
+        for track in self._tracks:
+            track.decider.clear_cups()
+
+    def reset(self):
+        """清空全部轨迹"""
+        self._tracks = []
+
+    def update(self, frequencies, timestamp):
+        """
+        加入一帧的峰并判决
+
+        Args:
+            frequencies: 本帧各峰的频率（Hz），按强度从大到小排列
+            timestamp: 该帧的时刻（秒，单调递增）
+
+        Returns:
+            list: 与frequencies一一对应的(轨迹编号, SequentialDecider.add()的判决结果)
+        """
+        self._tracks = [track for track in self._tracks
+                        if timestamp - track.updated_at <= self.max_age]
+        used = set()
+        results = []
+        for frequency in frequencies:
+            frequency = float(frequency)
+            track = None
+            best = self.eps
+            for candidate in self._tracks:
+                distance = abs(candidate.frequency - frequency)
+                if distance <= best and candidate.track_id not in used:
+                    track = candidate
+                    best = distance
+            if track is None:
+                track = self._new_track(frequency, timestamp)
+            used.add(track.track_id)
+            track.frequency = frequency
+            track.updated_at = timestamp
+            results.append((track.track_id, track.decider.add(frequency, timestamp)))
+        return results
+
+    def _new_track(self, frequency, timestamp):
+        if len(self._tracks) >= self.max_tracks:
+            self._tracks.remove(min(self._tracks, key=lambda t: t.updated_at))
+        decider = SequentialDecider(**self._decider_options)
+        if self._cups is not None:
+            decider.set_cups(*self._cups)
+        track = PeakTrack(self._next_id, frequency, timestamp, decider)
+        self._next_id += 1
+        self._tracks.append(track)
+        return track
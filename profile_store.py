@@ -0,0 +1,332 @@
+"""
+已学习杯子档案的持久化存储
+紧凑的定长二进制格式（文件头 + NumPy结构化记录），启动时内存映射加载，
+保存时原子替换；记录中保存样本汇总量（数量、均值、二阶中心矩），
+可以增量细化，也可以合并多个工位学习的档案
+
+用法：
+    python profile_store.py show cup_profiles.acsp
+    python profile_store.py merge merged.acsp station1.acsp station2.acsp
+"""
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from fingerprint import FINGERPRINT_SIZE
+
+MAGIC = b'ACSP'
+FORMAT_VERSION = 1
+# 文件头：魔数、版本、记录数、记录字节数、指纹维数，补齐到32字节
+HEADER_FORMAT = '<4sHIIH'
+HEADER_SIZE = 32
+
+RECORD_DTYPE = np.dtype([
+    ('label', 'S32'),                        # 杯子名称（UTF-8）
+    ('cup_index', '<i4'),                    # 界面上的杯子编号（从0开始），-1表示无
+    ('count', '<i8'),                        # 频率样本数
+    ('freq_mean', '<f8'),                    # 频率均值（Hz）
+    ('freq_m2', '<f8'),                      # 频率二阶中心矩之和
+    ('freq_min', '<f8'),
+    ('freq_max', '<f8'),
+    ('fp_count', '<i8'),                     # 指纹样本数
+    ('fp_mean', '<f8', (FINGERPRINT_SIZE,)),
+    ('fp_m2', '<f8', (FINGERPRINT_SIZE,)),
+    ('updated', '<f8'),                      # 最后更新时间（Unix时间戳）
+    ('station', 'S16'),                      # 最后更新的工位
+])
+
+
+def _truncate_utf8(text, size):
+    """UTF-8编码并截断到size字节以内，不拆开多字节字符"""
+    encoded = text.encode('utf-8')
+    if len(encoded) <= size:
+        return encoded
+    return encoded[:size].decode('utf-8', errors='ignore').encode('utf-8')
+
+
+def _merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """Chan并行合并公式，返回(count, mean, m2)"""
+    total = count_a + count_b
+    if total == 0:
+        return 0, mean_a, m2_a
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / total
+    m2 = m2_a + m2_b + delta * delta * count_a * count_b / total
+    return total, mean, m2
+
+
+class ProfileStore:
+    """杯子档案集合"""
+
+    def __init__(self, records=None):
+        if records is None:
+            records = np.zeros(0, dtype=RECORD_DTYPE)
+        self._records = records
+        self._index = {label: i for i, label in enumerate(records['label'].tolist())}
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, label):
+        return self._encode(label) in self._index
+
+    @property
+    def labels(self):
+        return [label.decode('utf-8') for label in self._records['label'].tolist()]
+
+    @property
+    def records(self):
+        """底层结构化数组（加载后为只读内存映射）"""
+        return self._records
+
+    @staticmethod
+    def _encode(label):
+        encoded = label.encode('utf-8')
+        if len(encoded) > RECORD_DTYPE['label'].itemsize:
+            raise ValueError(f"杯子名称过长（最多{RECORD_DTYPE['label'].itemsize}字节）：{label}")
+        return encoded
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        加载档案文件
+
+        Args:
+            path: 文件路径
+            mmap: 是否内存映射（只读，修改时自动复制）
+
+        Returns:
+            ProfileStore: 档案集合
+        """
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError(f"档案文件头不完整：{path}")
+        magic, version, count, record_size, fp_size = struct.unpack_from(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise ValueError(f"不是杯子档案文件：{path}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"不支持的档案版本{version}（当前为{FORMAT_VERSION}）：{path}")
+        if record_size != RECORD_DTYPE.itemsize or fp_size != FINGERPRINT_SIZE:
+            raise ValueError(f"档案记录格式不匹配：{path}")
+        if count == 0:
+            return cls()
+        if mmap:
+            records = np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                                offset=HEADER_SIZE, shape=(count,))
+        else:
+            records = np.fromfile(path, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+        return cls(records)
+
+    def save(self, path):
+        """
+        原子保存：先写入同目录临时文件并fsync，再替换目标文件
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, len(self._records),
+                             RECORD_DTYPE.itemsize, FINGERPRINT_SIZE)
+        fd, tmp_path = tempfile.mkstemp(prefix='.profiles-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header.ljust(HEADER_SIZE, b'\0'))
+                f.write(np.ascontiguousarray(self._records).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _writable(self):
+        # 内存映射记录只读，首次修改时复制到内存
+        if isinstance(self._records, np.memmap) or not self._records.flags.writeable:
+            self._records = np.array(self._records)
+
+    def _slot(self, label):
+        encoded = self._encode(label)
+        index = self._index.get(encoded)
+        if index is None:
+            self._writable()
+            record = np.zeros(1, dtype=RECORD_DTYPE)
+            record['label'] = encoded
+            record['cup_index'] = -1
+            self._records = np.concatenate([self._records, record])
+            index = len(self._records) - 1
+            self._index[encoded] = index
+        return index
+
+    def update(self, label, frequencies, fingerprints=None, cup_index=None, replace=False,
+               station=''):
+        """
+        用新样本细化（或替换）一个杯子的档案
+
+        Args:
+            label: 杯子名称
+            frequencies: 频率样本
+            fingerprints: 指纹样本，形状为(n, FINGERPRINT_SIZE)
+            cup_index: 界面上的杯子编号
+            replace: True时丢弃旧样本汇总
+            station: 工位名称
+        """
+        freqs = np.asarray(frequencies, dtype=np.float64).ravel()
+        fps = (np.zeros((0, FINGERPRINT_SIZE)) if fingerprints is None
+               else np.asarray(fingerprints, dtype=np.float64).reshape(-1, FINGERPRINT_SIZE))
+        index = self._slot(label)
+        self._writable()
+        if replace:
+            keep_label, keep_cup = self._records[index]['label'], self._records[index]['cup_index']
+            self._records[index] = np.zeros((), dtype=RECORD_DTYPE)
+            self._records[index]['label'], self._records[index]['cup_index'] = keep_label, keep_cup
+        record = self._records[index]
+        if cup_index is not None:
+            record['cup_index'] = cup_index
+
+        if len(freqs):
+            count, mean, m2 = _merge_moments(int(record['count']), float(record['freq_mean']),
+                                             float(record['freq_m2']), len(freqs),
+                                             float(freqs.mean()), float(((freqs - freqs.mean()) ** 2).sum()))
+            had_samples = record['count'] > 0
+            record['freq_min'] = min(record['freq_min'], freqs.min()) if had_samples else freqs.min()
+            record['freq_max'] = max(record['freq_max'], freqs.max()) if had_samples else freqs.max()
+            record['count'], record['freq_mean'], record['freq_m2'] = count, mean, m2
+        if len(fps):
+            mean_b = fps.mean(axis=0)
+            count, mean, m2 = _merge_moments(int(record['fp_count']), record['fp_mean'].copy(),
+                                             record['fp_m2'].copy(), len(fps), mean_b,
+                                             ((fps - mean_b) ** 2).sum(axis=0))
+            record['fp_count'], record['fp_mean'], record['fp_m2'] = count, mean, m2
+        record['updated'] = time.time()
+        record['station'] = _truncate_utf8(station, RECORD_DTYPE['station'].itemsize)
+
+    def remove(self, label):
+        """删除一个杯子的档案"""
+        encoded = self._encode(label)
+        if encoded not in self._index:
+            return
+        keep = self._records['label'] != encoded
+        self._records = np.array(self._records[keep])
+        self._index = {name: i for i, name in enumerate(self._records['label'].tolist())}
+
+    def merge(self, other):
+        """
+        合并另一个档案集合（同名杯子合并样本汇总，其余直接加入）
+
+        Returns:
+            ProfileStore: self
+        """
+        for source in other.records:
+            label = source['label'].decode('utf-8')
+            index = self._slot(label)
+            self._writable()
+            record = self._records[index]
+            if record['cup_index'] < 0:
+                record['cup_index'] = source['cup_index']
+            if source['count']:
+                had_samples = record['count'] > 0
+                record['freq_min'] = (min(record['freq_min'], source['freq_min'])
+                                      if had_samples else source['freq_min'])
+                record['freq_max'] = (max(record['freq_max'], source['freq_max'])
+                                      if had_samples else source['freq_max'])
+                record['count'], record['freq_mean'], record['freq_m2'] = _merge_moments(
+                    int(record['count']), float(record['freq_mean']), float(record['freq_m2']),
+                    int(source['count']), float(source['freq_mean']), float(source['freq_m2']))
+            if source['fp_count']:
+                record['fp_count'], record['fp_mean'], record['fp_m2'] = _merge_moments(
+                    int(record['fp_count']), record['fp_mean'].copy(), record['fp_m2'].copy(),
+                    int(source['fp_count']), source['fp_mean'], source['fp_m2'])
+            if source['updated'] > record['updated']:
+                record['updated'] = source['updated']
+                record['station'] = source['station']
+        return self
+
+    def get(self, label):
+        """
+        查询一个杯子的统计信息
+
+        Returns:
+            dict: 频率均值、标准差、样本数、指纹均值和标准差；不存在时为None
+        """
+        index = self._index.get(self._encode(label))
+        if index is None:
+            return None
+        record = self._records[index]
+        count, fp_count = int(record['count']), int(record['fp_count'])
+        return {
+            'label': label,
+            'cup_index': int(record['cup_index']),
+            'mean_frequency': float(record['freq_mean']),
+            'std_deviation': float(np.sqrt(record['freq_m2'] / count)) if count else 0.0,
+            'count': count,
+            'min_frequency': float(record['freq_min']),
+            'max_frequency': float(record['freq_max']),
+            'fingerprint_mean': np.array(record['fp_mean'], dtype=np.float32),
+            'fingerprint_std': (np.sqrt(record['fp_m2'] / fp_count).astype(np.float32)
+                                if fp_count else np.zeros(FINGERPRINT_SIZE, dtype=np.float32)),
+            'fingerprint_count': fp_count,
+            'updated': float(record['updated']),
+            # 旧版本可能在多字节字符中间截断过工位名称
+            'station': record['station'].decode('utf-8', errors='ignore')
+        }
+
+    def to_location(self, num_cups):
+        """
+        转换为界面使用的location/location_stds列表（按cup_index放置）
+
+        Returns:
+            tuple: (location, location_stds)
+        """
+        location = [0.0] * num_cups
+        location_stds = [0.0] * num_cups
+        for label in self.labels:
+            info = self.get(label)
+            if 0 <= info['cup_index'] < num_cups and info['count']:
+                location[info['cup_index']] = info['mean_frequency']
+                location_stds[info['cup_index']] = info['std_deviation']
+        return location, location_stds
+
+    def load_fingerprints(self, matcher):
+        """将有指纹样本的档案写入FingerprintMatcher"""
+        for label in self.labels:
+            info = self.get(label)
+            if info['cup_index'] >= 0 and info['fingerprint_count']:
+                matcher.set_profile(info['cup_index'], info['fingerprint_mean'],
+                                    info['fingerprint_std'], info['fingerprint_count'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="杯子档案工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show = subparsers.add_parser('show', help="显示档案内容")
+    show.add_argument('path')
+    merge = subparsers.add_parser('merge', help="合并多个工位的档案")
+    merge.add_argument('output')
+    merge.add_argument('inputs', nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        start = time.perf_counter()
+        store = ProfileStore.load(args.path)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{len(store)}个档案，加载耗时{elapsed:.2f} ms")
+        for label in store.labels:
+            info = store.get(label)
+            print(f"{label:<16} 编号{info['cup_index']:>4}  {info['mean_frequency']:8.1f} Hz  "
+                  f"标准差{info['std_deviation']:6.1f}  样本{info['count']:>5}  "
+                  f"工位{info['station'] or '-'}")
+    elif args.command == 'merge':
+        store = ProfileStore()
+        for path in args.inputs:
+            store.merge(ProfileStore.load(path))
+        store.save(args.output)
+        print(f"已合并{len(args.inputs)}个文件，共{len(store)}个档案 -> {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+跨线程的检测结果批量传递
+worker线程把通过判决的结果写入预分配的结构化数组（定长紧凑记录，不再逐帧构造dict），
+最多按max_rate的频率整批交给界面线程：每批一次跨线程信号，界面负载与敲击密度无关
+"""
+import time
+
+import numpy as np
+
+from fingerprint import FINGERPRINT_SIZE
+
+RESULT_DTYPE = np.dtype([
+    ('captured_at', '<f8'),     # 读到该帧移的时刻（time.perf_counter）
+    ('frequency', '<f8'),       # 判决频率（簇均值，Hz）
+    ('raw_frequency', '<f8'),   # 本帧频率（Hz）
+    ('snr', '<f4'),             # 信噪比（dB）
+    ('std', '<f4'),             # 簇标准差（Hz），无簇时为NaN
+    ('cluster_size', '<i4'),
+    ('decided_cup', '<i2'),     # 序贯判决选出的杯子索引，-1为无
+    ('target_cup', '<i2'),      # 定向检测能量最大的杯子索引，-1为无
+    ('fingerprint', '<f4', (FINGERPRINT_SIZE,)),  # 无指纹时为NaN
+])
+
+
+def fill_record(record, result, captured_at):
+    """
+    把DetectionPipeline.process()的结果写入一条记录
+
+    Args:
+        record: RESULT_DTYPE数组中的一个元素（原地写入）
+        result: 流水线结果，'quality'不能为None
+        captured_at: 读到该帧移的时刻
+    """
+    quality = result['quality']
+    record['captured_at'] = captured_at
+    record['frequency'] = quality['frequency']
+    record['raw_frequency'] = result['raw_frequency']
+    record['snr'] = quality['snr']
+    record['std'] = quality.get('std', np.nan)
+    record['cluster_size'] = quality.get('cluster_size', 0)
+    record['decided_cup'] = quality.get('decided_cup', -1)
+    record['target_cup'] = quality.get('target_cup', -1)
+    fingerprint = quality.get('fingerprint')
+    record['fingerprint'] = np.nan if fingerprint is None else fingerprint
+
+
+def record_to_quality(record):
+    """
+    记录转换回quality_info格式的dict（供CupDetector.match/add_sample使用）
+
+    Returns:
+        dict: 'frequency'、'snr'、'cluster_size'、'captured_at'，有簇统计时含'std'，
+              有指纹时含'fingerprint'，有判决杯子时含'decided_cup'，定向检测时含'target_cup'
+    """
+    quality = {
+        'frequency': float(record['frequency']),
+        'snr': float(record['snr']),
+        'cluster_size': int(record['cluster_size']),
+        'captured_at': float(record['captured_at'])
+    }
+    if not np.isnan(record['std']):
+        quality['std'] = float(record['std'])
+    fingerprint = record['fingerprint']
+    if not np.isnan(fingerprint[0]):
+        quality['fingerprint'] = np.array(fingerprint)
+    if record['decided_cup'] >= 0:
+        quality['decided_cup'] = int(record['decided_cup'])
+    if record['target_cup'] >= 0:
+        quality['target_cup'] = int(record['target_cup'])
+    return quality
+
+
+class ResultBatcher:
+    """
+    检测结果攒批（只在worker线程中使用）
+
+    add()写入预分配数组；poll()在距上一批至少1/max_rate秒时取出整批副本。
+    worker每个帧移调用一次poll()，所以结果最多延迟max(1/max_rate, 一个帧移)。
+    攒满capacity条时丢弃最旧的记录。
+    """
+
+    def __init__(self, capacity=256, max_rate=30.0):
+        """
+        Args:
+            capacity: 一批最多记录数
+            max_rate: 每秒最多交付的批数
+        """
+        self.capacity = capacity
+        self.interval = 1.0 / max_rate
+        self._buffer = np.zeros(capacity, dtype=RESULT_DTYPE)
+        self._count = 0
+        self._last_flush = 0.0
+        # 统计计数
+        self.records = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, result, captured_at):
+        """写入一条通过判决的结果"""
+        if self._count == self.capacity:
+            self._buffer[:-1] = self._buffer[1:]
+            self._count -= 1
+            self.dropped += 1
+        fill_record(self._buffer[self._count], result, captured_at)
+        self._count += 1
+        self.records += 1
+
+    def poll(self, now=None):
+        """
+        到达交付间隔时取出整批
+
+        Returns:
+            np.ndarray: RESULT_DTYPE记录数组（副本）；没有记录或未到间隔时为None
+        """
+        if not self._count:
+            return None
+        now = time.monotonic() if now is None else now
+        if now - self._last_flush < self.interval:
+            return None
+        self._last_flush = now
+        return self.flush()
+
+    def flush(self):
+        """
+        不论间隔，取出全部记录
+
+        Returns:
+            np.ndarray: RESULT_DTYPE记录数组（副本）；没有记录时为None
+        """
+        if not self._count:
+            return None
+        batch = self._buffer[:self._count].copy()
+        self._count = 0
+        self.batches += 1
+        return batch
+
+    def stats(self):
+        """
+        Returns:
+            dict: 记录数、批数、丢弃数
+        """
+        return {'records': self.records, 'batches': self.batches, 'dropped': self.dropped}
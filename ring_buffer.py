@@ -0,0 +1,96 @@
+"""
+预分配的环形缓冲区
+为采集循环提供真正重叠的分析帧，稳态运行时不再分配新数组
+"""
+import numpy as np
+
+
+class FrameRingBuffer:
+    """
+    镜像环形缓冲区
+
+    存储区长度为两倍帧长，每个采样同时写入i和i + frame_size两个位置，
+    因此最近frame_size个采样始终是一段连续内存，可直接以视图交给FFT。
+    """
+
+    def __init__(self, frame_size=4096, hop_size=2048, dtype=np.float64):
+        if not 0 < hop_size <= frame_size:
+            raise ValueError(f"hop_size必须在(0, {frame_size}]范围内，实际为{hop_size}")
+        self.frame_size = frame_size
+        self.hop_size = hop_size
+        self._buffer = np.zeros(2 * frame_size, dtype=dtype)
+        self._write_pos = 0
+        self._pending = 0  # 上一帧之后新写入的采样数
+        self._filled = 0   # 已写入的有效采样数（最多frame_size）
+
+    @property
+    def filled(self):
+        """缓冲区中真实信号的采样数（启动阶段小于frame_size，其余为零填充）"""
+        return self._filled
+
+    def reset(self):
+        """清空缓冲区"""
+        self._buffer.fill(0)
+        self._write_pos = 0
+        self._pending = 0
+        self._filled = 0
+
+    def push(self, samples):
+        """
+        写入一段采样
+
+        Args:
+            samples: 一维采样数组（任意数值类型，写入时原地转换）
+
+        Returns:
+            bool: 自上一帧以来是否已累积满一个帧移，可以取新帧
+        """
+        size = self.frame_size
+        n = len(samples)
+        if n > size:
+            samples = samples[n - size:]
+            n = size
+
+        pos = self._write_pos
+        first = min(n, size - pos)
+        self._buffer[pos:pos + first] = samples[:first]
+        self._buffer[pos + size:pos + size + first] = samples[:first]
+        rest = n - first
+        if rest:
+            self._buffer[:rest] = samples[first:]
+            self._buffer[size:size + rest] = samples[first:]
+
+        self._write_pos = (pos + n) % size
+        self._filled = min(size, self._filled + n)
+        self._pending += n
+        return self._pending >= self.hop_size
+
+    def push_bytes(self, raw, dtype=np.int16):
+        """
+        直接写入PyAudio读取的原始字节
+        np.frombuffer只创建视图，不复制数据
+
+        Args:
+            raw: 原始字节数据
+            dtype: 采样格式
+
+        Returns:
+            bool: 同push
+        """
+        return self.push(np.frombuffer(raw, dtype=dtype))
+
+    def skip(self):
+        """消耗一个帧移但不取帧（该帧被跳过分析时调用）"""
+        self._pending = max(0, self._pending - self.hop_size)
+
+    def frame(self):
+        """
+        取出最近frame_size个采样（按时间顺序）并消耗一个帧移
+
+        Returns:
+            np.ndarray: 指向内部存储的只读视图，下一次push之前有效
+        """
+        self._pending = max(0, self._pending - self.hop_size)
+        view = self._buffer[self._write_pos:self._write_pos + self.frame_size]
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,158 @@
+"""
+序贯判决
+取代"累计25个有效频率后聚类、然后清空重来"的固定批次：
+维护一个按时间滑动的窗口，每加入一个频率就检查判决条件，满足即给出结果。
+两种条件（满足其一即可）：
+1. 最新敲击所在簇的标准差足够小（至少min_samples个样本）
+2. 已知杯子频率时，对候选杯子做序贯概率比检验（SPRT），
+   最可能的杯子对第二名和"不属于任何杯子"的对数似然比都超过阈值
+干净的敲击通常两三帧即可判决，不再需要等待整批样本
+"""
+import bisect
+import collections
+import math
+
+import numpy as np
+
+
+class SequentialDecider:
+    """滑动窗口序贯判决器"""
+
+    def __init__(self, eps=30, min_samples=3, max_std=5.0, max_age=2.0, max_window=25,
+                 alpha=0.01, beta=0.01, min_sprt_samples=2, sigma_floor=3.0):
+        """
+        Args:
+            eps: 簇内相邻频率的最大间隔（Hz），与DBSCAN的eps相同
+            min_samples: 按标准差判决所需的最少簇内样本数
+            max_std: 按标准差判决时簇的最大标准差（Hz）
+            max_age: 窗口时长（秒），更早的样本被移出
+            max_window: 窗口最多保留的样本数
+            alpha: SPRT误判为某杯子的概率上限
+            beta: SPRT漏判的概率上限
+            min_sprt_samples: SPRT判决所需的最少簇内样本数
+            sigma_floor: 杯子频率分布标准差的下限（Hz），学习样本过少时避免过度自信
+        """
+        self.eps = eps
+        self.min_samples = min_samples
+        self.max_std = max_std
+        self.max_age = max_age
+        self.min_sprt_samples = min_sprt_samples
+        self.sigma_floor = sigma_floor
+        # Wald阈值：对数似然比超过ln((1-β)/α)时接受
+        self.threshold = math.log((1 - beta) / alpha)
+        self._window = collections.deque(maxlen=max_window)
+        self._cups = None
+
+    def set_cups(self, frequencies, stds, cup_indices=None):
+        """
+        设置候选杯子（启用SPRT），频率为空时只按标准差判决
+
+        Args:
+            frequencies: 已学习杯子的频率（Hz）
+            stds: 各杯子的频率标准差（Hz）
+            cup_indices: 各杯子的索引，默认为0..n-1
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64).ravel()
+        if not len(frequencies):
+            self._cups = None
+            return
+        sigmas = np.maximum(np.asarray(stds, dtype=np.float64).ravel(), self.sigma_floor)
+        if cup_indices is None:
+            cup_indices = range(len(frequencies))
+        # "不属于任何杯子"：在覆盖全部杯子±eps的范围内均匀分布
+        span = frequencies.max() - frequencies.min() + 2 * self.eps
+        # 整体替换，判决线程每次只读取一次
+        self._cups = (frequencies, sigmas, -np.log(sigmas), [int(i) for i in cup_indices],
+                      -math.log(span))
+
+    def clear_cups(self):
+        """关闭SPRT"""
+        self._cups = None
+
+    def reset(self):
+        """清空窗口"""
+        self._window.clear()
+
+    def __len__(self):
+        return len(self._window)
+
+    def add(self, frequency, timestamp):
+        """
+        加入一个有效频率并判决
+
+        Args:
+            frequency: 频率（Hz）
+            timestamp: 该帧的时刻（秒，单调递增）
+
+        Returns:
+            dict: 'decided'是否满足判决条件，'method'为'sprt'、'std'或None，
+                  'frequency'、'std'、'cluster_size'为最新样本所在簇的均值、标准差和大小，
+                  'window_size'为窗口样本数，'cup_index'为SPRT最可能的杯子
+                  （未启用或不如"不属于任何杯子"时为-1），
+                  'llr'为其对数似然比（未启用时为None）
+        """
+        window = self._window
+        window.append((timestamp, float(frequency)))
+        while window and timestamp - window[0][0] > self.max_age:
+            window.popleft()
+
+        members = self._cluster_of_latest()
+        count = len(members)
+        mean = sum(members) / count
+        std = math.sqrt(sum((f - mean) ** 2 for f in members) / count)
+        decision = {
+            'decided': False,
+            'method': None,
+            'frequency': mean,
+            'std': std,
+            'cluster_size': count,
+            'window_size': len(window),
+            'cup_index': -1,
+            'llr': None
+        }
+
+        cups = self._cups
+        if cups is not None:
+            cup_index, llr = self._sprt(cups, members)
+            decision['cup_index'] = cup_index
+            decision['llr'] = llr
+            if count >= self.min_sprt_samples and llr >= self.threshold:
+                decision['decided'] = True
+                decision['method'] = 'sprt'
+                return decision
+        if count >= self.min_samples and std <= self.max_std:
+            decision['decided'] = True
+            decision['method'] = 'std'
+        return decision
+
+    def _cluster_of_latest(self):
+        """窗口中与最新样本相连（相邻间隔不超过eps）的全部频率"""
+        latest = self._window[-1][1]
+        values = sorted(f for _, f in self._window)
+        index = bisect.bisect_left(values, latest)
+        lo = index
+        while lo > 0 and values[lo] - values[lo - 1] <= self.eps:
+            lo -= 1
+        hi = index
+        while hi + 1 < len(values) and values[hi + 1] - values[hi] <= self.eps:
+            hi += 1
+        return values[lo:hi + 1]
+
+    def _sprt(self, cups, members):
+        """
+        簇内样本在各杯子正态模型下的累计对数似然，返回最可能的杯子和它对
+        第二名（含"不属于任何杯子"）的对数似然比
+        """
+        frequencies, sigmas, log_norm, cup_indices, log_background = cups
+        samples = np.asarray(members)
+        z = (samples[:, None] - frequencies[None, :]) / sigmas[None, :]
+        log_likelihood = ((log_norm - 0.5 * (z * z)).sum(axis=0)
+                          - 0.5 * math.log(2 * math.pi) * len(samples))
+        background = log_background * len(samples)
+        best = int(np.argmax(log_likelihood))
+        if log_likelihood[best] <= background:
+            return -1, float(log_likelihood[best] - background)
+        runner_up = background
+        if len(log_likelihood) > 1:
+            runner_up = max(runner_up, float(np.partition(log_likelihood, -2)[-2]))
+        return cup_indices[best], float(log_likelihood[best] - runner_up)
@@ -0,0 +1,701 @@
+"""
+检测会话录制与确定性回放
+现场误识别或卡顿时，录下原始音频、逐帧移的分析结果和模式切换/识别事件，
+事后在开发机上用同一套DetectionPipeline和CupDetector逐帧重放，对比判决和耗时
+
+文件格式（小端）：32字节文件头（魔数、版本、采样率、帧长、帧移），之后是一串数据块，
+每块为块头（类型、首个帧移序号、条数、字节数）+ 数据：
+    META  JSON：流水线参数、音频源、工位、开始时间
+    AUDI  int16原始采样（若干帧移首尾相接，各帧移长度见FRAM）
+    FRAM  FRAME_DTYPE逐帧移记录（含通过过滤、判决结果和处理耗时）
+    EVNT  JSON事件列表（学习、识别模式及杯子表快照、界面/服务的匹配结果），
+          按发生时已录制的帧移数打上序号
+采集线程只把数据写入预分配的缓冲区，攒满chunk_hops个帧移后交给后台写线程，
+写入队列满时丢弃这一块的音频（事件保留到下一块），不会阻塞采集
+
+用法：
+    python session_log.py show session.acsl
+    python session_log.py replay session.acsl --output replay.json
+"""
+import argparse
+import json
+import platform
+import queue
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b'ACSL'
+FORMAT_VERSION = 1
+# 文件头：魔数、版本、采样率、帧长、帧移，补齐到32字节
+HEADER_FORMAT = '<4sHIII'
+HEADER_SIZE = 32
+# 块头：类型、首个帧移序号、条数、数据字节数
+CHUNK_FORMAT = '<4sqII'
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_FORMAT)
+
+CHUNK_META = b'META'
+CHUNK_AUDIO = b'AUDI'
+CHUNK_FRAMES = b'FRAM'
+CHUNK_EVENTS = b'EVNT'
+
+# 逐帧移结果：未分析或未通过质量过滤、通过过滤（尚未判决）、已判决
+STATUS_NONE = 0
+STATUS_ACCEPTED = 1
+STATUS_DECIDED = 2
+
+FRAME_DTYPE = np.dtype([
+    ('hop', '<i8'),             # 帧移序号（从1开始，与DetectionPipeline的计数一致）
+    ('captured_at', '<f8'),     # 读到该帧移的时刻
+    ('elapsed', '<f4'),         # DetectionPipeline.process()耗时（秒）
+    ('samples', '<i4'),         # 本帧移的采样点数
+    ('status', 'i1'),           # STATUS_*
+    ('raw_frequency', '<f8'),   # 本帧频率（Hz），未通过过滤时为NaN
+    ('frequency', '<f8'),       # 判决频率（Hz），未判决时为NaN
+    ('snr', '<f4'),             # 信噪比（dB），未通过过滤时为NaN
+    ('cluster_size', '<i4'),
+    ('decided_cup', '<i2'),     # 序贯判决选出的杯子索引，-1为无
+    ('target_cup', '<i2'),      # 定向检测能量最大的杯子索引，-1为无
+])
+
+
+def fill_frame(frame, hop, result, captured_at, elapsed, samples):
+    """
+    把DetectionPipeline.process()的返回值写入一条FRAME_DTYPE记录
+    （多峰模式下为最强的峰，其余峰的判决通过回放时的识别结果对比）
+
+    Args:
+        frame: FRAME_DTYPE数组中的一个元素（原地写入）
+        hop: 帧移序号
+        result: process()的返回值（可为None）
+        captured_at: 读到该帧移的时刻
+        elapsed: process()耗时（秒）
+        samples: 本帧移的采样点数
+    """
+    frame['hop'] = hop
+    frame['captured_at'] = captured_at
+    frame['elapsed'] = elapsed
+    frame['samples'] = samples
+    frame['cluster_size'] = 0
+    frame['decided_cup'] = -1
+    frame['target_cup'] = -1
+    frame['frequency'] = np.nan
+    if result is None:
+        frame['status'] = STATUS_NONE
+        frame['raw_frequency'] = np.nan
+        frame['snr'] = np.nan
+        return
+    frame['raw_frequency'] = result['raw_frequency']
+    frame['snr'] = result['snr']
+    frame['target_cup'] = result.get('target_cup', -1)
+    quality = result['quality']
+    if quality is None:
+        frame['status'] = STATUS_ACCEPTED
+        return
+    frame['status'] = STATUS_DECIDED
+    frame['frequency'] = quality['frequency']
+    frame['cluster_size'] = quality.get('cluster_size', 0)
+    frame['decided_cup'] = quality.get('decided_cup', -1)
+
+
+def detector_snapshot(detector):
+    """
+    杯子表快照（JSON可序列化），回放时据此重建同样的匹配器
+
+    Args:
+        detector: CupDetector
+
+    Returns:
+        dict: 杯子频率、标准差、匹配参数和指纹档案
+    """
+    matcher = detector.fingerprint_matcher
+    return {
+        'location': [float(f) for f in detector.location],
+        'location_stds': [float(s) for s in detector.location_stds],
+        'base_tolerance': detector.cup_matcher.base_tolerance,
+        'confidence_threshold': detector.cup_matcher.confidence_threshold,
+        'fingerprints': {
+            'confidence_threshold': matcher.confidence_threshold,
+            'cup_indices': matcher.cup_indices.tolist(),
+            'means': matcher.means.tolist(),
+            'scales': matcher.scales.tolist(),
+            'counts': matcher.counts.tolist()
+        }
+    }
+
+
+def restore_detector(snapshot):
+    """
+    由detector_snapshot()的结果重建CupDetector（不关联档案文件）
+
+    Returns:
+        CupDetector: 杯子表和匹配器与快照时相同
+    """
+    from cup_detector import CupDetector
+    from fingerprint import FINGERPRINT_SIZE
+
+    location = list(snapshot['location'])
+    detector = CupDetector(num_cups=len(location), base_tolerance=snapshot['base_tolerance'],
+                           confidence_threshold=snapshot['confidence_threshold'])
+    detector.location = location
+    detector.location_stds = list(snapshot['location_stds'])
+    detector.cup_matcher.set_cups(detector.location, detector.location_stds)
+    fingerprints = snapshot['fingerprints']
+    matcher = detector.fingerprint_matcher
+    matcher.confidence_threshold = fingerprints['confidence_threshold']
+    matcher.cup_indices = np.array(fingerprints['cup_indices'], dtype=np.int64)
+    matcher.means = np.array(fingerprints['means'], dtype=np.float32).reshape(-1, FINGERPRINT_SIZE)
+    matcher.scales = np.array(fingerprints['scales'], dtype=np.float32).reshape(-1, FINGERPRINT_SIZE)
+    matcher.counts = np.array(fingerprints['counts'], dtype=np.int64)
+    return detector
+
+
+class SessionRecorder:
+    """
+    会话录制器
+
+    record()只在采集线程中调用；event()、snapshot()、match()可从任意线程调用，
+    事件序号为调用时已录制的帧移数（回放时在下一个帧移之前执行）。
+    """
+
+    def __init__(self, path, sample_rate, chunk_size, hop_size, metadata=None,
+                 chunk_hops=64, queue_size=16):
+        """
+        Args:
+            path: 输出文件路径
+            sample_rate: 采样率
+            chunk_size: FFT帧长
+            hop_size: 帧移（采样点），每个帧移的缓冲区按此预分配
+            metadata: 写入META块的附加信息，'pipeline'为回放时构建DetectionPipeline的参数
+            chunk_hops: 每块包含的帧移数
+            queue_size: 写线程队列容量（块数），满时丢弃音频块
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.hop_size = hop_size
+        self.metadata = dict(metadata or {})
+        self.chunk_hops = chunk_hops
+        self.hops = 0
+        self._audio = np.empty(chunk_hops * hop_size, dtype=np.int16)
+        self._frames = np.zeros(chunk_hops, dtype=FRAME_DTYPE)
+        self._audio_used = 0
+        self._frame_count = 0
+        self._events = []
+        self._events_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._thread = None
+        # 统计计数
+        self.chunks = 0
+        self.bytes_written = 0
+        self.dropped_hops = 0
+
+    def start(self):
+        """打开文件、写入文件头和META块，启动写线程"""
+        if self._file is not None:
+            return self
+        self._file = open(self.path, 'wb')
+        header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, self.sample_rate,
+                             self.chunk_size, self.hop_size)
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+        metadata = {'created': time.time(), 'station': platform.node()}
+        metadata.update(self.metadata)
+        self._write_chunk(CHUNK_META, 0, 1, json.dumps(metadata, ensure_ascii=False).encode('utf-8'))
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def record(self, samples, result, captured_at, elapsed):
+        """
+        录制一个帧移（采集线程中调用）
+
+        Args:
+            samples: 本帧移的int16采样
+            result: DetectionPipeline.process()的返回值
+            captured_at: 读到该帧移的时刻
+            elapsed: process()耗时（秒）
+        """
+        count = len(samples)
+        if self._audio_used + count > len(self._audio):
+            self._flush()
+            if count > len(self._audio):
+                self._audio = np.empty(count, dtype=np.int16)
+        self._audio[self._audio_used:self._audio_used + count] = samples
+        self._audio_used += count
+        self.hops += 1
+        fill_frame(self._frames[self._frame_count], self.hops, result, captured_at, elapsed,
+                   count)
+        self._frame_count += 1
+        if self._frame_count == self.chunk_hops:
+            self._flush()
+
+    def event(self, kind, **fields):
+        """
+        记录一个事件
+
+        Args:
+            kind: 'learn'（cup）、'learned'（CupDetector.finish_learning()的结果）、
+                  'detect'、'idle'、'cups'（snapshot()）、'match'（match()）
+            fields: JSON可序列化的附加字段
+        """
+        fields['type'] = kind
+        fields['hop'] = self.hops
+        with self._events_lock:
+            self._events.append(fields)
+
+    def snapshot(self, detector):
+        """记录当前杯子表（进入识别模式前调用，回放时据此重建匹配器）"""
+        self.event('cups', **detector_snapshot(detector))
+
+    def match(self, captured_at, match_result):
+        """
+        记录一次识别结果
+
+        Args:
+            captured_at: 被识别的检测结果的captured_at（与FRAM记录对应）
+            match_result: CupDetector.match()的返回值
+        """
+        self.event('match', captured_at=float(captured_at),
+                   cup_index=int(match_result['cup_index']),
+                   confidence=float(match_result['confidence']))
+
+    def close(self):
+        """写出剩余数据，结束写线程并关闭文件"""
+        if self._file is None:
+            return
+        self._flush(block=True)
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        self._file = None
+
+    def stats(self):
+        """
+        Returns:
+            dict: 已录制帧移数、写出的块数和字节数、因写入队列满丢弃的帧移数
+        """
+        return {'hops': self.hops, 'chunks': self.chunks, 'bytes': self.bytes_written,
+                'dropped_hops': self.dropped_hops}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _flush(self, block=False):
+        """把当前缓冲区打包交给写线程（block为False时队列满则丢弃）"""
+        with self._events_lock:
+            events, self._events = self._events, []
+        item = []
+        if self._frame_count:
+            first_hop = int(self._frames[0]['hop'])
+            item.append((CHUNK_AUDIO, first_hop, self._audio_used,
+                         self._audio[:self._audio_used].tobytes()))
+            item.append((CHUNK_FRAMES, first_hop, self._frame_count,
+                         self._frames[:self._frame_count].tobytes()))
+        if events:
+            item.append((CHUNK_EVENTS, events[0]['hop'], len(events),
+                         json.dumps(events, ensure_ascii=False).encode('utf-8')))
+        dropped = self._frame_count
+        self._audio_used = 0
+        self._frame_count = 0
+        if not item:
+            return
+        try:
+            self._queue.put(item, block=block)
+        except queue.Full:
+            # 丢弃音频和逐帧记录，事件留到下一块
+            self.dropped_hops += dropped
+            if events:
+                with self._events_lock:
+                    self._events[:0] = events
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            for chunk in item:
+                self._write_chunk(*chunk)
+            self._file.flush()
+
+    def _write_chunk(self, kind, hop, count, payload):
+        self._file.write(struct.pack(CHUNK_FORMAT, kind, hop, count, len(payload)))
+        self._file.write(payload)
+        self.chunks += 1
+        self.bytes_written += CHUNK_HEADER_SIZE + len(payload)
+
+
+def load_session(path):
+    """
+    读取会话文件（末尾不完整的块被忽略，录制中断的文件也能读取）
+
+    Returns:
+        dict: 'sample_rate'、'chunk_size'、'hop_size'、'metadata'，
+              'audio'为全部int16采样，'frames'为FRAME_DTYPE数组，
+              'events'为按帧移序号排序的事件列表，'gaps'为丢失的帧移段[(起, 止)]
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f"会话文件头不完整：{path}")
+    magic, version, sample_rate, chunk_size, hop_size = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != MAGIC:
+        raise ValueError(f"不是会话录制文件：{path}")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"不支持的会话文件版本{version}（当前为{FORMAT_VERSION}）：{path}")
+
+    metadata = {}
+    audio, frames, events = [], [], []
+    offset = HEADER_SIZE
+    while offset + CHUNK_HEADER_SIZE <= len(data):
+        kind, hop, count, size = struct.unpack_from(CHUNK_FORMAT, data, offset)
+        offset += CHUNK_HEADER_SIZE
+        if offset + size > len(data):
+            break
+        payload = data[offset:offset + size]
+        offset += size
+        if kind == CHUNK_META:
+            metadata = json.loads(payload.decode('utf-8'))
+        elif kind == CHUNK_AUDIO:
+            audio.append(np.frombuffer(payload, dtype='<i2'))
+        elif kind == CHUNK_FRAMES:
+            frames.append(np.frombuffer(payload, dtype=FRAME_DTYPE))
+        elif kind == CHUNK_EVENTS:
+            events.extend(json.loads(payload.decode('utf-8')))
+
+    frames = np.concatenate(frames) if frames else np.zeros(0, dtype=FRAME_DTYPE)
+    audio = np.concatenate(audio) if audio else np.zeros(0, dtype=np.int16)
+    if len(audio) != int(frames['samples'].sum()):
+        raise ValueError(f"音频与逐帧记录不一致：{path}")
+    hops = frames['hop']
+    breaks = np.flatnonzero(np.diff(hops) != 1)
+    gaps = [(int(hops[i]) + 1, int(hops[i + 1]) - 1) for i in breaks]
+    if len(hops) and hops[0] != 1:
+        gaps.insert(0, (1, int(hops[0]) - 1))
+    # 同一帧移序号的事件保持发生顺序
+    events.sort(key=lambda e: e['hop'])
+    return {
+        'sample_rate': sample_rate,
+        'chunk_size': chunk_size,
+        'hop_size': hop_size,
+        'metadata': metadata,
+        'audio': audio,
+        'frames': frames,
+        'events': events,
+        'gaps': gaps
+    }
+
+
+def _latency_summary(seconds):
+    """耗时分布（毫秒）"""
+    if not len(seconds):
+        return {'count': 0}
+    p50, p99 = np.percentile(seconds, [50, 99]) * 1000
+    return {'count': int(len(seconds)), 'p50_ms': float(p50), 'p99_ms': float(p99),
+            'max_ms': float(np.max(seconds) * 1000)}
+
+
+def replay_session(session, tolerance=0.01, max_diffs=20):
+    """
+    逐帧重放会话并与录制结果对比
+
+    按录制时的参数构建DetectionPipeline，按帧移序号在相同位置执行学习、识别模式切换
+    （识别模式使用录制的杯子表快照），每个帧移计时；录制的识别结果用回放得到的
+    同一帧判决重新匹配（多峰模式下同一帧的多次识别按顺序对应各个已判决的峰）。
+    界面线程的事件序号可能与实际生效的帧移相差一个，
+    这种情况会表现为边界处个别帧的差异。
+
+    录制时写入跟不上丢失的帧移（见load_session()的'gaps'）不会被当作连续音频喂给流水线：
+    回放到缺口处时按丢失的帧移数推进流水线的帧移计数（DetectionPipeline.skip_hops()），
+    帧移序号与录制一致；缺口之后环形缓冲区重新填满、判决窗口移出缺口时刻之前，
+    这段帧移（及其识别结果）的实时状态依赖丢失的音频，单独统计而不计入不一致，
+    识别结果对应丢失帧移的也不对比；学习期间有缺口时学习结果同样不对比。
+
+    Args:
+        session: load_session()的结果
+        tolerance: 频率差超过多少Hz算作不一致
+        max_diffs: 报告中最多列出的不一致条数
+
+    Returns:
+        dict: 'frames'为回放的FRAME_DTYPE数组，'frame_diffs'、'match_diffs'、
+              'learning'为判决对比，'timing'为录制与回放的耗时分布和最慢帧移，
+              'capture'为采集间隔统计，'gaps'为录制中丢失的帧移段，
+              'resync_frames'、'resync_mismatches'为缺口之后重新同步的帧移数及其中的不一致数，
+              'lost_matches'为对应丢失帧移的识别结果数，
+              'consistent'为缺口之外的判决是否完全一致
+    """
+    from cup_detector import CupDetector
+    from detection_pipeline import DetectionPipeline, decided_results
+
+    recorded = session['frames']
+    options = dict(session['metadata'].get('pipeline', {}))
+    options.update(sample_rate=session['sample_rate'], chunk_size=session['chunk_size'],
+                   hop_size=session['hop_size'])
+    pipeline = DetectionPipeline(**options)
+    detector = CupDetector()
+    replayed = np.zeros(len(recorded), dtype=FRAME_DTYPE)
+    decided = {}
+    matched = {}
+    hop_of_capture = {float(c): int(h) for c, h in zip(recorded['captured_at'], recorded['hop'])}
+    match_diffs = []
+    matches = 0
+    lost_matches = 0
+    learning = []
+    learning_active = False
+    learn_hop = None
+    resync = np.zeros(len(recorded), dtype=bool)
+    resync_hops = set()
+    gaps = session['gaps']
+
+    def apply(event):
+        nonlocal detector, matches, lost_matches, learning_active, learn_hop
+        kind = event['type']
+        if kind == 'cups':
+            detector = restore_detector(event)
+        elif kind == 'detect':
+            detector.cancel_learning()
+            learning_active = False
+            pipeline.set_targets(*detector.targets())
+        elif kind == 'idle':
+            detector.cancel_learning()
+            learning_active = False
+            pipeline.clear_targets()
+        elif kind == 'learn':
+            pipeline.clear_targets()
+            detector.start_learning(int(event['cup']))
+            learning_active = True
+            learn_hop = event['hop']
+        elif kind == 'learned':
+            result = detector.finish_learning()
+            learning_active = False
+            start = event['hop'] if learn_hop is None else learn_hop
+            learning.append({'cup': event.get('cup_number'),
+                             'recorded_frequency': event.get('frequency'),
+                             'replayed_frequency': result['frequency'],
+                             'recorded_samples': event.get('samples'),
+                             'replayed_samples': result['samples'],
+                             # 学习期间丢失过帧移（或仍在重新同步）时不对比
+                             'gap': any(first <= event['hop'] and last >= start
+                                        for first, last in gaps)
+                                    or any(start < hop <= event['hop'] for hop in resync_hops)})
+            learn_hop = None
+        elif kind == 'match':
+            matches += 1
+            hop = hop_of_capture.get(event['captured_at'])
+            if hop is None:
+                # 被识别的帧移在录制时丢失
+                lost_matches += 1
+                return
+            if hop in resync_hops:
+                return
+            index = matched.get(hop, 0)
+            matched[hop] = index + 1
+            qualities = decided.get(hop, [])
+            quality = qualities[index] if index < len(qualities) else None
+            if quality is None:
+                match_diffs.append({'hop': hop, 'recorded_cup': event['cup_index'],
+                                    'replayed_cup': None})
+                return
+            result = detector.match(quality)
+            if (result['cup_index'] != event['cup_index']
+                    or abs(result['confidence'] - event['confidence']) > 1e-6):
+                match_diffs.append({'hop': hop, 'recorded_cup': event['cup_index'],
+                                    'replayed_cup': int(result['cup_index']),
+                                    'recorded_confidence': event['confidence'],
+                                    'replayed_confidence': float(result['confidence'])})
+
+    events = session['events']
+    audio = session['audio']
+    next_event = 0
+    offset = 0
+    expected_hop = 1
+    resync_until = 0
+    clock = time.perf_counter
+    for i, frame in enumerate(recorded):
+        hop = int(frame['hop'])
+        while next_event < len(events) and events[next_event]['hop'] < hop:
+            apply(events[next_event])
+            next_event += 1
+        if hop > expected_hop:
+            # 录制时丢失了这些帧移：帧移计数跳过缺口，之后一段帧移重新同步
+            resync_until = hop + pipeline.skip_hops(hop - expected_hop)
+        expected_hop = hop + 1
+        if hop < resync_until:
+            resync[i] = True
+            resync_hops.add(hop)
+        samples = audio[offset:offset + frame['samples']]
+        offset += frame['samples']
+        start = clock()
+        result = pipeline.process(samples)
+        elapsed = clock() - start
+        fill_frame(replayed[i], hop, result, frame['captured_at'], elapsed, len(samples))
+        qualities = [item['quality'] for item in decided_results(result)]
+        if qualities:
+            decided[hop] = qualities
+        for quality in qualities:
+            # 与界面/服务相同：样本稳定后不再加入
+            if learning_active and detector.add_sample(quality):
+                learning_active = False
+    for event in events[next_event:]:
+        apply(event)
+
+    # 逐帧对比
+    frame_diffs = []
+    mismatched = 0
+    resync_mismatched = 0
+    for rec, rep, resyncing in zip(recorded, replayed, resync):
+        fields = []
+        if rec['status'] != rep['status']:
+            fields.append('status')
+        else:
+            for name in ('raw_frequency', 'frequency'):
+                a, b = rec[name], rep[name]
+                if not (np.isnan(a) and np.isnan(b)) and not abs(a - b) <= tolerance:
+                    fields.append(name)
+            for name in ('decided_cup', 'target_cup'):
+                if rec[name] != rep[name]:
+                    fields.append(name)
+        if fields and resyncing:
+            resync_mismatched += 1
+        elif fields:
+            mismatched += 1
+            if len(frame_diffs) < max_diffs:
+                frame_diffs.append({
+                    'hop': int(rec['hop']),
+                    'fields': fields,
+                    'recorded': {f: rec[f].item() for f in ('status', 'raw_frequency',
+                                                              'frequency', 'decided_cup')},
+                    'replayed': {f: rep[f].item() for f in ('status', 'raw_frequency',
+                                                              'frequency', 'decided_cup')}
+                })
+
+    analyzed = recorded['status'] > STATUS_NONE
+    slowest = np.argsort(recorded['elapsed'])[::-1][:5]
+    hop_seconds = session['hop_size'] / session['sample_rate']
+    intervals = np.diff(recorded['captured_at'])
+    learning_diffs = [entry for entry in learning
+                      if not entry['gap']
+                      and entry['recorded_frequency'] != entry['replayed_frequency']
+                      and (entry['recorded_frequency'] is None
+                           or entry['replayed_frequency'] is None
+                           or abs(entry['recorded_frequency'] - entry['replayed_frequency'])
+                           > tolerance)]
+    return {
+        'frames': replayed,
+        'hops': int(len(recorded)),
+        'frame_mismatches': mismatched,
+        'frame_diffs': frame_diffs,
+        'matches': matches,
+        'match_mismatches': len(match_diffs),
+        'match_diffs': match_diffs[:max_diffs],
+        'learning': learning,
+        'timing': {
+            'recorded': _latency_summary(recorded['elapsed']),
+            'replayed': _latency_summary(replayed['elapsed']),
+            'recorded_analyzed': _latency_summary(recorded['elapsed'][analyzed]),
+            'replayed_analyzed': _latency_summary(replayed['elapsed'][analyzed]),
+            'slowest': [{'hop': int(recorded['hop'][i]),
+                         'recorded_ms': float(recorded['elapsed'][i] * 1000),
+                         'replayed_ms': float(replayed['elapsed'][i] * 1000)}
+                        for i in slowest]
+        },
+        'capture': {
+            'hop_ms': hop_seconds * 1000,
+            'max_interval_ms': float(intervals.max() * 1000) if len(intervals) else 0.0,
+            # 采集间隔超过两个帧移的次数（采集线程被阻塞或设备卡顿）
+            'stalls': int(np.sum(intervals > 2 * hop_seconds))
+        },
+        'gaps': gaps,
+        'resync_frames': int(resync.sum()),
+        'resync_mismatches': resync_mismatched,
+        'lost_matches': lost_matches,
+        'consistent': not mismatched and not match_diffs and not learning_diffs
+    }
+
+
+def format_replay_report(report):
+    """回放报告的文本摘要"""
+    lines = [f"帧移 {report['hops']} | 逐帧不一致 {report['frame_mismatches']} | "
+             f"识别 {report['matches']}条，不一致 {report['match_mismatches']}"]
+    for entry in report['learning']:
+        lines.append(f"学习 {entry['cup']}号：录制 {entry['recorded_frequency']} Hz "
+                     f"（{entry['recorded_samples']}个样本） 回放 {entry['replayed_frequency']} Hz "
+                     f"（{entry['replayed_samples']}个样本）")
+    for diff in report['frame_diffs']:
+        lines.append(f"  帧移{diff['hop']} {','.join(diff['fields'])}：录制 {diff['recorded']} "
+                     f"回放 {diff['replayed']}")
+    for diff in report['match_diffs']:
+        lines.append(f"  识别 帧移{diff['hop']}：录制 {diff['recorded_cup']} "
+                     f"回放 {diff['replayed_cup']}")
+    timing = report['timing']
+    for name, label in (('recorded_analyzed', '录制'), ('replayed_analyzed', '回放')):
+        stats = timing[name]
+        if stats['count']:
+            lines.append(f"{label}分析帧耗时 p50={stats['p50_ms']:.2f} p99={stats['p99_ms']:.2f} "
+                         f"max={stats['max_ms']:.2f} ms（{stats['count']}帧）")
+    lines.append("最慢帧移：" + "，".join(
+        f"#{s['hop']} 录制{s['recorded_ms']:.2f}/回放{s['replayed_ms']:.2f} ms"
+        for s in timing['slowest']))
+    capture = report['capture']
+    lines.append(f"采集间隔最大 {capture['max_interval_ms']:.1f} ms（帧移 {capture['hop_ms']:.1f} ms），"
+                 f"卡顿 {capture['stalls']}次")
+    if report['gaps']:
+        lines.append(f"录制丢失的帧移段：{report['gaps']}，缺口后重新同步 {report['resync_frames']}个帧移"
+                     f"（其中不一致 {report['resync_mismatches']}，不计入），"
+                     f"对应丢失帧移的识别 {report['lost_matches']}条")
+    lines.append("判决一致" if report['consistent'] else "判决不一致")
+    return "\n".join(lines)
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"无法序列化：{type(obj).__name__}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="检测会话录制文件工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show = subparsers.add_parser('show', help="显示会话概要")
+    show.add_argument('path')
+    replay = subparsers.add_parser('replay', help="逐帧重放并对比判决和耗时")
+    replay.add_argument('path')
+    replay.add_argument('--tolerance', type=float, default=0.01, help="频率一致的容差（Hz）")
+    replay.add_argument('--output', default=None, help="完整报告写入JSON文件")
+    args = parser.parse_args(argv)
+
+    session = load_session(args.path)
+    if args.command == 'show':
+        frames = session['frames']
+        duration = len(session['audio']) / session['sample_rate']
+        kinds = {}
+        for event in session['events']:
+            kinds[event['type']] = kinds.get(event['type'], 0) + 1
+        print(f"采样率 {session['sample_rate']} Hz，帧长 {session['chunk_size']}，"
+              f"帧移 {session['hop_size']}，时长 {duration:.1f} 秒")
+        print(f"元数据：{session['metadata']}")
+        print(f"帧移 {len(frames)}：通过过滤 {int(np.sum(frames['status'] >= STATUS_ACCEPTED))}，"
+              f"判决 {int(np.sum(frames['status'] == STATUS_DECIDED))}")
+        print(f"事件：{kinds}")
+        if session['gaps']:
+            print(f"丢失的帧移段：{session['gaps']}")
+        return 0
+
+    report = replay_session(session, tolerance=args.tolerance)
+    print(format_replay_report(report))
+    if args.output:
+        report = dict(report)
+        report.pop('frames')
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=_json_default)
+    return 0 if report['consistent'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
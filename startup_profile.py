@@ -0,0 +1,65 @@
+"""
+启动耗时统计
+记录导入、初始化各阶段的耗时和关键时间点（如窗口首次可交互），
+启动时打印分阶段明细，使启动到可交互的时间成为可测量的数值
+"""
+import contextlib
+import time
+
+
+class StartupProfile:
+    """分阶段计时器（时间从创建时刻算起，单位毫秒）"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages = []
+        self.marks = {}
+        self._depth = 0
+
+    def _elapsed_ms(self):
+        return (time.perf_counter() - self.origin) * 1000
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        统计一个阶段的耗时（可嵌套）
+
+        Args:
+            name: 阶段名称
+        """
+        entry = {'name': name, 'start_ms': self._elapsed_ms(), 'duration_ms': None,
+                 'depth': self._depth}
+        self.stages.append(entry)
+        self._depth += 1
+        try:
+            yield entry
+        finally:
+            self._depth -= 1
+            entry['duration_ms'] = self._elapsed_ms() - entry['start_ms']
+
+    def mark(self, name):
+        """记录一个时间点（如'窗口可交互'）"""
+        self.marks[name] = self._elapsed_ms()
+
+    def report(self):
+        """
+        Returns:
+            dict: 'stages'为各阶段起止和耗时，'marks'为各时间点，'total_ms'为当前总耗时
+        """
+        return {
+            'stages': [dict(entry) for entry in self.stages],
+            'marks': dict(self.marks),
+            'total_ms': self._elapsed_ms()
+        }
+
+    def format_report(self):
+        """格式化为多行文本"""
+        lines = ["启动耗时明细："]
+        for entry in self.stages:
+            duration = entry['duration_ms']
+            duration_text = f"{duration:8.1f} ms" if duration is not None else "  进行中   "
+            lines.append(f"  {duration_text}  @{entry['start_ms']:8.1f} ms  "
+                         f"{'  ' * entry['depth']}{entry['name']}")
+        for name, at_ms in sorted(self.marks.items(), key=lambda item: item[1]):
+            lines.append(f"  {'':>11}  @{at_ms:8.1f} ms  * {name}")
+        return "\n".join(lines)
@@ -0,0 +1,320 @@
+"""
+流式一维密度聚类
+与DBSCAN相同的eps/min_samples语义，每加入一个频率增量更新簇统计，
+不再对整个列表重新拟合
+"""
+import bisect
+import math
+
+
+class _ClusterStats:
+    """簇统计量（数量、均值、二阶中心矩），支持合并"""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        # Welford增量更新
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        # Chan并行合并公式
+        total = self.count + other.count
+        if total == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+
+class _SortedList:
+    """
+    分桶有序表：元素按序分在若干个长度不超过2·load的桶里，另存各桶的最大值
+
+    定位桶是对桶最大值的一次二分（O(log n)），桶内插入/删除移动不超过2·load个元素，
+    与总数n无关；桶满时一分为二，在桶列表中插入一项，每load次插入才发生一次。
+    """
+
+    def __init__(self, load=256):
+        self._load = load
+        self._buckets = []
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            yield from bucket
+
+    def add(self, item):
+        """插入一个元素（相等的元素插在已有元素之后）"""
+        self._len += 1
+        maxes = self._maxes
+        if not maxes:
+            self._buckets.append([item])
+            maxes.append(item)
+            return
+        k = bisect.bisect_right(maxes, item)
+        if k == len(maxes):
+            k -= 1
+            self._buckets[k].append(item)
+            maxes[k] = item
+        else:
+            bucket = self._buckets[k]
+            bisect.insort_right(bucket, item)
+        bucket = self._buckets[k]
+        if len(bucket) > 2 * self._load:
+            half = bucket[self._load:]
+            del bucket[self._load:]
+            maxes[k] = bucket[-1]
+            self._buckets.insert(k + 1, half)
+            maxes.insert(k + 1, half[-1])
+
+    def remove(self, item):
+        """删除一个与item相等的元素（须存在）"""
+        k = bisect.bisect_left(self._maxes, item)
+        bucket = self._buckets[k]
+        del bucket[bisect.bisect_left(bucket, item)]
+        self._len -= 1
+        if bucket:
+            self._maxes[k] = bucket[-1]
+        else:
+            del self._buckets[k]
+            del self._maxes[k]
+
+    def irange(self, low, high):
+        """按序迭代low <= 元素 <= high的元素"""
+        k = bisect.bisect_left(self._maxes, low)
+        if k == len(self._maxes):
+            return
+        i = bisect.bisect_left(self._buckets[k], low)
+        buckets = self._buckets
+        while k < len(buckets):
+            bucket = buckets[k]
+            while i < len(bucket):
+                item = bucket[i]
+                if item > high:
+                    return
+                yield item
+                i += 1
+            k += 1
+            i = 0
+
+    def count(self, low, high, limit):
+        """low <= 元素 <= high的元素个数，数到limit为止"""
+        count = 0
+        for _ in self.irange(low, high):
+            count += 1
+            if count >= limit:
+                break
+        return count
+
+    def before(self, item):
+        """小于item的最大元素，没有时为None"""
+        k = bisect.bisect_left(self._maxes, item)
+        if k < len(self._maxes):
+            bucket = self._buckets[k]
+            i = bisect.bisect_left(bucket, item)
+            if i:
+                return bucket[i - 1]
+        return self._buckets[k - 1][-1] if k else None
+
+    def after(self, item):
+        """大于item的最小元素，没有时为None"""
+        k = bisect.bisect_right(self._maxes, item)
+        if k == len(self._maxes):
+            return None
+        bucket = self._buckets[k]
+        return bucket[bisect.bisect_right(bucket, item)]
+
+
+class StreamingFrequencyClusterer:
+    """
+    增量一维DBSCAN
+
+    一维情况下只需维护三个有序表：全部点、核心点、非核心点（后两者的元素为(频率, 点id)）。
+    新点只会影响[x - eps, x + eps]内的非核心点，而任一eps宽的区间内
+    非核心点少于min_samples个，判断是否为核心点也只需数到min_samples个邻居；
+    新核心点只需与左右最近的核心点合并（同侧核心点彼此相距不超过eps，已相连）。
+    只插入不删除时簇只会增长或合并，用并查集维护即可。
+    有序表分桶存放（_SortedList），每次插入为O(min_samples · log n)，
+    与已有样本数基本无关，长时间运行样本不断增加时每次检测的开销不随之增长。
+    """
+
+    def __init__(self, eps=30, min_samples=3):
+        self.eps = eps
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        """清空所有样本"""
+        self._values = _SortedList()   # 全部点的频率
+        self._core = _SortedList()     # 核心点(频率, 点id)
+        self._noncore = _SortedList()  # 非核心点(频率, 点id)
+        self._point_values = []        # 点id -> 频率
+        self._labels = []              # 点id -> 簇id（None为噪声）
+        self._parent = []              # 并查集：簇id -> 父簇id
+        self._stats = []               # 簇id -> _ClusterStats
+        self._largest = None           # 最大簇的根id
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, frequency):
+        """
+        加入一个频率并更新簇统计
+
+        Args:
+            frequency: 新检测到的频率（Hz）
+
+        Returns:
+            dict: 当前最大簇的统计信息，格式同cluster_frequencies_dbscan；无簇时为None
+        """
+        frequency = float(frequency)
+        point_id = len(self._point_values)
+        self._point_values.append(frequency)
+        self._labels.append(None)
+        self._values.add(frequency)
+        self._noncore.add((frequency, point_id))
+
+        # 重新检查受影响的非核心点
+        promoted = [item for item in self._noncore.irange(*self._window(frequency))
+                    if self._is_core(item[0])]
+        for item in promoted:
+            self._noncore.remove(item)
+            self._core.add(item)
+
+        # 先让所有新核心点都归属某个簇，再与相邻核心点合并
+        for _, pid in promoted:
+            if self._labels[pid] is None:
+                self._new_cluster(pid)
+        for value, pid in promoted:
+            self._expand_core(value, pid)
+
+        # 新点仍为非核心点时，若在某核心点eps范围内则作为边界点归入该簇
+        if self._labels[point_id] is None and len(self._core):
+            for neighbor in (self._core.before((frequency,)), self._core.after((frequency,))):
+                if neighbor is not None and abs(neighbor[0] - frequency) <= self.eps:
+                    root = self._assign(point_id, self._labels[neighbor[1]])
+                    self._update_largest(root)
+                    break
+
+        return self.result()
+
+    def extend(self, frequencies):
+        """批量加入频率"""
+        for frequency in frequencies:
+            self.add(frequency)
+        return self.result()
+
+    def result(self):
+        """
+        当前最大簇的统计信息
+
+        Returns:
+            dict: 包含主频率、标准差、簇大小等信息；无簇时为None
+        """
+        if self._largest is None or len(self._values) < self.min_samples:
+            return None
+        stats = self._stats[self._find(self._largest)]
+        total = len(self._values)
+        return {
+            'mean_frequency': stats.mean,
+            'std_deviation': stats.std,
+            'cluster_size': stats.count,
+            'total_samples': total,
+            'cluster_ratio': stats.count / total
+        }
+
+    def labels(self):
+        """
+        各点的簇编号
+
+        Returns:
+            list: 按加入顺序，每点一个簇编号（按首次出现顺序从0编号），噪声点为-1
+        """
+        numbering = {}
+        labels = []
+        for label in self._labels:
+            if label is None:
+                labels.append(-1)
+            else:
+                labels.append(numbering.setdefault(self._find(label), len(numbering)))
+        return labels
+
+    def _window(self, value):
+        """(频率, 点id)有序表中频率在[value - eps, value + eps]内的上下界"""
+        return (value - self.eps,), (value + self.eps, math.inf)
+
+    def _is_core(self, value):
+        # 邻居包含自身，与sklearn的DBSCAN一致（距离<=eps）
+        return (self._values.count(value - self.eps, value + self.eps, self.min_samples)
+                >= self.min_samples)
+
+    def _find(self, cluster_id):
+        parent = self._parent
+        while parent[cluster_id] != cluster_id:
+            parent[cluster_id] = parent[parent[cluster_id]]
+            cluster_id = parent[cluster_id]
+        return cluster_id
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return a
+        if self._stats[a].count < self._stats[b].count:
+            a, b = b, a
+        self._parent[b] = a
+        self._stats[a].merge(self._stats[b])
+        self._stats[b] = None
+        return a
+
+    def _assign(self, point_id, cluster_id):
+        root = self._find(cluster_id)
+        self._labels[point_id] = root
+        self._stats[root].add(self._point_values[point_id])
+        return root
+
+    def _new_cluster(self, point_id):
+        cluster_id = len(self._parent)
+        self._parent.append(cluster_id)
+        self._stats.append(_ClusterStats())
+        return self._assign(point_id, cluster_id)
+
+    def _expand_core(self, value, point_id):
+        """新核心点：与相邻核心点合并，并吸收范围内的噪声点"""
+        root = self._find(self._labels[point_id])
+
+        for neighbor in (self._core.before((value, point_id)), self._core.after((value, point_id))):
+            if neighbor is not None and abs(neighbor[0] - value) <= self.eps:
+                root = self._union(root, self._labels[neighbor[1]])
+
+        for _, pid in self._noncore.irange(*self._window(value)):
+            if self._labels[pid] is None:
+                root = self._assign(pid, root)
+
+        self._update_largest(root)
+
+    def _update_largest(self, root):
+        # 簇只会增长，比较当前根与已知最大簇即可
+        if self._largest is None:
+            self._largest = root
+        else:
+            largest = self._find(self._largest)
+            if self._stats[root].count > self._stats[largest].count:
+                largest = root
+            self._largest = largest
@@ -0,0 +1,124 @@
+import wave
+
+import numpy as np
+import pytest
+
+from audio_source import ToneSource
+from calibration import calibrate, extract_segment
+from deployment import load_deployment
+from detection_pipeline import DetectionPipeline, decided_results
+
+RATE = 12000
+DURATION = 6
+
+
+def write_knocks(path, frequency, knock_interval=0.5, duration=DURATION):
+    """ToneSource的敲击信号写成16位WAV；默认每0.5秒敲一次（几乎没有静音帧）"""
+    source = ToneSource(frequencies=(frequency,), sample_rate=RATE, knock_interval=knock_interval,
+                        duration=duration)
+    samples = source.read(RATE * duration)
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(np.clip(np.round(samples), -32768, 32767).astype('<i2').tobytes())
+    return samples
+
+
+def live_detections(samples, hop_size):
+    pipeline = DetectionPipeline(hop_size=hop_size)
+    count = 0
+    for start in range(0, len(samples) - hop_size + 1, hop_size):
+        count += len(decided_results(pipeline.process(samples[start:start + hop_size])))
+    return count
+
+
+@pytest.mark.parametrize('knock_interval', [0.5, 2.0])
+def test_extract_segment_gates_like_live_pipeline(tmp_path, knock_interval):
+    path = tmp_path / 'cup_1.wav'
+    samples = write_knocks(path, 3000.0, knock_interval)
+    options = load_deployment()
+    result = extract_segment({'label': 'cup_1', 'path': str(path), 'start': 0.0, 'end': None,
+                              'options': options})
+    # 密集敲击时录音里几乎每帧都有敲击，仍需找到与实时检测相当的有效帧
+    assert 0 < result['active'] < result['frames']
+    assert len(result['frequencies']) >= 0.5 * live_detections(samples, options['hop_size'])
+    assert result['frequencies'] == pytest.approx(3000.0, abs=2.0)
+
+
+def test_extract_segment_without_onset_gate(tmp_path):
+    path = tmp_path / 'cup_1.wav'
+    write_knocks(path, 3000.0)
+    options = dict(load_deployment(), onset_gate=False)
+    result = extract_segment({'label': 'cup_1', 'path': str(path), 'start': 0.0, 'end': None,
+                              'options': options})
+    assert result['active'] == result['frames']
+
+
+def test_calibrate_dense_knock_recordings(tmp_path):
+    recordings = tmp_path / 'recordings'
+    recordings.mkdir()
+    write_knocks(recordings / 'cup_1.wav', 3000.0)
+    write_knocks(recordings / 'cup_2.wav', 3600.0)
+    report = calibrate(str(recordings), str(tmp_path / 'cups.acsp'), workers=1)
+    assert report['failed'] == []
+    assert [cup['cup_index'] for cup in report['cups']] == [0, 1]
+    assert [cup['frequency'] for cup in report['cups']] == pytest.approx([3000.0, 3600.0], abs=2.0)
+    assert all(cup['cluster_size'] >= 10 for cup in report['cups'])
+    assert report['conflicts'] == []
+
+
+def write_wav(path, samples):
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(np.clip(np.round(samples), -32768, 32767).astype('<i2').tobytes())
+
+
+def test_extract_segment_accepts_same_frames_as_live_pipeline(tmp_path):
+    """标定样本与识别时的检测流水线（自适应逐bin信噪比）通过的帧完全相同"""
+    # 信号频段内持续的4500 Hz嗡声：敲击衰减后按频段信噪比会把嗡声当成杯子，
+    # 噪声谱估计可用后逐bin信噪比门限把它排除
+    duration = 15
+    t = np.arange(RATE * duration) / RATE
+    hum = 800 * np.sin(2 * np.pi * 4500 * t)
+    source = ToneSource(frequencies=(3000.0,), sample_rate=RATE, knock_interval=1.5,
+                        duration=duration)
+    samples = np.round(source.read(RATE * duration) + hum)
+    path = tmp_path / 'cup_1.wav'
+    write_wav(path, samples)
+    options = load_deployment()
+    result = extract_segment({'label': 'cup_1', 'path': str(path), 'start': 0.0, 'end': None,
+                              'options': options})
+
+    pipeline = DetectionPipeline(**options)
+    hop = options['hop_size']
+    live = []
+    for start in range(0, len(samples) - hop + 1, hop):
+        frame = pipeline.process(samples[start:start + hop])
+        if frame is not None:
+            live.append(frame['raw_frequency'])
+    assert len(live) > 5
+    np.testing.assert_array_equal(result['frequencies'], live)
+    # 噪声谱估计可用（约5秒）之后只剩杯子的频率
+    assert result['frequencies'][-12:] == pytest.approx(3000.0, abs=2.0)
+    assert result['fingerprints'].shape == (len(live), result['fingerprints'].shape[1])
+
+
+def test_extract_segment_reads_long_recordings_in_hops(tmp_path):
+    import tracemalloc
+    path = tmp_path / 'cup_1.wav'
+    write_knocks(path, 3000.0, knock_interval=2.0, duration=120)
+    job = {'label': 'cup_1', 'path': str(path), 'start': 10.0, 'end': 110.0,
+           'options': load_deployment()}
+    tracemalloc.start()
+    try:
+        result = extract_segment(job)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert result['duration'] == pytest.approx(100.0)
+    assert len(result['frequencies']) > 20
+    # 整段转为float64需要100 s × 12000 × 8字节 ≈ 9.6 MB
+    assert peak < 2 * 1024 * 1024
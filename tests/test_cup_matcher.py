@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from utils import CupMatcher, find_closest_cup_with_confidence
+
+
+def random_cups(rng):
+    n = int(rng.integers(1, 40))
+    freqs = np.round(rng.uniform(2500, 6000, n), int(rng.integers(0, 2)))
+    # 未学习的杯子、重复频率（得分相同）和缺失/为0的标准差
+    freqs[rng.random(n) < 0.2] = 0.0
+    if n > 1:
+        freqs[-1] = freqs[0]
+    stds = np.round(rng.uniform(0, 15, n), 1)
+    stds[rng.random(n) < 0.2] = 0.0
+    stds = stds[:int(rng.integers(0, n + 1))]
+    return freqs.tolist(), stds.tolist()
+
+
+def random_targets(rng, freqs):
+    learned = [f for f in freqs if f] or [3000.0]
+    near = rng.choice(learned, 50) + rng.normal(0, 30, 50)
+    return np.concatenate([near, rng.choice(learned, 10), rng.uniform(2000, 7000, 20)])
+
+
+def assert_same_match(result, expected):
+    assert result['cup_index'] == expected['cup_index']
+    for key in ('confidence', 'frequency_diff', 'match_score'):
+        assert result[key] == pytest.approx(expected[key], rel=1e-12, abs=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_match_equals_reference(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(40):
+        freqs, stds = random_cups(rng)
+        base_tolerance = float(rng.choice([20, 50, 80]))
+        threshold = float(rng.choice([0.3, 0.5, 0.7]))
+        matcher = CupMatcher(freqs, stds, base_tolerance=base_tolerance,
+                             confidence_threshold=threshold)
+        for target in random_targets(rng, freqs):
+            expected = find_closest_cup_with_confidence(
+                freqs, stds, float(target), base_tolerance=base_tolerance,
+                confidence_threshold=threshold)
+            assert_same_match(matcher.match(float(target)), expected)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_match_batch_equals_reference(seed):
+    rng = np.random.default_rng(50 + seed)
+    for _ in range(40):
+        freqs, stds = random_cups(rng)
+        matcher = CupMatcher(freqs, stds)
+        targets = random_targets(rng, freqs)
+        batch = matcher.match_batch(targets)
+        for i, target in enumerate(targets):
+            expected = find_closest_cup_with_confidence(freqs, stds, float(target))
+            assert_same_match({key: value[i].item() for key, value in batch.items()}, expected)
+
+
+def test_empty_table_matches_nothing():
+    matcher = CupMatcher([0.0, 0.0], [0.0, 0.0])
+    assert matcher.match(3000.0)['cup_index'] == -1
+    batch = matcher.match_batch([3000.0, 3500.0])
+    assert batch['cup_index'].tolist() == [-1, -1]
+    assert matcher.match_batch([])['cup_index'].shape == (0,)
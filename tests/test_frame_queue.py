@@ -0,0 +1,48 @@
+import threading
+import time
+
+from frame_queue import BLOCK, DROP_NEWEST, DROP_OLDEST, FrameQueue
+
+
+def test_drop_oldest_keeps_latest_frames():
+    queue = FrameQueue(2, DROP_OLDEST)
+    for item in range(4):
+        assert queue.put(item)
+    assert [queue.get(timeout=0), queue.get(timeout=0)] == [2, 3]
+    assert queue.stats()['dropped'] == 2
+
+
+def test_drop_newest_rejects_when_full():
+    queue = FrameQueue(2, DROP_NEWEST)
+    assert queue.put(0) and queue.put(1)
+    assert not queue.put(2)
+    assert queue.get(timeout=0) == 0
+    assert queue.stats()['dropped'] == 1
+
+
+def test_block_with_zero_timeout_never_waits():
+    """回调线程按timeout=0入队：队列满时立即返回并计入丢弃数"""
+    queue = FrameQueue(1, BLOCK)
+    assert queue.put(0, timeout=0)
+    start = time.perf_counter()
+    assert not queue.put(1, timeout=0)
+    assert time.perf_counter() - start < 0.05
+    assert queue.stats()['dropped'] == 1
+    assert queue.get(timeout=0) == 0
+
+
+def test_block_waits_for_consumer():
+    queue = FrameQueue(1, BLOCK)
+    queue.put(0)
+    consumer = threading.Timer(0.05, queue.get)
+    consumer.start()
+    assert queue.put(1, timeout=1.0)
+    consumer.join()
+    assert queue.get(timeout=0) == 1
+
+
+def test_close_wakes_blocked_reader():
+    queue = FrameQueue(1, DROP_OLDEST)
+    threading.Timer(0.05, queue.close).start()
+    assert queue.get(timeout=1.0) is None
+    assert not queue.put(0)
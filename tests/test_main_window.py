@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+
+from audio_source import ToneSource
+from main_window import AudioControlApp
+from startup_profile import StartupProfile
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def wait_until(app, condition, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    return condition()
+
+
+def make_window(lazy):
+    return AudioControlApp(profile_path=None, lazy=lazy, startup_profile=StartupProfile(),
+                           source=ToneSource(duration=30.0, realtime=True))
+
+
+def test_background_load_keeps_gui_thread_free(app):
+    window = make_window(lazy=True)
+    ready = []
+    window.audioReady.connect(ready.append)
+    window.initAudio(background=True)
+    # 导入和打开设备都在处理线程中，界面线程立即返回
+    assert window.audio_worker is None
+    assert wait_until(app, lambda: ready)
+    assert ready == [True]
+    # worker在处理线程中创建，不需要从界面线程移过去
+    assert window.audio_worker.thread() is window.audio_thread
+    assert window.audio_thread.isRunning()
+    marks = window.startup_profile.marks
+    assert marks['开始加载音频'] < marks['音频就绪']
+    window.close()
+    assert not window.audio_thread.isRunning()
+
+
+def test_actions_before_audio_ready_run_once_loaded(app):
+    window = make_window(lazy=True)
+    window.detectAudio()
+    assert window.current_mode == 'idle'
+    assert window.resultLabel.text() == "加载中..."
+    assert wait_until(app, lambda: window.current_mode == 'detection')
+    assert window.resultLabel.text() == "检测中..."
+    window.close()
+
+
+def test_synchronous_load_starts_worker_in_processing_thread(app):
+    window = make_window(lazy=False)
+    assert window.audio_worker is not None
+    assert window.audio_worker.thread() is window.audio_thread
+    assert wait_until(app, lambda: window.audio_worker.metrics.frames > 0)
+    window.close()
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from audio_source import ToneSource
+from cup_detector import CupDetector
+from detection_pipeline import DetectionPipeline, decided_results
+from multi_channel import ChannelAnalyzer
+from session_log import detector_snapshot
+
+HOP = 2048
+
+
+def hops(source):
+    while True:
+        samples = source.read(HOP)
+        if samples is None:
+            return
+        yield samples
+
+
+def learned_detector(frequencies):
+    detector = CupDetector(num_cups=len(frequencies))
+    for number, frequency in enumerate(frequencies, 1):
+        pipeline = DetectionPipeline(hop_size=HOP)
+        detector.start_learning(number)
+        for samples in hops(ToneSource(frequencies=(frequency,), duration=4, seed=number)):
+            for decided in decided_results(pipeline.process(samples)):
+                detector.add_sample(decided['quality'])
+        assert detector.finish_learning()['frequency'] is not None
+    return detector
+
+
+def test_channel_analyzer_matches_like_single_channel():
+    detector = learned_detector((3100.0, 3700.0))
+    assert len(detector.fingerprint_matcher) == 2
+    analyzer = ChannelAnalyzer('A', hop_size=HOP)
+    analyzer.set_detector(detector_snapshot(detector))
+    reference = DetectionPipeline(hop_size=HOP)
+
+    matched = []
+    for samples in hops(ToneSource(frequencies=(3100.0, 3700.0), duration=6, seed=9)):
+        result = analyzer.process(samples)
+        expected = reference.process(samples)
+        assert (result is None) == (expected is None)
+        if result is None:
+            continue
+        assert result['channel'] == 'A'
+        for decided, decided_expected in zip(decided_results(result), decided_results(expected)):
+            assert decided['match'] == detector.match(decided_expected['quality'])
+            matched.append(decided['match']['cup_index'])
+    # 两个杯子交替敲击，按指纹都能识别出来
+    assert {0, 1} <= set(matched)
+
+
+def test_set_cups_matches_by_frequency():
+    analyzer = ChannelAnalyzer('B', hop_size=HOP)
+    analyzer.set_cups([3100.0, 3700.0], [2.0, 2.0])
+    assert not len(analyzer.detector.fingerprint_matcher)
+    matches = [decided['match'] for samples in hops(ToneSource(frequencies=(3700.0,), duration=4))
+               for decided in decided_results(analyzer.process(samples))]
+    assert matches and all(match['cup_index'] == 1 for match in matches)
+
+
+def run_engine(engine, frequency):
+    source = ToneSource(frequencies=(frequency,), duration=3)
+    results = []
+    with engine:
+        for samples in hops(source):
+            engine.submit({'A': samples})
+            results.extend(engine.results())
+        results.extend(engine.close())
+    return results
+
+
+def test_engine_passes_pipeline_options_to_workers():
+    from deployment import validate
+    from multi_channel import MultiChannelEngine
+
+    options = validate({'window': 'hann', 'signal_band': (2500, 4000)})
+    results = run_engine(MultiChannelEngine(['A'], num_workers=1, pipeline_options=options), 3500.0)
+    assert results and all(2500 <= r['raw_frequency'] <= 4000 for r in results)
+    # 信号频段之外的敲击在工作进程中被过滤
+    engine = MultiChannelEngine(['A'], num_workers=1, pipeline_options=options)
+    assert engine.pipeline_kwargs['window'] == 'hann'
+    assert run_engine(engine, 4500.0) == []
+
+
+def test_close_returns_when_a_worker_died():
+    import time
+
+    from multi_channel import MultiChannelEngine
+
+    engine = MultiChannelEngine(['A', 'B'], num_workers=2)
+    engine.start()
+    engine._processes[0].kill()
+    engine._processes[0].join()
+    start = time.monotonic()
+    assert engine.close(timeout=2.0) == []
+    assert time.monotonic() - start < 2.5
+    assert not engine._processes
+
+
+def test_main_tags_results_with_channel_and_uses_per_channel_profiles(tmp_path, capsys):
+    import wave
+
+    from multi_channel import main
+
+    # 双声道录音：左声道敲3700 Hz的杯子，右声道敲3100 Hz的杯子
+    duration = 4
+    left = ToneSource(frequencies=(3700.0,), duration=duration, seed=1).read(12000 * duration)
+    right = ToneSource(frequencies=(3100.0,), duration=duration, seed=2).read(12000 * duration)
+    with wave.open(str(tmp_path / 'hall.wav'), 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(12000)
+        wav.writeframes(np.stack([left, right], axis=1).astype('<i2').tobytes())
+    # 两个工位各自学习的杯子表：A的2号杯子与B的1号杯子频率不同
+    learned_detector((3100.0, 3700.0)).profile_store.save(str(tmp_path / 'A.acsp'))
+    learned_detector((3100.0,)).profile_store.save(str(tmp_path / 'B.acsp'))
+
+    assert main(['--wav', str(tmp_path / 'hall.wav'), '--channel-ids', 'A,B',
+                 '--profiles', str(tmp_path / '{channel}.acsp'), '--hop', str(HOP),
+                 '--workers', '2']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    results = {cid: [line for line in lines if line.startswith(f"[通道{cid}]")] for cid in 'AB'}
+    assert results['A'] and all("2号杯子" in line for line in results['A'])
+    assert results['B'] and all("1号杯子" in line for line in results['B'])
+    assert f"通道A：{len(results['A'])}次检测，{len(results['A'])}次匹配" in lines
+
+
+def test_main_rejects_mismatched_channel_ids():
+    from multi_channel import main
+
+    with pytest.raises(SystemExit):
+        main(['--tone', '3000', '--tone', '3200', '--channel-ids', 'A'])
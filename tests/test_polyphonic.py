@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+
+from audio_processor import AudioProcessor, select_distinct_peaks
+from audio_source import ToneSource
+from detection_pipeline import DetectionPipeline, decided_results
+from peak_tracker import PeakTracker
+
+RATE = 12000
+CHUNK = 4096
+HOP = 2048
+
+
+def knock_frame(components, noise=50.0, seed=0):
+    """一帧内同时敲击的几个杯子：[(基频, 幅度), ...]，各带2、3次谐波"""
+    t = np.arange(CHUNK) / RATE
+    x = np.random.default_rng(seed).normal(0, noise, CHUNK)
+    for frequency, amplitude in components:
+        envelope = amplitude * np.exp(-8 * t)
+        for order, weight in ((1, 1.0), (2, 0.3), (3, 0.1)):
+            if order * frequency < RATE / 2:
+                x += weight * envelope * np.sin(2 * np.pi * order * frequency * t)
+    return x
+
+
+def peak_frequencies(components, **kwargs):
+    processor = AudioProcessor(RATE, CHUNK)
+    spectrum = processor.compute_spectrum(knock_frame(components))
+    _, positions = processor.find_peaks(spectrum.magnitude, (2500, 6000), **kwargs)
+    return positions * processor.plan.bin_hz
+
+
+def test_select_distinct_peaks_drops_sidelobes_and_harmonics():
+    assert select_distinct_peaks([3000.0, 3020.0, 3045.0], 4) == [0, 2]
+    assert select_distinct_peaks([3000.0, 6010.0, 3500.0, 9000.0], 4) == [0, 2]
+    # 较弱的峰恰好是较强峰的谐波以下（3000是1500的2倍）同样冲突
+    assert select_distinct_peaks([3000.0, 1500.0, 4100.0], 4) == [0, 2]
+    assert select_distinct_peaks([3000.0, 3500.0, 4100.0], 2) == [0, 1]
+    assert select_distinct_peaks([], 3) == []
+
+
+def test_find_peaks_resolves_two_cups_in_one_frame():
+    frequencies = peak_frequencies([(2800.0, 8000.0), (3300.0, 5000.0)])
+    # 按幅度排列，2800 Hz的2次谐波（5600 Hz）不作为第三个杯子
+    assert len(frequencies) == 2
+    assert frequencies == pytest.approx([2800.0, 3300.0], abs=0.5)
+
+
+def test_find_peaks_resolves_close_pair():
+    frequencies = peak_frequencies([(3000.0, 8000.0), (3060.0, 7000.0)])
+    assert sorted(frequencies) == pytest.approx([3000.0, 3060.0], abs=1.0)
+
+
+def test_find_peaks_merges_pair_closer_than_min_separation():
+    frequencies = peak_frequencies([(3000.0, 8000.0), (3015.0, 7000.0)])
+    assert len(frequencies) == 1
+
+
+def test_find_peaks_level_and_mask():
+    components = [(3000.0, 8000.0), (4000.0, 150.0)]
+    assert len(peak_frequencies(components)) == 1
+    assert len(peak_frequencies(components, min_level_db=-40.0)) == 2
+    processor = AudioProcessor(RATE, CHUNK)
+    spectrum = processor.compute_spectrum(knock_frame([(3000.0, 8000.0), (3500.0, 6000.0)]))
+    allowed = processor.freqs > 3200
+    _, positions = processor.find_peaks(spectrum.magnitude, (2500, 6000), allowed=allowed)
+    assert positions * processor.plan.bin_hz == pytest.approx([3500.0], abs=0.5)
+
+
+def test_tracker_decides_simultaneous_cups_independently():
+    tracker = PeakTracker()
+    rng = np.random.default_rng(0)
+    outputs = [tracker.update([3000.0 + rng.normal(0, 0.5), 3500.0 + rng.normal(0, 0.5)], 0.1 * i)
+               for i in range(3)]
+    first_ids = [track for track, _ in outputs[0]]
+    assert len(set(first_ids)) == 2
+    for output in outputs:
+        assert [track for track, _ in output] == first_ids
+    decisions = [decision for _, decision in outputs[-1]]
+    assert all(d['decided'] and d['method'] == 'std' for d in decisions)
+    assert [d['frequency'] for d in decisions] == pytest.approx([3000.0, 3500.0], abs=1.0)
+
+
+def test_tracker_hands_off_by_frequency_not_strength():
+    tracker = PeakTracker()
+    (a, _), (b, _) = tracker.update([3000.0, 3500.0], 0.0)
+    # 强弱顺序对调：仍按频率归入原轨迹
+    assert [track for track, _ in tracker.update([3501.0, 3001.0], 0.1)] == [b, a]
+    # 一帧只剩一个杯子，另一个随后回来（未超过max_age）
+    assert [track for track, _ in tracker.update([3000.5], 0.2)] == [a]
+    assert [track for track, _ in tracker.update([3499.0, 3000.2], 0.3)] == [b, a]
+    # 同一帧里两个峰都靠近同一条轨迹时，第二个峰新建轨迹而不是共用
+    output = tracker.update([3000.0, 3020.0], 0.4)
+    assert output[0][0] == a and output[1][0] not in (a, b)
+
+
+def test_tracker_expires_and_replaces_tracks():
+    tracker = PeakTracker(max_tracks=2, max_age=1.0)
+    (a, _), = tracker.update([3000.0], 0.0)
+    (b, _), = tracker.update([3500.0], 0.5)
+    # 超过max_tracks时替换最久未更新的轨迹
+    (c, _), = tracker.update([4000.0], 0.6)
+    assert len(tracker) == 2 and c not in (a, b)
+    assert [track for track, _ in tracker.update([3500.0], 0.7)] == [b]
+    # 超过max_age没有新峰的轨迹被移除
+    (d, _), = tracker.update([3500.0], 2.0)
+    assert d != b
+    tracker.reset()
+    assert len(tracker) == 0
+
+
+def test_tracker_applies_cups_to_new_tracks():
+    tracker = PeakTracker()
+    tracker.set_cups([3000.0, 3500.0], [2.0, 2.0], cup_indices=[2, 5])
+    tracker.update([3000.2, 3500.1], 0.0)
+    decisions = [decision for _, decision in tracker.update([2999.9, 3499.8], 0.1)]
+    assert [d['cup_index'] for d in decisions] == [2, 5]
+    assert all(d['decided'] and d['method'] == 'sprt' for d in decisions)
+    tracker.clear_cups()
+    assert tracker.update([3000.0], 0.2)[0][1]['llr'] is None
+
+
+class MixedSource:
+    """几个ToneSource相加：各杯子在同一时刻敲击"""
+
+    def __init__(self, frequencies, duration):
+        self.sources = [ToneSource(frequencies=(f,), duration=duration, seed=i,
+                                   amplitude=6000.0 + 1000.0 * i)
+                        for i, f in enumerate(frequencies)]
+
+    def read(self, count):
+        chunks = [source.read(count) for source in self.sources]
+        if chunks[0] is None:
+            return None
+        return np.sum(chunks, axis=0)
+
+
+@pytest.mark.parametrize('targeted', [False, True])
+def test_pipeline_reports_both_cups_knocked_together(targeted):
+    pipeline = DetectionPipeline(hop_size=HOP, max_peaks=3)
+    if targeted:
+        pipeline.set_targets([3100.0, 3700.0], [60.0, 60.0], [0, 1], [2.0, 2.0])
+    source = MixedSource((3100.0, 3700.0), duration=5)
+    frames = []
+    while True:
+        samples = source.read(HOP)
+        if samples is None:
+            break
+        frequencies = [item['quality']['frequency'] for item in decided_results(pipeline.process(samples))]
+        if frequencies:
+            frames.append(frequencies)
+    # 同一帧内两个杯子都被判决（偶尔多出的旁瓣峰不影响）
+    both = [f for f in frames
+            if any(abs(x - 3100.0) < 5.0 for x in f) and any(abs(x - 3700.0) < 5.0 for x in f)]
+    assert len(both) >= 5
+    assert len(both) == len(frames)
+
+
+def test_single_peak_pipeline_reports_one_cup_per_frame():
+    pipeline = DetectionPipeline(hop_size=HOP)
+    source = MixedSource((3100.0, 3700.0), duration=5)
+    while True:
+        samples = source.read(HOP)
+        if samples is None:
+            break
+        assert len(decided_results(pipeline.process(samples))) <= 1
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from fingerprint import FINGERPRINT_SIZE
+from profile_store import RECORD_DTYPE, ProfileStore
+
+
+def test_save_load_roundtrip(tmp_path):
+    rng = np.random.default_rng(0)
+    frequencies = rng.normal(3000, 4, 20)
+    fingerprints = rng.normal(1, 0.1, (20, FINGERPRINT_SIZE))
+    store = ProfileStore()
+    store.update('cup_1', frequencies, fingerprints, cup_index=0, station='bench')
+    path = tmp_path / 'profiles.acsp'
+    store.save(str(path))
+
+    info = ProfileStore.load(str(path)).get('cup_1')
+    assert info['cup_index'] == 0
+    assert info['count'] == 20
+    assert info['mean_frequency'] == pytest.approx(frequencies.mean())
+    assert info['std_deviation'] == pytest.approx(frequencies.std())
+    assert info['fingerprint_count'] == 20
+    assert info['station'] == 'bench'
+
+
+@pytest.mark.parametrize('station', ['一号工位测试台甲', '工位-A1-测试台', 'ab工位工位工位工位', 'é' * 9])
+def test_station_truncated_at_character_boundary(tmp_path, station):
+    size = RECORD_DTYPE['station'].itemsize
+    assert len(station.encode('utf-8')) > size
+    store = ProfileStore()
+    store.update('cup_1', [3000.0, 3001.0], cup_index=0, station=station)
+    path = tmp_path / 'profiles.acsp'
+    store.save(str(path))
+
+    saved = ProfileStore.load(str(path)).get('cup_1')['station']
+    assert station.startswith(saved)
+    assert len(saved.encode('utf-8')) <= size
+    assert len(station[:len(saved) + 1].encode('utf-8')) > size
+
+
+def test_get_tolerates_previously_split_station():
+    store = ProfileStore()
+    store.update('cup_1', [3000.0], cup_index=0)
+    # 旧版本按字节截断，末尾可能只剩半个字符
+    store.records['station'][0] = '一号工位测试台甲'.encode('utf-8')[:16]
+    assert store.get('cup_1')['station'] == '一号工位测'
+
+
+def test_merge_combines_statistics():
+    rng = np.random.default_rng(1)
+    a, b = rng.normal(3000, 3, 15), rng.normal(3004, 5, 25)
+    first, second = ProfileStore(), ProfileStore()
+    first.update('cup_1', a, cup_index=0)
+    second.update('cup_1', b, cup_index=0)
+    first.merge(second)
+    info = first.get('cup_1')
+    both = np.concatenate([a, b])
+    assert info['count'] == 40
+    assert info['mean_frequency'] == pytest.approx(both.mean())
+    assert info['std_deviation'] == pytest.approx(both.std())
@@ -0,0 +1,102 @@
+import pytest
+
+from sequential_decision import SequentialDecider
+
+
+def feed(decider, frequencies, start=0.0, step=0.05):
+    return [decider.add(f, start + i * step) for i, f in enumerate(frequencies)]
+
+
+def test_accepts_by_std_once_cluster_is_tight():
+    decisions = feed(SequentialDecider(), [3000.0, 3001.0, 2999.5])
+    assert [d['decided'] for d in decisions] == [False, False, True]
+    final = decisions[-1]
+    assert final['method'] == 'std'
+    assert final['cluster_size'] == 3
+    assert final['frequency'] == pytest.approx(3000.1666, abs=1e-3)
+    assert final['cup_index'] == -1 and final['llr'] is None
+
+
+def test_continues_while_cluster_is_too_wide():
+    decisions = feed(SequentialDecider(max_std=5.0), [3000.0, 3015.0, 2988.0, 3012.0])
+    assert not any(d['decided'] for d in decisions)
+    assert decisions[-1]['cluster_size'] == 4
+    assert decisions[-1]['std'] > 5.0
+
+
+def test_outlier_starts_its_own_cluster():
+    decisions = feed(SequentialDecider(), [3000.0, 3001.0, 3500.0])
+    assert decisions[-1]['cluster_size'] == 1
+    assert decisions[-1]['window_size'] == 3
+    assert not decisions[-1]['decided']
+
+
+def test_sprt_accepts_known_cup_before_std_rule():
+    decider = SequentialDecider()
+    decider.set_cups([3000.0, 3100.0], [2.0, 2.0], cup_indices=[4, 7])
+    decisions = feed(decider, [3100.5, 3099.6])
+    # 第一个样本不足min_sprt_samples，第二个样本即可判决
+    assert not decisions[0]['decided']
+    assert decisions[0]['cup_index'] == 7
+    assert decisions[1]['decided']
+    assert decisions[1]['method'] == 'sprt'
+    assert decisions[1]['cup_index'] == 7
+    assert decisions[1]['llr'] >= decider.threshold
+
+
+def test_sprt_rejects_frequency_of_no_known_cup():
+    decider = SequentialDecider()
+    decider.set_cups([3000.0, 3100.0], [2.0, 2.0])
+    decisions = feed(decider, [3050.0, 3050.5])
+    assert all(d['cup_index'] == -1 for d in decisions)
+    assert all(d['llr'] < 0 for d in decisions)
+    assert not any(d['decided'] for d in decisions)
+    # 簇本身足够稳定时仍按标准差上报（由匹配器判定不属于任何杯子）
+    third = decider.add(3049.8, 0.1)
+    assert third['decided'] and third['method'] == 'std' and third['cup_index'] == -1
+
+
+def test_sprt_continues_between_two_close_cups():
+    decider = SequentialDecider(min_samples=10)
+    decider.set_cups([3000.0, 3004.0], [3.0, 3.0])
+    decisions = feed(decider, [3002.0, 3002.1, 3001.9, 3002.0])
+    assert not any(d['decided'] for d in decisions)
+    assert all(0 <= d['llr'] < decider.threshold for d in decisions)
+
+
+def test_clear_cups_disables_sprt():
+    decider = SequentialDecider()
+    decider.set_cups([3000.0], [2.0])
+    decider.clear_cups()
+    decision = decider.add(3000.0, 0.0)
+    assert decision['llr'] is None and decision['cup_index'] == -1
+    decider.set_cups([], [])
+    assert decider.add(3000.0, 0.05)['llr'] is None
+
+
+def test_reset_clears_window():
+    decider = SequentialDecider()
+    feed(decider, [3000.0, 3000.5])
+    assert len(decider) == 2
+    decider.reset()
+    assert len(decider) == 0
+    decision = decider.add(3000.2, 0.2)
+    assert decision['window_size'] == 1
+    assert decision['cluster_size'] == 1
+    assert not decision['decided']
+
+
+def test_old_samples_leave_window():
+    decider = SequentialDecider(max_age=2.0)
+    decider.add(3000.0, 0.0)
+    decider.add(3000.5, 0.1)
+    decision = decider.add(3000.2, 2.5)
+    assert decision['window_size'] == 1
+    assert not decision['decided']
+
+
+def test_window_size_is_bounded():
+    decider = SequentialDecider(max_window=5)
+    decisions = feed(decider, [3000.0 + 0.1 * i for i in range(12)], step=0.01)
+    assert decisions[-1]['window_size'] == 5
+    assert decisions[-1]['cluster_size'] == 5
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from audio_source import ToneSource
+from cup_detector import CupDetector
+from detection_pipeline import DetectionPipeline, decided_results
+from session_log import SessionRecorder, load_session, replay_session
+
+HOP = 2048
+CHUNK_HOPS = 8
+
+
+def record_session(path, max_peaks=1):
+    """识别模式下录制一段会话（时间戳按帧移数换算，结果可重复）"""
+    options = {'hop_size': HOP, 'max_peaks': max_peaks}
+    pipeline = DetectionPipeline(**options)
+    detector = CupDetector(num_cups=3)
+    detector.location = [3000.0, 3400.0, 3800.0]
+    detector.location_stds = [2.0, 2.0, 2.0]
+    detector.cup_matcher.set_cups(detector.location, detector.location_stds)
+    source = ToneSource(frequencies=(3000.0, 3400.0, 3800.0), knock_interval=0.5,
+                        duration=30, seed=3)
+    recorder = SessionRecorder(str(path), source.sample_rate, pipeline.chunk_size, HOP,
+                               metadata={'pipeline': options}, chunk_hops=CHUNK_HOPS)
+    with recorder:
+        recorder.snapshot(detector)
+        recorder.event('detect')
+        pipeline.set_targets(*detector.targets())
+        hop = 0
+        while True:
+            samples = source.read(HOP)
+            if samples is None:
+                break
+            hop += 1
+            captured_at = hop * HOP / source.sample_rate
+            result = pipeline.process(samples)
+            recorder.record(samples, result, captured_at, 0.0)
+            for decided in decided_results(result):
+                recorder.match(captured_at, detector.match(decided['quality']))
+    return load_session(str(path))
+
+
+def drop_chunks(session, chunks):
+    """模拟写入队列满：丢弃若干整块的音频和逐帧记录（事件保留）"""
+    frames = session['frames']
+    keep = np.ones(len(frames), dtype=bool)
+    for chunk in chunks:
+        keep[chunk * CHUNK_HOPS:(chunk + 1) * CHUNK_HOPS] = False
+    ends = np.cumsum(frames['samples'])
+    starts = ends - frames['samples']
+    audio = np.concatenate([session['audio'][s:e] for s, e, k in zip(starts, ends, keep) if k])
+    lost = frames['hop'][~keep]
+    gapped = dict(session, frames=frames[keep], audio=audio)
+    gapped['gaps'] = [(int(lost[i]), int(lost[i + CHUNK_HOPS - 1]))
+                      for i in range(0, len(lost), CHUNK_HOPS)]
+    return gapped
+
+
+@pytest.mark.parametrize('max_peaks', [1, 3])
+def test_replay_without_gaps_is_consistent(tmp_path, max_peaks):
+    session = record_session(tmp_path / 'session.acsl', max_peaks)
+    assert session['gaps'] == []
+    report = replay_session(session)
+    assert report['consistent']
+    assert report['matches'] > 0 and report['match_mismatches'] == 0
+    assert report['resync_frames'] == 0
+
+
+@pytest.mark.parametrize('max_peaks', [1, 3])
+def test_replay_stays_deterministic_across_dropped_chunks(tmp_path, max_peaks):
+    session = drop_chunks(record_session(tmp_path / 'session.acsl', max_peaks), [3, 10, 11])
+    report = replay_session(session)
+    assert report['gaps'] == session['gaps'] == [(25, 32), (81, 88), (89, 96)]
+    assert 0 < report['resync_frames'] < report['hops']
+    assert report['lost_matches'] > 0
+    # 重新同步之后与录制完全一致
+    assert report['frame_mismatches'] == 0
+    assert report['match_mismatches'] == 0
+    assert report['consistent']
+    replayed = report['frames']
+    np.testing.assert_array_equal(replayed['hop'], session['frames']['hop'])
+
+
+def test_skip_hops_advances_decision_clock():
+    pipeline = DetectionPipeline(hop_size=HOP)
+    window = pipeline.skip_hops(10)
+    assert pipeline._hops == 10
+    assert pipeline.ring_buffer.filled == 0
+    # 重新填满一帧（2个帧移）+ 判决窗口2秒（12个帧移）
+    assert window == 2 + 12
+    assert pipeline.skip_hops(0) == 0
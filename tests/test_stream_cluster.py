@@ -0,0 +1,167 @@
+import numpy as np
+import pytest
+
+from stream_cluster import StreamingFrequencyClusterer, _SortedList
+
+EPS = 30
+MIN_SAMPLES = 3
+
+
+def batch_dbscan(values, eps=EPS, min_samples=MIN_SAMPLES):
+    """逐点O(n^2)的批量一维DBSCAN，作为参照"""
+    values = np.asarray(values, dtype=np.float64)
+    neighbors = np.abs(values[:, None] - values[None, :]) <= eps
+    core = neighbors.sum(axis=1) >= min_samples
+    labels = np.full(len(values), -1)
+    cluster = 0
+    for start in np.flatnonzero(core):
+        if labels[start] != -1:
+            continue
+        labels[start] = cluster
+        frontier = [start]
+        while frontier:
+            point = frontier.pop()
+            for neighbor in np.flatnonzero(neighbors[point]):
+                if labels[neighbor] == -1:
+                    labels[neighbor] = cluster
+                    if core[neighbor]:
+                        frontier.append(neighbor)
+        cluster += 1
+    return labels, core
+
+
+def random_frequencies(rng):
+    n = int(rng.integers(1, 60))
+    values = np.concatenate([
+        rng.normal(rng.uniform(2600, 4000), rng.uniform(1, 40), n),
+        rng.uniform(2500, 6000, rng.integers(0, 10))
+    ])
+    # 取整后常有重复值和恰好相距eps的点
+    values = np.round(values, int(rng.integers(0, 3)))
+    rng.shuffle(values)
+    return values
+
+
+def assert_same_clustering(values, streaming_labels, batch_labels, core):
+    """核心点的划分与噪声点必须一致；边界点可归入任一eps范围内有核心点的簇（与DBSCAN相同）"""
+    streaming_labels = np.asarray(streaming_labels)
+    np.testing.assert_array_equal(streaming_labels == -1, batch_labels == -1)
+    core_pairs = set(zip(streaming_labels[core].tolist(), batch_labels[core].tolist()))
+    assert len(core_pairs) == len({s for s, _ in core_pairs}) == len({b for _, b in core_pairs})
+    for i in np.flatnonzero(~core & (streaming_labels != -1)):
+        reachable = core & (np.abs(values - values[i]) <= EPS)
+        assert streaming_labels[i] in set(streaming_labels[reachable].tolist())
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_labels_match_batch_dbscan(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(200):
+        values = random_frequencies(rng)
+        clusterer = StreamingFrequencyClusterer(eps=EPS, min_samples=MIN_SAMPLES)
+        clusterer.extend(values)
+        batch_labels, core = batch_dbscan(values)
+        assert_same_clustering(values, clusterer.labels(), batch_labels, core)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_statistics_match_largest_batch_cluster(seed):
+    rng = np.random.default_rng(100 + seed)
+    for _ in range(200):
+        values = random_frequencies(rng)
+        result = StreamingFrequencyClusterer(eps=EPS, min_samples=MIN_SAMPLES).extend(values)
+        batch_labels, _ = batch_dbscan(values)
+        sizes = np.bincount(batch_labels[batch_labels >= 0])
+        if len(values) < MIN_SAMPLES or not len(sizes):
+            assert result is None
+            continue
+        assert result['cluster_size'] == sizes.max()
+        assert result['total_samples'] == len(values)
+        assert result['cluster_ratio'] == pytest.approx(sizes.max() / len(values))
+        # 最大簇并列时任取其一，统计量须与其中某一个一致
+        candidates = [values[batch_labels == label] for label in np.flatnonzero(sizes == sizes.max())]
+        assert any(result['mean_frequency'] == pytest.approx(members.mean())
+                   and result['std_deviation'] == pytest.approx(members.std(), abs=1e-9)
+                   for members in candidates)
+
+
+def test_incremental_results_match_refit():
+    """每加入一个样本的结果与对已有全部样本重新聚类一致"""
+    rng = np.random.default_rng(7)
+    values = np.concatenate([rng.normal(3000, 8, 40), rng.normal(3600, 5, 25), rng.uniform(2500, 6000, 10)])
+    rng.shuffle(values)
+    clusterer = StreamingFrequencyClusterer(eps=EPS, min_samples=MIN_SAMPLES)
+    for n, value in enumerate(values, 1):
+        result = clusterer.add(value)
+        batch_labels, _ = batch_dbscan(values[:n])
+        sizes = np.bincount(batch_labels[batch_labels >= 0])
+        if n < MIN_SAMPLES or not len(sizes):
+            assert result is None
+        else:
+            assert result['cluster_size'] == sizes.max()
+
+
+def test_matches_sklearn_dbscan():
+    cluster = pytest.importorskip('sklearn.cluster')
+    rng = np.random.default_rng(11)
+    for _ in range(200):
+        values = random_frequencies(rng)
+        clusterer = StreamingFrequencyClusterer(eps=EPS, min_samples=MIN_SAMPLES)
+        clusterer.extend(values)
+        model = cluster.DBSCAN(eps=EPS, min_samples=MIN_SAMPLES).fit(values.reshape(-1, 1))
+        core = np.zeros(len(values), dtype=bool)
+        core[model.core_sample_indices_] = True
+        assert_same_clustering(values, clusterer.labels(), model.labels_, core)
+
+
+def test_reset_clears_samples():
+    clusterer = StreamingFrequencyClusterer(eps=EPS, min_samples=MIN_SAMPLES)
+    clusterer.extend([3000, 3001, 3002])
+    assert clusterer.result()['cluster_size'] == 3
+    clusterer.reset()
+    assert len(clusterer) == 0
+    assert clusterer.result() is None
+    assert clusterer.labels() == []
+
+
+def test_sorted_list_matches_plain_sorted_list():
+    rng = np.random.default_rng(3)
+    items = _SortedList(load=8)
+    reference = []
+    for value in np.round(rng.uniform(0, 100, 2000), 1).tolist():
+        items.add(value)
+        reference.append(value)
+    for value in reference[::3]:
+        items.remove(value)
+    del reference[::3]
+    reference.sort()
+    assert list(items) == reference and len(items) == len(reference)
+    assert all(len(bucket) <= 16 for bucket in items._buckets)
+    for low in rng.uniform(-5, 105, 50).tolist():
+        high = low + 3
+        inside = [v for v in reference if low <= v <= high]
+        assert list(items.irange(low, high)) == inside
+        assert items.count(low, high, 3) == min(len(inside), 3)
+        below = [v for v in reference if v < low]
+        above = [v for v in reference if v > low]
+        assert items.before(low) == (below[-1] if below else None)
+        assert items.after(low) == (above[0] if above else None)
+
+
+def test_long_stream_keeps_insertions_bounded():
+    """样本一直增加（长时间运行）时，有序表的每个桶仍不超过2·load，插入只移动桶内元素"""
+    rng = np.random.default_rng(5)
+    values = np.concatenate([rng.normal(3000, 4, 40000), rng.normal(3600, 4, 10000)])
+    # 取整产生大量重复频率
+    values = np.round(values, 1)
+    rng.shuffle(values)
+    clusterer = StreamingFrequencyClusterer(eps=EPS, min_samples=MIN_SAMPLES)
+    result = clusterer.extend(values)
+    for items in (clusterer._values, clusterer._core, clusterer._noncore):
+        assert all(len(bucket) <= 2 * items._load for bucket in items._buckets)
+    assert len(clusterer._values._buckets) > 100
+    largest = values[np.abs(values - 3000) < 200]
+    assert result['cluster_size'] == len(largest)
+    assert result['total_samples'] == len(values)
+    assert result['mean_frequency'] == pytest.approx(largest.mean())
+    assert result['std_deviation'] == pytest.approx(largest.std())
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from deployment import validate
+from detection_pipeline import DetectionPipeline
+from targeted_detector import TargetedDetector
+
+RATE = 12000
+CHUNK = 4096
+CUPS = [2800.0, 3000.0, 3200.0, 3400.0]
+
+
+def knock(frequency, phase=0.0, noise=0.0, rng=None):
+    t = np.arange(CHUNK) / RATE
+    x = 8000 * np.exp(-8 * t) * np.sin(2 * np.pi * frequency * t + phase)
+    if noise:
+        x += rng.normal(0, noise, CHUNK)
+    return x
+
+
+def frequency_errors(detector, noise=0.0, count=100):
+    rng = np.random.default_rng(0)
+    errors = []
+    for frequency in rng.uniform(2960, 3040, count):
+        analysis = detector.analyze(knock(frequency, rng.uniform(0, 2 * np.pi), noise, rng))
+        assert analysis['cup_index'] == 1
+        errors.append(analysis['frequency'] - frequency)
+    return np.abs(errors)
+
+
+def test_zoom_factor_refines_frequency_grid():
+    coarse = TargetedDetector(CUPS, [60.0] * 4, zoom_factor=1)
+    fine = TargetedDetector(CUPS, [60.0] * 4)
+    assert coarse.resolution == pytest.approx(RATE / CHUNK)
+    assert fine.resolution == pytest.approx(RATE / CHUNK / 4)
+    # 细分后单音的频率误差比只用bin插值小一个数量级
+    assert np.median(frequency_errors(fine)) < 0.2 * np.median(frequency_errors(coarse))
+    assert frequency_errors(fine, noise=100.0).max() < 0.05
+
+
+def test_energies_are_comparable_with_full_fft():
+    detector = TargetedDetector(CUPS, [60.0] * 4)
+    x = knock(3001.3)
+    spectrum = np.abs(np.fft.rfft(x * np.hamming(CHUNK)))
+    analysis = detector.analyze(x)
+    # 3001.3 Hz约在两个bin之间：细分网格上的峰值找回了完整FFT最大bin的扇贝损失
+    # （汉明窗最多约1.42 dB）
+    assert spectrum.max() ** 2 * 1.2 < analysis['energies'][1] < spectrum.max() ** 2 * 1.4
+    assert analysis['energies'][0] < 1e-3 * analysis['energies'][1]
+
+
+def test_peak_stays_within_tolerance():
+    detector = TargetedDetector([3000.0], [10.0])
+    analysis = detector.analyze(knock(3030.0))
+    assert abs(analysis['frequency'] - 3000.0) <= 10.0 + detector.bin_spacing / 2
+
+
+def test_pipeline_and_deployment_pass_zoom_factor():
+    assert validate({})['zoom_factor'] == 4
+    with pytest.raises(ValueError):
+        validate({'zoom_factor': 0})
+    pipeline = DetectionPipeline(**validate({'zoom_factor': 8}))
+    pipeline.set_targets(CUPS, [60.0] * 4)
+    assert pipeline.targeted_detector.zoom_factor == 8
+    assert pipeline.targeted_detector.resolution == pytest.approx(RATE / CHUNK / 8)
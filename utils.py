@@ -1,3 +1,5 @@
+import bisect
+
 import numpy as np
 
 
@@ -80,4 +82,149 @@ def find_closest_cup_with_confidence(cup_frequencies, cup_stds, target_freq,
     if best_match['confidence'] < confidence_threshold:
         best_match['cup_index'] = -1
 
-    return best_match
\ No newline at end of file
+    return best_match
+
+
+class CupMatcher:
+    """
+    向量化的杯子匹配器，适用于成百上千个已学习对象
+
+    学习频率和标准差按频率排序存放在NumPy数组中，匹配时先用二分查找
+    取出最大动态容差范围内的候选，再向量化计算得分。
+    评分规则与find_closest_cup_with_confidence完全一致。
+    """
+
+    def __init__(self, cup_frequencies=(), cup_stds=(), base_tolerance=50,
+                 confidence_threshold=0.5, default_std=20):
+        """
+        Args:
+            cup_frequencies: 各杯子的学习频率列表（0表示未学习）
+            cup_stds: 各杯子的频率标准差列表
+            base_tolerance: 基础容差（Hz）
+            confidence_threshold: 最低置信度阈值
+            default_std: 标准差缺失或为0时使用的默认值
+        """
+        self.base_tolerance = base_tolerance
+        self.confidence_threshold = confidence_threshold
+        self.default_std = default_std
+        self.set_cups(cup_frequencies, cup_stds)
+
+    def set_cups(self, cup_frequencies, cup_stds):
+        """重建排序索引"""
+        freqs = np.asarray(cup_frequencies, dtype=np.float64).ravel()
+        stds = np.zeros(len(freqs))
+        given = np.asarray(cup_stds, dtype=np.float64).ravel()[:len(freqs)]
+        stds[:len(given)] = given
+        stds = np.where(stds > 0, stds, self.default_std)
+
+        learned = np.flatnonzero(freqs != 0)
+        order = learned[np.argsort(freqs[learned], kind='stable')]
+        self.num_cups = len(freqs)
+        self.cup_indices = order
+        self.freqs = freqs[order]
+        self.stds = stds[order]
+        # 动态容差：base_tolerance + 2倍标准差
+        self.tolerances = self.base_tolerance + 2 * self.stds
+        # 稳定性得分：标准差越小，得分越高
+        self.stability = 1 / (1 + self.stds / 50)
+        self.max_tolerance = float(self.tolerances.max()) if len(order) else 0.0
+        # 单个匹配使用的Python列表副本
+        self._freq_list = self.freqs.tolist()
+        self._tolerance_list = self.tolerances.tolist()
+        self._stability_list = self.stability.tolist()
+        self._cup_list = self.cup_indices.tolist()
+
+    def __len__(self):
+        return len(self.freqs)
+
+    def match(self, target_freq):
+        """
+        匹配单个频率
+
+        Returns:
+            dict: 包含杯子索引、置信度、频率差等信息，格式同find_closest_cup_with_confidence
+        """
+        best_match = {
+            'cup_index': -1,
+            'confidence': 0.0,
+            'frequency_diff': float('inf'),
+            'match_score': 0.0
+        }
+        # 单个频率时候选通常只有几个，二分查找后逐个计算比构造数组更快
+        freqs = self._freq_list
+        lo = bisect.bisect_left(freqs, target_freq - self.max_tolerance)
+        hi = bisect.bisect_right(freqs, target_freq + self.max_tolerance)
+        for j in range(lo, hi):
+            freq_diff = abs(freqs[j] - target_freq)
+            tolerance = self._tolerance_list[j]
+            if freq_diff > tolerance:
+                continue
+            match_score = 0.7 * (1 - freq_diff / tolerance) + 0.3 * self._stability_list[j]
+            cup = self._cup_list[j]
+            if (match_score > best_match['match_score']
+                    or (match_score == best_match['match_score'] and 0 <= cup < best_match['cup_index'])):
+                best_match = {
+                    'cup_index': cup,
+                    'confidence': match_score,
+                    'frequency_diff': freq_diff,
+                    'match_score': match_score
+                }
+
+        # 如果置信度低于阈值，返回未匹配
+        if best_match['confidence'] < self.confidence_threshold:
+            best_match['cup_index'] = -1
+        return best_match
+
+    def match_batch(self, target_freqs):
+        """
+        批量匹配
+
+        Args:
+            target_freqs: 待匹配的频率数组
+
+        Returns:
+            dict: 'cup_index'、'confidence'、'frequency_diff'、'match_score'，均为数组
+        """
+        targets = np.asarray(target_freqs, dtype=np.float64).ravel()
+        m = len(targets)
+        cup_index = np.full(m, -1, dtype=np.int64)
+        confidence = np.zeros(m)
+        frequency_diff = np.full(m, np.inf)
+        match_score = np.zeros(m)
+        if m == 0 or len(self.freqs) == 0:
+            return {'cup_index': cup_index, 'confidence': confidence,
+                    'frequency_diff': frequency_diff, 'match_score': match_score}
+
+        # 二分查找最大容差范围内的候选区间
+        lo = np.searchsorted(self.freqs, targets - self.max_tolerance, side='left')
+        hi = np.searchsorted(self.freqs, targets + self.max_tolerance, side='right')
+        width = int((hi - lo).max())
+        if width > 0:
+            offsets = np.arange(width)
+            idx = lo[:, None] + offsets[None, :]
+            in_window = idx < hi[:, None]
+            idx = np.where(in_window, idx, 0)
+
+            diff = np.abs(self.freqs[idx] - targets[:, None])
+            tolerance = self.tolerances[idx]
+            valid = in_window & (diff <= tolerance)
+            score = 0.7 * (1 - diff / tolerance) + 0.3 * self.stability[idx]
+            score = np.where(valid, score, -np.inf)
+
+            # 得分相同时取原始编号最小的杯子（与逐个遍历的结果一致）
+            best_score = score.max(axis=1)
+            tie_index = np.where(score == best_score[:, None], self.cup_indices[idx],
+                                 np.iinfo(np.int64).max)
+            best_col = np.argmin(tie_index, axis=1)
+            rows = np.arange(m)
+            found = np.isfinite(best_score) & (best_score > 0)
+
+            cup_index = np.where(found, self.cup_indices[idx[rows, best_col]], -1)
+            match_score = np.where(found, best_score, 0.0)
+            confidence = match_score.copy()
+            frequency_diff = np.where(found, diff[rows, best_col], np.inf)
+
+        # 置信度低于阈值时返回未匹配
+        cup_index = np.where(confidence < self.confidence_threshold, -1, cup_index)
+        return {'cup_index': cup_index, 'confidence': confidence,
+                'frequency_diff': frequency_diff, 'match_score': match_score}